@@ -1,40 +1,558 @@
-from flask import Flask, render_template, request, jsonify, send_file
+import time
+STARTUP_BEGIN = time.time()
+
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
-import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import hashlib
 from werkzeug.utils import secure_filename
-import time
+import atexit
+import threading
+import weakref
+import multiprocessing
 import pathlib
-pathlib.PosixPath = pathlib.WindowsPath
+from concurrent.futures import ThreadPoolExecutor
+if os.name == 'nt':
+    pathlib.PosixPath = pathlib.WindowsPath
 
 from config import Config
-from database import db, AnalysisRecord, BookDetection
-from models.analyzer import BookShelfAnalyzer
-from report_generator import ReportGenerator
+from database import (db, AnalysisRecord, BookDetection, ShelfResult, DailyStats,
+                      insert_detections, insert_shelves, delete_records, ensure_columns,
+                      ensure_indexes, migrate_shelf_results)
+from db_setup import WriteQueue, configure_sqlite, engine_options, sqlite_settings
+from job_queue import AnalysisJobQueue, QueueFullError, QueueUnavailableError
+from result_cache import AnalysisCache
+from exporter import ExportError, stream_export
+from report_cache import REPORT_EXTENSIONS, ReportCache
+from camera_stream import CameraStreamManager, SessionLimitError
+from image_store import FileReaper, ImageStore, ImageVariants, StorageSweeper, sweep_directory
+import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    Config.SQLALCHEMY_DATABASE_URI,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    busy_timeout=Config.DB_BUSY_TIMEOUT
+)
 CORS(app)
 
 db.init_app(app)
-with app.app_context():
-    db.create_all()
+
+# Рабочие процессы очереди анализов и пула отчетов (spawn) импортируют этот
+# модуль заново как __mp_main__: база, кэши и фоновые потоки нужны только
+# процессу сервера. При запуске python app.py (app.run с перезагрузчиком)
+# модуль выполняется и в наблюдающем процессе Werkzeug, который только
+# перезапускает дочерний процесс с WERKZEUG_RUN_MAIN=true
+_RELOADER_WATCHER = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+SERVER_PROCESS = multiprocessing.parent_process() is None and not _RELOADER_WATCHER
+
+def init_database():
+    """Настройка SQLite, создание таблиц и миграции (только в процессе сервера)"""
+    with app.app_context():
+        configure_sqlite(
+            db.engine,
+            journal_mode=Config.DB_JOURNAL_MODE,
+            synchronous=Config.DB_SYNCHRONOUS,
+            busy_timeout=Config.DB_BUSY_TIMEOUT,
+            cache_size_kb=Config.DB_CACHE_SIZE_KB
+        )
+        db.create_all()
+        for column_name in ensure_columns():
+            print(f"Добавлен столбец {column_name}")
+        for index_name in ensure_indexes():
+            print(f"Создан индекс {index_name}")
+        migrated = migrate_shelf_results()
+        if migrated:
+            print(f"Перенесены данные полок из JSON: {migrated} записей")
+        # Первый запуск с существующей историей: строим дневные агрегаты
+        if DailyStats.query.first() is None and AnalysisRecord.query.first() is not None:
+            print(f"Построение дневной статистики: {DailyStats.rebuild()} дней")
+            db.session.commit()
+
+if SERVER_PROCESS:
+    init_database()
 
 analyzer_config = {
     'confidence_threshold': 0.5,
     'processed_folder': Config.PROCESSED_FOLDER,
-    'yolo_model_path': 'yolo.pt'
+    'yolo_model_path': Config.MODEL_PATHS[Config.DETECTOR_MODEL],
+    'iou_threshold': Config.IOU_THRESHOLD,
+    'onnx_threads': Config.ONNX_THREADS,
+    'batch_size': Config.ANALYSIS_BATCH_SIZE,
+    'batch_imgsz': Config.ANALYSIS_BATCH_IMGSZ,
+    'tiled_inference': Config.TILED_INFERENCE,
+    'tile_size': Config.TILE_SIZE,
+    'tile_overlap': Config.TILE_OVERLAP,
+    'tile_min_side': Config.TILE_MIN_SIDE,
+    'tile_max_side': Config.TILE_MAX_SIDE,
+    'tile_merge_threshold': Config.TILE_MERGE_THRESHOLD,
+    'render': Config.VISUALIZATION_RENDER,
+    'shelf_segmenter': Config.SHELF_SEGMENTER
 }
-analyzer = BookShelfAnalyzer(analyzer_config)
-report_gen = ReportGenerator()
+
+db_writer = None
+if Config.DB_WRITE_QUEUE and SERVER_PROCESS:
+    db_writer = WriteQueue(app, db.session, max_batch=Config.DB_WRITE_BATCH,
+                           max_pending=Config.DB_WRITE_QUEUE_MAX)
+    db_writer.start()
+    atexit.register(db_writer.stop)
+
+# Анализатор и генератор отчетов создаются при первом обращении: импорт
+# torch/ultralytics и загрузка модели не задерживают запуск сервера
+_analyzer = None
+_report_gen = None
+_report_cache = None
+_camera_streams = None
+_analyzer_lock = threading.Lock()
+model_state = {'status': 'not_loaded', 'error': None, 'load_time': None}
+
+def get_analyzer():
+    """Возвращает анализатор, загружая модель при первом обращении"""
+    global _analyzer
+    if _analyzer is not None:
+        return _analyzer
+    
+    with _analyzer_lock:
+        if _analyzer is None:
+            model_state['status'] = 'loading'
+            load_start = time.time()
+            try:
+                from models.analyzer import BookShelfAnalyzer
+                _analyzer = BookShelfAnalyzer(analyzer_config)
+            except Exception as e:
+                model_state['status'] = 'error'
+                model_state['error'] = str(e)
+                raise
+            model_state['status'] = 'loaded'
+            model_state['error'] = None
+            model_state['load_time'] = round(time.time() - load_start, 3)
+            print(f"Модель загружена за {model_state['load_time']:.2f} секунд")
+    
+    return _analyzer
+
+def get_report_generator():
+    """Возвращает генератор отчетов (reportlab и pandas импортируются при первом вызове)"""
+    global _report_gen
+    if _report_gen is None:
+        from report_generator import ReportGenerator
+        _report_gen = ReportGenerator()
+    return _report_gen
+
+def get_report_cache():
+    """Возвращает кэш отчетов (пул рендеринга запускается при первом промахе)"""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache(
+            Config.REPORT_CACHE_DIR,
+            max_bytes=Config.REPORT_CACHE_MAX_BYTES,
+            workers=Config.REPORT_WORKERS,
+            thumb_dir=Config.REPORT_THUMBNAIL_DIR,
+            thumb_size=Config.REPORT_THUMBNAIL_SIZE
+        )
+        atexit.register(_report_cache.shutdown)
+    return _report_cache
+
+def _new_camera_tracker():
+    """Трекер книг для новой сессии камеры"""
+    from models.tracker import ShelfTracker
+    return ShelfTracker(
+        iou_threshold=Config.CAMERA_TRACK_IOU,
+        max_misses=Config.CAMERA_TRACK_MAX_MISSES,
+        stable_ratio=Config.CAMERA_TRACK_STABLE_RATIO,
+        max_reuse=Config.CAMERA_TRACK_MAX_REUSE,
+        smoothing=Config.CAMERA_SMOOTHING
+    )
+
+def get_camera_streams():
+    """Менеджер сессий потокового анализа камеры (создается при первом обращении)"""
+    global _camera_streams
+    if _camera_streams is None:
+        _camera_streams = CameraStreamManager(
+            lambda data, tracker: get_analyzer().analyze_frame(
+                data, Config.CAMERA_STREAM_MAX_SIDE, tracker=tracker
+            ),
+            max_sessions=Config.CAMERA_STREAM_MAX_SESSIONS,
+            session_ttl=Config.CAMERA_STREAM_SESSION_TTL,
+            heartbeat=Config.CAMERA_STREAM_HEARTBEAT,
+            state_factory=_new_camera_tracker if Config.CAMERA_TRACKING else None
+        )
+        atexit.register(_camera_streams.shutdown)
+    return _camera_streams
+
+def _warm_up_model():
+    """Фоновая загрузка модели после старта сервера"""
+    try:
+        get_analyzer()
+    except Exception as e:
+        print(f"Ошибка фоновой загрузки модели: {e}")
+
+# Рабочие процессы очереди держат собственную модель
+if SERVER_PROCESS:
+    if Config.MODEL_LOADING == 'eager':
+        get_analyzer()
+    elif Config.MODEL_LOADING == 'background':
+        threading.Thread(target=_warm_up_model, name='model-warmup', daemon=True).start()
+
+result_cache = None
+if Config.RESULT_CACHE_ENABLED and SERVER_PROCESS:
+    result_cache = AnalysisCache(
+        Config.RESULT_CACHE_PATH,
+        memory_items=Config.RESULT_CACHE_MEMORY_ITEMS,
+        max_items=Config.RESULT_CACHE_MAX_ITEMS,
+        max_bytes=Config.RESULT_CACHE_MAX_BYTES
+    )
 
 def allowed_file(filename):
     """Проверяет допустимость расширения файла"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+def get_cached_results(cache_key):
+    """Возвращает результаты из кэша, если визуализация еще существует"""
+    if result_cache is None or cache_key is None:
+        return None
+    
+    lookup_start = time.time()
+    results = result_cache.get(cache_key)
+    if results is None:
+        return None
+    
+    # Без визуализации (отложенный рендеринг) результат пригоден всегда
+    visualization_path = results.get('visualization_path')
+    if visualization_path and not os.path.exists(visualization_path):
+        result_cache.invalidate(cache_key)
+        return None
+    
+    results['cached'] = True
+    # processing_time остается временем исходного анализа: оно попадает в
+    # запись и дневную статистику. Стадии исходного анализа к этой записи
+    # не относятся, время поиска в кэше - только в timings
+    results['timings'] = {'cache_lookup': round(time.time() - lookup_start, 4)}
+    return results
+
+def make_cache_key(image_bytes):
+    """Ключ кэша для содержимого изображения"""
+    if result_cache is None:
+        return None
+    return result_cache.make_key(image_bytes, analyzer_config['yolo_model_path'], analyzer_config)
+
+def store_cached_results(cache_key, results):
+    """Сохраняет успешный результат анализа в кэш"""
+    if result_cache is None or cache_key is None or not results.get('success'):
+        return
+    try:
+        result_cache.put(cache_key, results)
+    except Exception as e:
+        print(f"Ошибка записи в кэш результатов: {e}")
+
+def insert_analysis(filename, original_path, results):
+    """Добавляет запись анализа, детекции и полки в текущую транзакцию; возвращает id записи.
+    
+    Время записи (без фиксации транзакции) добавляется в timings как
+    'db_write' и сохраняется вместе с остальными стадиями.
+    """
+    write_start = time.time()
+    record = AnalysisRecord(
+        filename=filename,
+        original_path=original_path,
+        processed_path=results['visualization_path'],
+        total_books=results['statistics']['total_books'],
+        shelf_count=results['statistics']['shelf_count'],
+        fill_percentages=json.dumps(results['statistics']['fill_percentages']),
+        average_fill=results['statistics']['average_fill'],
+        processing_time=results['processing_time'],
+        image_width=results['image_dimensions']['width'],
+        image_height=results['image_dimensions']['height'],
+        processed_width=results.get('processed_dimensions', {}).get('width'),
+        processed_height=results.get('processed_dimensions', {}).get('height')
+    )
+    
+    db.session.add(record)
+    db.session.flush()
+    insert_detections(record.id, results['books'])
+    insert_shelves(record.id, results['shelves'], results['statistics']['fill_percentages'])
+    DailyStats.add_record(record, results['statistics']['fill_percentages'])
+    timings = results.setdefault('timings', {})
+    timings['db_write'] = round(time.time() - write_start, 4)
+    record.stage_timings = json.dumps(timings)
+    return record.id
+
+def save_analysis(filename, original_path, results):
+    """Сохраняет результаты анализа и детекции в базу данных одной транзакцией"""
+    if db_writer is not None:
+        # Вставки из всех потоков выполняет один поток-писатель
+        record_id = db_writer.submit(insert_analysis, filename, original_path, results).result()
+    else:
+        try:
+            record_id = insert_analysis(filename, original_path, results)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    record = db.session.get(AnalysisRecord, record_id)
+    
+    metrics.observe_analysis(results)
+    schedule_variants(record)
+    return record
+
+def processed_image_url(record):
+    """URL визуализации записи; без готового файла - адрес отложенного рендеринга"""
+    if record.processed_path:
+        return record.processed_path.replace(
+            Config.PROCESSED_FOLDER,
+            '/static/uploads/processed'
+        )
+    return f'/api/visualization/{record.id}'
+
+# Блокировки рендеринга по записям: визуализации разных записей рисуются параллельно
+_render_locks = weakref.WeakValueDictionary()
+_render_locks_guard = threading.Lock()
+
+def _record_render_lock(record_id):
+    with _render_locks_guard:
+        lock = _render_locks.get(record_id)
+        if lock is None:
+            lock = _render_locks[record_id] = threading.Lock()
+        return lock
+
+def visualization_inputs(records):
+    """Аргументы render_visualization по сохраненным детекциям: {id записи: kwargs}"""
+    from models.analyzer import books_from_rows
+    
+    rows = {record.id: [] for record in records}
+    for chunk_start in range(0, len(records), 500):
+        chunk = [record.id for record in records[chunk_start:chunk_start + 500]]
+        for row in db.session.query(
+            BookDetection.analysis_id, BookDetection.x_min, BookDetection.y_min, BookDetection.x_max,
+            BookDetection.y_max, BookDetection.confidence, BookDetection.shelf_number
+        ).filter(BookDetection.analysis_id.in_(chunk)).order_by(BookDetection.id):
+            rows[row[0]].append(tuple(row[1:]))
+    
+    inputs = {}
+    for record in records:
+        books = books_from_rows(rows[record.id])
+        # Записи до появления processed_* обрабатывались с уменьшением до 1024 px
+        width = record.processed_width or 0
+        height = record.processed_height or 0
+        image_area = width * height
+        
+        # После вытеснения оригинала рисуем по превью в размере обработки;
+        # запись без снимка пропускается
+        source_path = image_store.resolve(record.original_path)
+        if source_path is None:
+            continue
+        inputs[record.id] = {
+            'original_path': source_path,
+            'books': books,
+            'shelves': [shelf.to_dict() for shelf in record.shelves if shelf.y1 is not None],
+            'statistics': {
+                'total_books': record.total_books,
+                'shelf_count': record.shelf_count,
+                'average_fill': record.average_fill,
+                'fill_percentages': record.fill_percentages_list,
+                'density_percentage': round(int(books['area'].sum()) / image_area * 100, 2)
+                if image_area else 0
+            },
+            'max_size': max(width, height) or 1024,
+            'size': (width, height) if width and height else None
+        }
+    return inputs
+
+def ensure_visualization(record):
+    """Возвращает путь к визуализации записи, при необходимости рисуя ее по сохраненным детекциям"""
+    if record.processed_path and os.path.exists(record.processed_path):
+        return record.processed_path
+    
+    from models.analyzer import render_visualization
+    
+    with _record_render_lock(record.id):
+        db.session.refresh(record)
+        if record.processed_path and os.path.exists(record.processed_path):
+            return record.processed_path
+        
+        inputs = visualization_inputs([record]).get(record.id)
+        if inputs is None:
+            raise FileNotFoundError(f"Исходное изображение записи {record.id} не найдено")
+        record.processed_path = render_visualization(processed_folder=Config.PROCESSED_FOLDER, **inputs)
+        db.session.commit()
+        print(f"Визуализация записи {record.id} построена по запросу: {record.processed_path}")
+        return record.processed_path
+
+def build_upload_response(record, results, render=None):
+    """Формирует ответ API по сохраненной записи анализа"""
+    return {
+        'success': True,
+        'record_id': record.id,
+        'original_image': original_image_url(record.original_path),
+        'processed_image': None if render == 'none' else processed_image_url(record),
+        'cached': results.get('cached', False),
+        'results': {
+            'total_books': results['statistics']['total_books'],
+            'shelf_count': results['statistics']['shelf_count'],
+            'fill_percentages': results['statistics']['fill_percentages'],
+            'average_fill': results['statistics']['average_fill'],
+            'density_percentage': results['statistics']['density_percentage'],
+            'shelf_type': results['shelf_type']['type'],
+            'processing_time': results['processing_time'],
+            'timings': results.get('timings', {})
+        }
+    }
+
+def _complete_job(job, results):
+    """Сохраняет результат фонового задания (вызывается из потока очереди)"""
+    store_cached_results(job['meta'].get('cache_key'), results)
+    with app.app_context():
+        record = save_analysis(job['filename'], job['image_path'], results)
+        return build_upload_response(record, results, job['render'])
+
+job_queue = None
+if Config.ASYNC_ANALYSIS and SERVER_PROCESS:
+    job_queue = AnalysisJobQueue(
+        analyzer_config,
+        workers=Config.ANALYSIS_WORKERS,
+        max_pending=Config.ANALYSIS_QUEUE_MAX_PENDING,
+        history_limit=Config.ANALYSIS_JOB_HISTORY,
+        on_complete=_complete_job,
+        job_timeout=Config.ANALYSIS_JOB_TIMEOUT,
+        max_start_failures=Config.ANALYSIS_WORKER_MAX_START_FAILURES,
+        max_restart_delay=Config.ANALYSIS_WORKER_MAX_RESTART_DELAY
+    )
+    atexit.register(job_queue.stop)
+
+image_store = ImageStore(
+    Config.ORIGINAL_FOLDER,
+    max_bytes=Config.IMAGE_STORE_MAX_BYTES,
+    retention_days=Config.IMAGE_RETENTION_DAYS,
+    preview_max_side=Config.IMAGE_PREVIEW_MAX_SIDE
+)
+
+image_variants = ImageVariants(
+    Config.IMAGE_VARIANT_DIR,
+    Config.IMAGE_VARIANT_WIDTHS,
+    quality=Config.IMAGE_VARIANT_QUALITY
+)
+# Копии для истории готовятся в одном фоновом потоке, не задерживая ответ
+_variant_executor = None
+if SERVER_PROCESS:
+    _variant_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+    atexit.register(_variant_executor.shutdown, wait=False, cancel_futures=True)
+
+def schedule_variants(record):
+    """Ставит в очередь подготовку копий снимка и готовой визуализации записи"""
+    paths = [path for path in (record.original_path, record.processed_path) if path]
+    if paths and Config.IMAGE_VARIANT_PRECOMPUTE:
+        _variant_executor.submit(image_variants.precompute, paths, Config.IMAGE_VARIANT_PRECOMPUTE)
+
+def original_image_url(path):
+    """Статический URL снимка; после вытеснения оригинала - URL его превью"""
+    path = image_store.resolve(path) or path
+    return path.replace(Config.ORIGINAL_FOLDER, '/static/uploads/original').replace(os.sep, '/')
+
+def run_storage_sweep():
+    """Проход политики хранения: оригиналы и превью, затем визуализации"""
+    with app.app_context():
+        referenced = {
+            os.path.normpath(path)
+            for (path,) in db.session.query(AnalysisRecord.original_path).distinct() if path
+        }
+        report = image_store.sweep(
+            referenced,
+            batch=Config.STORAGE_SWEEP_BATCH,
+            pause=Config.STORAGE_SWEEP_PAUSE,
+            orphan_grace=Config.STORAGE_ORPHAN_GRACE,
+            is_referenced=referenced_paths
+        )
+        
+        rendered = {
+            os.path.normpath(path)
+            for (path,) in db.session.query(AnalysisRecord.processed_path).distinct() if path
+        }
+        removed = sweep_directory(
+            Config.PROCESSED_FOLDER, rendered,
+            max_age=Config.PROCESSED_RETENTION_DAYS * 86400,
+            orphan_grace=Config.STORAGE_ORPHAN_GRACE,
+            batch=Config.STORAGE_SWEEP_BATCH,
+            pause=Config.STORAGE_SWEEP_PAUSE
+        )
+        # Записи без файла визуализации перерисуются по запросу
+        stale = [path for path in removed if path in rendered]
+        for start in range(0, len(stale), 500):
+            AnalysisRecord.query.filter(
+                AnalysisRecord.processed_path.in_(stale[start:start + 500])
+            ).update({'processed_path': None}, synchronize_session=False)
+        db.session.commit()
+        report['visualizations_removed'] = len(removed)
+    
+    variants = image_variants.sweep(
+        Config.IMAGE_VARIANT_RETENTION_DAYS * 86400,
+        batch=Config.STORAGE_SWEEP_BATCH,
+        pause=Config.STORAGE_SWEEP_PAUSE
+    )
+    report['variants_removed'] = len(variants)
+    
+    if report['evicted'] or report['orphans_removed'] or removed:
+        print(f"Очистка хранилища: оригиналов заменено превью {report['evicted']}, "
+              f"удалено без записей {report['orphans_removed']}, визуализаций {len(removed)}, "
+              f"освобождено {report['freed_bytes'] / 2 ** 20:.1f} МБ")
+    return report
+
+def referenced_paths(paths):
+    """Пути из paths, которые еще указаны в записях истории"""
+    referenced = set()
+    with app.app_context():
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            for original, processed in db.session.query(
+                AnalysisRecord.original_path, AnalysisRecord.processed_path
+            ).filter(db.or_(AnalysisRecord.original_path.in_(chunk),
+                            AnalysisRecord.processed_path.in_(chunk))):
+                referenced.update((original, processed))
+    return referenced
+
+def remove_record_files(paths):
+    """Удаляет снимки (с превью), визуализации и их уменьшенные копии, если записи на них не ссылаются"""
+    removed = image_store.discard_unreferenced(paths, referenced_paths)
+    # После вытеснения оригинала копии для истории строились по превью
+    image_variants.discard(removed + [image_store.preview_path(path) for path in removed])
+    return removed
+
+file_reaper = FileReaper(
+    remove_record_files,
+    batch=Config.FILE_REAPER_BATCH,
+    pause=Config.FILE_REAPER_PAUSE
+)
+
+def move_to_trash(folder):
+    """Мгновенно освобождает каталог: переносит его в корзину и удаляет в фоне"""
+    os.makedirs(Config.TRASH_FOLDER, exist_ok=True)
+    target = os.path.join(Config.TRASH_FOLDER, f'{os.path.basename(folder)}-{time.time_ns()}')
+    try:
+        os.rename(folder, target)
+    except FileNotFoundError:
+        pass
+    else:
+        file_reaper.remove_tree(target)
+    os.makedirs(folder, exist_ok=True)
+
+if SERVER_PROCESS:
+    file_reaper.start()
+    atexit.register(file_reaper.stop)
+    # Корзина, не дочищенная до остановки сервера
+    if os.path.isdir(Config.TRASH_FOLDER):
+        for name in os.listdir(Config.TRASH_FOLDER):
+            file_reaper.remove_tree(os.path.join(Config.TRASH_FOLDER, name))
+
+storage_sweeper = None
+if Config.STORAGE_SWEEP_INTERVAL > 0 and SERVER_PROCESS:
+    storage_sweeper = StorageSweeper(run_storage_sweep, Config.STORAGE_SWEEP_INTERVAL)
+    storage_sweeper.start()
+    atexit.register(storage_sweeper.stop)
+
 @app.route('/')
 def index():
     """Возвращает главную страницу"""
@@ -67,72 +585,149 @@ def upload_image():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Неподдерживаемый формат файла'})
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        saved_filename = f"{timestamp}_{unique_id}_{secure_filename(file.filename)}"
-        original_path = os.path.join(Config.ORIGINAL_FOLDER, saved_filename)
+        render = request.values.get('render', Config.VISUALIZATION_RENDER)
+        if render not in Config.RENDER_MODES:
+            return jsonify({'success': False, 'error': f'Неизвестный режим визуализации: {render}'})
         
-        file.save(original_path)
+        # Тот же снимок хранится в одном экземпляре (имя - хэш содержимого)
+        image_bytes = file.read()
+        original_path = image_store.put(image_bytes, file.filename.rsplit('.', 1)[1])
         
         if not os.path.exists(original_path):
             return jsonify({'success': False, 'error': 'Ошибка сохранения файла'})
         
-        results = analyzer.analyze_image(original_path)
+        # Повторная загрузка того же изображения берется из кэша
+        cache_key = make_cache_key(image_bytes)
+        results = get_cached_results(cache_key)
+        if results is not None:
+            record = save_analysis(secure_filename(file.filename), original_path, results)
+            return jsonify(build_upload_response(record, results, render))
+        
+        if job_queue is not None:
+            try:
+                job_id = job_queue.submit(
+                    original_path,
+                    filename=secure_filename(file.filename),
+                    meta={'cache_key': cache_key},
+                    render=render
+                )
+            except (QueueFullError, QueueUnavailableError) as e:
+                response = jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'queue': job_queue.stats()
+                })
+                response.status_code = 503
+                # Незапускающиеся процессы перезапускаются не чаще раза в минуту
+                response.headers['Retry-After'] = (
+                    '5' if isinstance(e, QueueFullError) else str(Config.ANALYSIS_WORKER_MAX_RESTART_DELAY)
+                )
+                return response
+            
+            response = jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}',
+                'original_image': original_image_url(original_path)
+            })
+            response.status_code = 202
+            return response
+        
+        results = get_analyzer().analyze_image(original_path, image_bytes=image_bytes, render=render)
         
         if not results['success']:
             return jsonify({'success': False, 'error': results.get('error', 'Ошибка анализа')})
         
-        record = AnalysisRecord(
-            filename=secure_filename(file.filename),
-            original_path=original_path,
-            processed_path=results['visualization_path'],
-            total_books=results['statistics']['total_books'],
-            shelf_count=results['statistics']['shelf_count'],
-            fill_percentages=json.dumps(results['statistics']['fill_percentages']),
-            average_fill=results['statistics']['average_fill'],
-            processing_time=results['processing_time'],
-            image_width=results['image_dimensions']['width'],
-            image_height=results['image_dimensions']['height']
-        )
+        store_cached_results(cache_key, results)
+        record = save_analysis(secure_filename(file.filename), original_path, results)
+        response_data = build_upload_response(record, results, render)
         
-        db.session.add(record)
-        db.session.commit()
+        return jsonify(response_data)
         
-        for book in results['books']:
-            detection = BookDetection(
-                analysis_id=record.id,
-                x_min=book['bbox'][0],
-                y_min=book['bbox'][1],
-                x_max=book['bbox'][2],
-                y_max=book['bbox'][3],
-                width=book['width'],
-                height=book['height'],
-                confidence=book['confidence']
-            )
-            db.session.add(detection)
+    except Exception as e:
+        return jsonify({
+            'success': False, 
+            'error': f'Внутренняя ошибка сервера: {str(e)}'
+        })
+
+@app.route('/api/upload_batch', methods=['POST'])
+def upload_batch():
+    """Обрабатывает пакетную загрузку и анализ нескольких изображений"""
+    start_time = time.time()
+    
+    try:
+        files = [f for f in request.files.getlist('images') if f.filename]
         
-        db.session.commit()
+        if not files:
+            return jsonify({'success': False, 'error': 'Нет файлов в запросе'})
         
-        response_data = {
-            'success': True,
-            'record_id': record.id,
-            'original_image': f"/static/uploads/original/{saved_filename}",
-            'processed_image': results['visualization_path'].replace(
-                Config.PROCESSED_FOLDER, 
-                '/static/uploads/processed'
-            ),
-            'results': {
-                'total_books': results['statistics']['total_books'],
-                'shelf_count': results['statistics']['shelf_count'],
-                'fill_percentages': results['statistics']['fill_percentages'],
-                'average_fill': results['statistics']['average_fill'],
-                'density_percentage': results['statistics']['density_percentage'],
-                'shelf_type': results['shelf_type']['type'],
-                'processing_time': results['processing_time']
-            }
-        }
+        if len(files) > Config.BATCH_MAX_FILES:
+            return jsonify({
+                'success': False,
+                'error': f'Слишком много файлов (максимум {Config.BATCH_MAX_FILES})'
+            })
         
-        return jsonify(response_data)
+        render = request.values.get('render', Config.VISUALIZATION_RENDER)
+        if render not in Config.RENDER_MODES:
+            return jsonify({'success': False, 'error': f'Неизвестный режим визуализации: {render}'})
+        
+        items = []
+        rejected = []
+        
+        for file in files:
+            if not allowed_file(file.filename):
+                rejected.append({
+                    'success': False,
+                    'filename': file.filename,
+                    'error': 'Неподдерживаемый формат файла'
+                })
+                continue
+            
+            image_bytes = file.read()
+            original_path = image_store.put(image_bytes, file.filename.rsplit('.', 1)[1])
+            
+            cache_key = make_cache_key(image_bytes)
+            cached = get_cached_results(cache_key)
+            items.append((secure_filename(file.filename), original_path, cache_key, cached,
+                          image_bytes if cached is None else None))
+        
+        # В детектор отправляются только изображения, которых нет в кэше;
+        # они декодируются из уже прочитанных байтов
+        to_analyze = [item for item in items if item[3] is None]
+        analyzed = get_analyzer().analyze_batch(
+            [item[1] for item in to_analyze], [item[4] for item in to_analyze], render=render
+        ) if to_analyze else []
+        for item, results in zip(to_analyze, analyzed):
+            store_cached_results(item[2], results)
+        analyzed = iter(analyzed)
+        
+        responses = []
+        for filename, original_path, _, cached, _ in items:
+            results = cached if cached is not None else next(analyzed)
+            if not results['success']:
+                responses.append({
+                    'success': False,
+                    'filename': filename,
+                    'error': results.get('error', 'Ошибка анализа')
+                })
+                continue
+            
+            record = save_analysis(filename, original_path, results)
+            response_data = build_upload_response(record, results, render)
+            response_data['filename'] = filename
+            responses.append(response_data)
+        
+        responses.extend(rejected)
+        processed = sum(1 for r in responses if r['success'])
+        
+        return jsonify({
+            'success': processed > 0,
+            'processed': processed,
+            'failed': len(responses) - processed,
+            'results': responses,
+            'processing_time': time.time() - start_time
+        })
         
     except Exception as e:
         return jsonify({
@@ -140,6 +735,121 @@ def upload_image():
             'error': f'Внутренняя ошибка сервера: {str(e)}'
         })
 
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Возвращает состояние и результат фонового анализа"""
+    if job_queue is None:
+        return jsonify({'success': False, 'error': 'Очередь анализов отключена'}), 404
+    
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задание не найдено'}), 404
+    
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs')
+def get_jobs_stats():
+    """Возвращает глубину очереди и лимиты"""
+    if job_queue is None:
+        return jsonify({'success': True, 'queue': {'enabled': False}})
+    
+    return jsonify({'success': True, 'queue': job_queue.stats()})
+
+@app.route('/api/cache')
+def get_cache_stats():
+    """Возвращает счетчики кэша результатов"""
+    if result_cache is None:
+        return jsonify({'success': True, 'cache': {'enabled': False}})
+    
+    return jsonify({'success': True, 'cache': result_cache.stats()})
+
+def _collect_component_metrics():
+    """Глубина очереди, счетчики кэшей и сессии камеры для /metrics"""
+    families = []
+    if job_queue is not None:
+        queue = job_queue.stats()
+        families += [
+            ('bookshelf_queue_depth', 'gauge', 'Задания в очереди анализа',
+             {(('state', 'queued'),): queue['queued'], (('state', 'running'),): queue['running']}),
+            ('bookshelf_queue_workers_alive', 'gauge', 'Живые рабочие процессы очереди',
+             {(): queue['workers_alive']}),
+            ('bookshelf_queue_jobs_total', 'counter', 'Задания очереди по итогу',
+             {(('result', name),): queue[name] for name in ('completed', 'failed', 'rejected')})
+        ]
+    
+    caches = [('result', result_cache.stats())] if result_cache is not None else []
+    if _report_cache is not None:
+        caches.append(('report', _report_cache.stats()))
+    if caches:
+        families += [
+            ('bookshelf_cache_hits_total', 'counter', 'Попадания в кэш',
+             {(('cache', name),): stats['hits'] for name, stats in caches}),
+            ('bookshelf_cache_misses_total', 'counter', 'Промахи кэша',
+             {(('cache', name),): stats['misses'] for name, stats in caches}),
+            ('bookshelf_cache_hit_ratio', 'gauge', 'Доля попаданий в кэш с запуска',
+             {(('cache', name),): stats['hit_rate'] for name, stats in caches})
+        ]
+    
+    if _camera_streams is not None:
+        sessions = _camera_streams.stats()['sessions']
+        families += [
+            ('bookshelf_camera_sessions', 'gauge', 'Открытые сессии потокового анализа камеры',
+             {(): len(sessions)}),
+            ('bookshelf_camera_frames_dropped', 'gauge', 'Отброшенные кадры открытых сессий',
+             {(): sum(session['dropped'] for session in sessions)})
+        ]
+    
+    if db_writer is not None:
+        writer = db_writer.stats()
+        families += [
+            ('bookshelf_db_write_queue_depth', 'gauge', 'Вставки в очереди потока-писателя',
+             {(): writer['pending']}),
+            ('bookshelf_db_writes_total', 'counter', 'Вставки потока-писателя по итогу',
+             {(('result', 'committed'),): writer['committed'], (('result', 'failed'),): writer['failed']}),
+            ('bookshelf_db_write_batches_total', 'counter', 'Транзакции потока-писателя',
+             {(): writer['batches']})
+        ]
+    
+    reaper = file_reaper.stats()
+    families += [
+        ('bookshelf_file_reaper_pending', 'gauge', 'Файлы и каталоги в очереди на удаление',
+         {(): reaper['pending']}),
+        ('bookshelf_file_reaper_removed_total', 'counter', 'Файлы, удаленные в фоне',
+         {(): reaper['removed']})
+    ]
+    
+    families.append(('bookshelf_model_loaded', 'gauge', 'Модель детектора загружена',
+                     {(): 1 if model_state['status'] == 'loaded' else 0}))
+    return families
+
+metrics.registry.register_collector(_collect_component_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/storage')
+def get_storage_stats():
+    """Возвращает объем хранилища снимков и итог последней очистки"""
+    try:
+        return jsonify({
+            'success': True,
+            'storage': image_store.stats(),
+            'variants': image_variants.stats(),
+            'reaper': file_reaper.stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/storage/sweep', methods=['POST'])
+def sweep_storage():
+    """Запускает проход политики хранения немедленно"""
+    try:
+        return jsonify({'success': True, 'sweep': run_storage_sweep()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/analyze_camera', methods=['POST'])
 def analyze_camera():
     """Анализирует изображение с камеры"""
@@ -148,15 +858,24 @@ def analyze_camera():
             return jsonify({'success': False, 'error': 'Нет изображения от камеры'})
         
         file = request.files['image']
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f"camera_{timestamp}.jpg"
-        filepath = os.path.join(Config.ORIGINAL_FOLDER, filename)
-        file.save(filepath)
         
-        results = analyzer.analyze_image(filepath)
+        # Запись в историю не создается, поэтому рисовать потом не из чего:
+        # 'lazy' здесь равносилен 'none'
+        render = request.values.get('render', Config.CAMERA_RENDER)
+        if render not in Config.RENDER_MODES:
+            return jsonify({'success': False, 'error': f'Неизвестный режим визуализации: {render}'})
+        
+        # Снимок без записи в истории удалит фоновая очистка хранилища
+        image_bytes = file.read()
+        filepath = image_store.put(image_bytes, 'jpg')
+        
+        results = get_analyzer().analyze_image(
+            filepath, image_bytes=image_bytes, render='eager' if render == 'eager' else 'none'
+        )
         
         if not results['success']:
             return jsonify({'success': False, 'error': results['error']})
+        metrics.observe_analysis(results)
         
         response = {
             'success': True,
@@ -169,7 +888,7 @@ def analyze_camera():
             'processed_image': results['visualization_path'].replace(
                 Config.PROCESSED_FOLDER,
                 '/static/uploads/processed'
-            )
+            ) if results['visualization_path'] else None
         }
         
         return jsonify(response)
@@ -177,41 +896,212 @@ def analyze_camera():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/camera/sessions', methods=['POST'])
+def create_camera_session():
+    """Открывает сессию потокового анализа камеры"""
+    try:
+        session = get_camera_streams().create()
+    except SessionLimitError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(Config.CAMERA_STREAM_SESSION_TTL)
+        return response
+    
+    return jsonify({
+        'success': True,
+        'session_id': session.id,
+        'frames_url': f'/api/camera/sessions/{session.id}/frames',
+        'events_url': f'/api/camera/sessions/{session.id}/events'
+    }), 201
+
+@app.route('/api/camera/sessions', methods=['GET'])
+def get_camera_sessions():
+    """Возвращает счетчики сессий камеры"""
+    return jsonify({'success': True, 'camera': get_camera_streams().stats()})
+
+@app.route('/api/camera/sessions/<session_id>/frames', methods=['POST'])
+def push_camera_frame(session_id):
+    """Принимает кадр (JPEG в теле запроса или поле frame); ответ не ждет анализа"""
+    session = get_camera_streams().get(session_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Сессия не найдена'}), 404
+    
+    if request.content_length and request.content_length > Config.CAMERA_STREAM_MAX_FRAME_BYTES:
+        return jsonify({'success': False, 'error': 'Слишком большой кадр'}), 413
+    
+    frame = request.files.get('frame')
+    data = frame.read() if frame else request.get_data(cache=False)
+    if not data:
+        return jsonify({'success': False, 'error': 'Пустой кадр'}), 400
+    
+    try:
+        seq = session.push(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    return jsonify({'success': True, 'seq': seq, 'dropped': session.dropped}), 202
+
+@app.route('/api/camera/sessions/<session_id>/events')
+def camera_session_events(session_id):
+    """Поток результатов анализа кадров (text/event-stream)"""
+    streams = get_camera_streams()
+    session = streams.get(session_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Сессия не найдена'}), 404
+    
+    return Response(
+        streams.iter_events(session),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/camera/sessions/<session_id>', methods=['DELETE'])
+def close_camera_session(session_id):
+    """Закрывает сессию камеры"""
+    if not get_camera_streams().close(session_id):
+        return jsonify({'success': False, 'error': 'Сессия не найдена'}), 404
+    return jsonify({'success': True})
+
+def image_version(record):
+    """Версия изображений записи для URL /api/image.
+    
+    id записей в SQLite переиспользуются (после clear_all и удаления последних
+    записей), поэтому версия строится из времени анализа и снимка.
+    """
+    source = f"{record.timestamp.isoformat() if record.timestamp else ''}|{record.original_path}"
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+def history_record_dict(record):
+    """Запись истории с URL изображений"""
+    record_dict = record.to_dict()
+    record_dict['image_version'] = image_version(record)
+    record_dict['original_image_url'] = original_image_url(record.original_path)
+    record_dict['processed_image_url'] = processed_image_url(record)
+    return record_dict
+
 @app.route('/api/history')
 def get_history():
     """Возвращает историю анализов"""
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        records = AnalysisRecord.query\
-            .order_by(AnalysisRecord.timestamp.desc())\
-            .paginate(page=page, per_page=per_page, error_out=False)
-        
-        history_data = []
-        for record in records.items:
-            record_dict = record.to_dict()
-            record_dict['original_image_url'] = record.original_path.replace(
-                Config.ORIGINAL_FOLDER,
-                '/static/uploads/original'
-            )
-            record_dict['processed_image_url'] = record.processed_path.replace(
-                Config.PROCESSED_FOLDER,
-                '/static/uploads/processed'
+        per_page = min(max(request.args.get('per_page', 10, type=int), 1), Config.HISTORY_MAX_PER_PAGE)
+        sort = request.args.get('sort', 'newest')
+        cursor = request.args.get('cursor')
+        
+        try:
+            query = AnalysisRecord.history_query(
+                search=request.args.get('search', '').strip() or None,
+                date=request.args.get('date') or None,
+                sort=sort,
+                cursor=cursor or None
             )
-            history_data.append(record_dict)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Некорректный параметр date или cursor'}), 400
+        
+        # Курсорная пагинация: без OFFSET и без подсчета общего числа записей
+        if cursor is not None:
+            items = query.limit(per_page + 1).all()
+            has_more = len(items) > per_page
+            items = items[:per_page]
+            return jsonify({
+                'success': True,
+                'records': [history_record_dict(record) for record in items],
+                'next_cursor': items[-1].history_cursor(sort) if has_more else None
+            })
+        
+        records = query.paginate(page=page, per_page=per_page, error_out=False)
+        
+        history_data = [history_record_dict(record) for record in records.items]
         
         return jsonify({
             'success': True,
             'records': history_data,
             'total': records.total,
             'pages': records.pages,
-            'current_page': page
+            'current_page': page,
+            'next_cursor': records.items[-1].history_cursor(sort) if records.has_next else None
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/visualization/<int:record_id>')
+def get_visualization(record_id):
+    """Отдает визуализацию записи; при отложенном рендеринге рисует ее при первом запросе"""
+    try:
+        record = AnalysisRecord.query.get(record_id)
+        if not record:
+            return jsonify({'success': False, 'error': 'Запись не найдена'}), 404
+        
+        if not image_store.resolve(record.original_path):
+            return jsonify({'success': False, 'error': 'Исходное изображение не найдено'}), 404
+        
+        return send_file(ensure_visualization(record), conditional=True)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/image/<int:record_id>')
+def get_record_image(record_id):
+    """Снимок (kind=original) или визуализация (kind=processed) записи; с w - уменьшенная копия"""
+    try:
+        kind = request.args.get('kind', 'processed')
+        if kind not in ('original', 'processed'):
+            return jsonify({'success': False, 'error': f'Неизвестный тип изображения: {kind}'}), 400
+        width = request.args.get('w', type=int)
+        if width is not None and width <= 0:
+            return jsonify({'success': False, 'error': 'Некорректный параметр w'}), 400
+        
+        record = AnalysisRecord.query.get(record_id)
+        if not record:
+            return jsonify({'success': False, 'error': 'Запись не найдена'}), 404
+        
+        path = image_store.resolve(record.original_path)
+        if path is None:
+            return jsonify({'success': False, 'error': 'Исходное изображение не найдено'}), 404
+        if kind == 'processed':
+            path = ensure_visualization(record)
+        if width:
+            path = image_variants.get(path, width)
+            if path is None:
+                return jsonify({'success': False, 'error': 'Изображение удалено'}), 404
+        
+        # Надолго кэшируются только адреса с версией записи (v из /api/history):
+        # адрес без версии после переиспользования id указывал бы на другой снимок
+        if request.args.get('v') == image_version(record):
+            response = send_file(path, conditional=True, max_age=Config.IMAGE_VARIANT_MAX_AGE)
+            response.cache_control.public = True
+        else:
+            response = send_file(path, conditional=True, max_age=0)
+            response.cache_control.no_cache = True
+        return response
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def wait_for_report(future, etag, download_name):
+    """Отдает готовый отчет или 202, если рендер не уложился в таймаут"""
+    try:
+        report_path = future.result(timeout=Config.REPORT_RENDER_TIMEOUT)
+    except TimeoutError:
+        # Рендер продолжается в фоне, повторный запрос получит готовый файл
+        return jsonify({
+            'success': True,
+            'status': 'pending',
+            'retry_after': Config.REPORT_RETRY_AFTER
+        }), 202, {'Retry-After': str(Config.REPORT_RETRY_AFTER)}
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    return send_file(
+        report_path,
+        as_attachment=True,
+        download_name=download_name,
+        etag=etag,
+        conditional=True,
+        max_age=0
+    )
+
 @app.route('/api/generate_report')
 def generate_report():
     """Генерирует отчет по анализу"""
@@ -226,58 +1116,169 @@ def generate_report():
         if not record:
             return jsonify({'success': False, 'error': 'Запись не найдена'})
         
-        analysis_data = record.to_dict()
+        if report_type not in REPORT_EXTENSIONS:
+            return jsonify({'success': False, 'error': 'Неподдерживаемый тип отчета'})
         
         if report_type == 'pdf':
-            report_path = report_gen.generate_pdf_report(
-                record.to_dict(),  
-                processed_image_path=record.processed_path
-            )
-        elif report_type == 'excel':
+            ensure_visualization(record)
+        analysis_data = record.to_dict()
+        recent_data = None
+        if report_type == 'excel':
             recent_records = AnalysisRecord.query\
                 .order_by(AnalysisRecord.timestamp.desc())\
                 .limit(10)\
                 .all()
             
             recent_data = [r.to_dict() for r in recent_records]
-            report_path = report_gen.generate_excel_report(analysis_data, recent_data)
-        elif report_type == 'json':
-            report_path = report_gen.generate_json_report(analysis_data)
-        else:
-            return jsonify({'success': False, 'error': 'Неподдерживаемый тип отчета'})
         
-        if not report_path:
-            return jsonify({'success': False, 'error': 'Ошибка генерации отчета'})
+        # Версия отчета служит и ключом кэша, и ETag
+        version = ReportCache.make_version(report_type, analysis_data, recent_data, record.processed_path)
+        if version in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(version)
+            return response
         
-        return send_file(
-            report_path,
-            as_attachment=True,
-            download_name=os.path.basename(report_path)
+        future = get_report_cache().get_or_render(
+            record_id, report_type, version, analysis_data,
+            recent_data=recent_data, processed_image_path=record.processed_path
+        )
+        return wait_for_report(
+            future, version, f'bookshelf_report_{record_id}.{REPORT_EXTENSIONS[report_type]}'
         )
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/generate_batch_report')
+def generate_batch_report():
+    """Сводный отчет PDF/Excel по записям: диапазон дат (date_from, date_to) и/или список ids"""
+    try:
+        report_type = request.args.get('type', 'pdf')
+        if report_type not in ('pdf', 'excel'):
+            return jsonify({'success': False, 'error': 'Неподдерживаемый тип отчета'}), 400
+        
+        query = AnalysisRecord.query
+        filters = []
+        try:
+            date_from = request.args.get('date_from')
+            date_to = request.args.get('date_to')
+            if date_from:
+                query = query.filter(AnalysisRecord.timestamp >= datetime.strptime(date_from, '%Y-%m-%d'))
+                filters.append(f'from {date_from}')
+            if date_to:
+                end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+                query = query.filter(AnalysisRecord.timestamp < end)
+                filters.append(f'to {date_to}')
+            ids = request.args.get('ids')
+            if ids:
+                id_list = sorted({int(i) for i in ids.split(',') if i.strip()})
+                query = query.filter(AnalysisRecord.id.in_(id_list))
+                filters.append(f'{len(id_list)} selected records')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Некорректный фильтр: даты YYYY-MM-DD, ids через запятую'}), 400
+        
+        records = query.order_by(AnalysisRecord.timestamp.asc(), AnalysisRecord.id.asc())\
+            .limit(Config.BATCH_REPORT_MAX_RECORDS + 1)\
+            .all()
+        if not records:
+            return jsonify({'success': False, 'error': 'Нет записей по заданному фильтру'}), 404
+        if len(records) > Config.BATCH_REPORT_MAX_RECORDS:
+            return jsonify({
+                'success': False,
+                'error': f'Слишком много записей (больше {Config.BATCH_REPORT_MAX_RECORDS}), сузьте фильтр'
+            }), 400
+        
+        record_dicts = [record.to_dict() for record in records]
+        description = ', '.join(filters) if filters else 'all records'
+        version = ReportCache.make_batch_version(report_type, record_dicts, description)
+        if version in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(version)
+            return response
+        
+        # Недостающие визуализации рисуются в пуле отчетов вместе с миниатюрами
+        missing = []
+        if report_type == 'pdf':
+            missing = [record for record in records
+                       if not (record.processed_path and os.path.exists(record.processed_path))]
+        future = get_report_cache().get_or_render_batch(
+            report_type, version, record_dicts, description,
+            visualizations=visualization_inputs(missing) if missing else None
+        )
+        return wait_for_report(
+            future, version,
+            f'bookshelf_batch_report_{datetime.now().strftime("%Y%m%d")}.{REPORT_EXTENSIONS[report_type]}'
+        )
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/export')
+def export_history():
+    """Потоковая выгрузка всей истории: записи, полки или детекции"""
+    try:
+        fmt = request.args.get('format', 'csv')
+        table = request.args.get('table', 'records')
+        chunks, mimetype, extension = stream_export(fmt, table, Config.EXPORT_CHUNK_SIZE)
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    filename = f"bookshelf_{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def delete_records_and_files(ids):
+    """Удаляет записи и ставит их файлы в очередь фонового удаления"""
+    deleted, paths = delete_records(ids, chunk_size=Config.DELETE_CHUNK_SIZE)
+    # Файл, общий с оставшимися записями, фоновое удаление пропустит
+    file_reaper.submit(sorted(paths))
+    if _report_cache is not None:
+        _report_cache.discard_records(ids)
+    return deleted, len(paths)
+
 @app.route('/api/delete_record/<int:record_id>', methods=['DELETE'])
 def delete_record(record_id):
     """Удаляет запись анализа"""
     try:
-        record = AnalysisRecord.query.get(record_id)
-        if not record:
+        deleted, _ = delete_records_and_files([record_id])
+        if not deleted:
             return jsonify({'success': False, 'error': 'Запись не найдена'})
         
-        BookDetection.query.filter_by(analysis_id=record_id).delete()
+        return jsonify({'success': True})
         
-        if os.path.exists(record.original_path):
-            os.remove(record.original_path)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/records/delete', methods=['POST'])
+def delete_records_bulk():
+    """Удаляет записи по списку ids или по фильтру (search, date, before)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
         
-        if os.path.exists(record.processed_path):
-            os.remove(record.processed_path)
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return jsonify({'success': False, 'error': 'ids должен быть списком целых чисел'}), 400
+        else:
+            search = (data.get('search') or '').strip() or None
+            date = data.get('date') or None
+            before = data.get('before') or None
+            # Без фильтра удалялась бы вся история; для этого есть /api/clear_all
+            if not (search or date or before):
+                return jsonify({'success': False, 'error': 'Нужен список ids или фильтр'}), 400
+            try:
+                query = AnalysisRecord.history_query(search=search, date=date)
+                if before:
+                    query = query.filter(AnalysisRecord.timestamp < datetime.strptime(before, '%Y-%m-%d'))
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Некорректный параметр date или before'}), 400
+            ids = [record_id for (record_id,) in query.order_by(None).with_entities(AnalysisRecord.id)]
         
-        db.session.delete(record)
-        db.session.commit()
-        
-        return jsonify({'success': True})
+        deleted, files = delete_records_and_files(ids)
+        return jsonify({'success': True, 'deleted': deleted, 'files_queued': files})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -286,12 +1287,18 @@ def delete_record(record_id):
 def get_statistics():
     """Возвращает общую статистику"""
     try:
-        total_records = AnalysisRecord.query.count()
-        total_books = db.session.query(db.func.sum(AnalysisRecord.total_books)).scalar() or 0
-        avg_fill = db.session.query(db.func.avg(AnalysisRecord.average_fill)).scalar() or 0
+        totals = db.session.query(
+            db.func.sum(DailyStats.analyses),
+            db.func.sum(DailyStats.books),
+            db.func.sum(DailyStats.average_fill_sum),
+            db.func.sum(DailyStats.average_fill_count)
+        ).one()
+        total_records = int(totals[0] or 0)
+        total_books = totals[1] or 0
+        avg_fill = totals[2] / totals[3] if totals[3] else 0
         
         recent = AnalysisRecord.query\
-            .order_by(AnalysisRecord.timestamp.desc())\
+            .order_by(AnalysisRecord.id.desc())\
             .limit(5)\
             .all()
         
@@ -323,22 +1330,45 @@ def health_check():
         'success': True,
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'model': 'YOLO26n (локальная)'
+        'model': 'YOLO26n (локальная)',
+        'model_status': model_state['status'],
+        'startup_time': STARTUP_TIME,
+        'database': sqlite_settings(db.engine),
+        'db_writer': db_writer.stats() if db_writer is not None else None
     })
 
+@app.route('/api/ready')
+def readiness_check():
+    """Проверяет готовность к анализу: модель загружена"""
+    status = model_state['status']
+    ready = status == 'loaded' or (Config.MODEL_LOADING == 'lazy' and status != 'error')
+    
+    return jsonify({
+        'success': ready,
+        'status': 'ready' if ready else status,
+        'model': dict(model_state),
+        'loading_mode': Config.MODEL_LOADING,
+        'startup_time': STARTUP_TIME
+    }), 200 if ready else 503
+
 @app.route('/api/clear_all', methods=['DELETE'])
 def clear_all_data():
     """Удаляет все данные"""
     try:
+        ShelfResult.query.delete()
         AnalysisRecord.query.delete()
         BookDetection.query.delete()
+        DailyStats.query.delete()
         db.session.commit()
         
-        import shutil
-        shutil.rmtree(Config.ORIGINAL_FOLDER, ignore_errors=True)
-        shutil.rmtree(Config.PROCESSED_FOLDER, ignore_errors=True)
-        os.makedirs(Config.ORIGINAL_FOLDER, exist_ok=True)
-        os.makedirs(Config.PROCESSED_FOLDER, exist_ok=True)
+        # Каталоги переносятся в корзину мгновенно, файлы удаляются в фоне
+        for folder in (Config.ORIGINAL_FOLDER, Config.PROCESSED_FOLDER, Config.IMAGE_VARIANT_DIR):
+            move_to_trash(folder)
+        
+        if result_cache is not None:
+            result_cache.clear()
+        if _report_cache is not None:
+            _report_cache.clear()
         
         return jsonify({'success': True, 'message': 'Все данные успешно удалены'})
         
@@ -349,68 +1379,55 @@ def clear_all_data():
 def get_detailed_stats():
     """Возвращает детальную статистику"""
     try:
-        from datetime import datetime, timedelta
-        import numpy as np
+        days = request.args.get('days', Config.STATS_WINDOW_DAYS, type=int)
+        days = min(max(days, 1), Config.STATS_MAX_WINDOW_DAYS)
+        window_start = DailyStats.window_start(days)
         
-        week_ago = datetime.now() - timedelta(days=7)
-        recent_records = AnalysisRecord.query\
-            .filter(AnalysisRecord.timestamp >= week_ago)\
-            .order_by(AnalysisRecord.timestamp.asc())\
+        rows = DailyStats.query\
+            .filter(DailyStats.date >= window_start)\
+            .order_by(DailyStats.date.asc())\
             .all()
         
-        daily_stats = {}
-        for record in recent_records:
-            date_str = record.timestamp.strftime('%Y-%m-%d')
-            if date_str not in daily_stats:
-                daily_stats[date_str] = {
-                    'date': date_str,
-                    'analyses': 0,
-                    'books': 0,
-                    'fill_percentages': [],
-                    'processing_times': []
-                }
-            
-            daily_stats[date_str]['analyses'] += 1
-            daily_stats[date_str]['books'] += record.total_books or 0
-            daily_stats[date_str]['fill_percentages'].extend(record.fill_percentages_list)
-            daily_stats[date_str]['processing_times'].append(record.processing_time or 0)
-        
-        formatted_daily_stats = []
-        for date, data in sorted(daily_stats.items()):
-            avg_fill = np.mean(data['fill_percentages']) if data['fill_percentages'] else 0
-            max_fill = max(data['fill_percentages']) if data['fill_percentages'] else 0
-            min_fill = min(data['fill_percentages']) if data['fill_percentages'] else 0
-            avg_time = np.mean(data['processing_times']) if data['processing_times'] else 0
-            
-            formatted_daily_stats.append({
-                'date': data['date'],
-                'analyses': data['analyses'],
-                'books': data['books'],
-                'avg_fill': float(avg_fill),
-                'max_fill': float(max_fill),
-                'min_fill': float(min_fill),
-                'avg_time': float(avg_time)
-            })
+        formatted_daily_stats = [{
+            'date': row.date.isoformat(),
+            'analyses': row.analyses,
+            'books': row.books,
+            'avg_fill': row.fill_sum / row.fill_count if row.fill_count else 0.0,
+            'max_fill': row.fill_max or 0.0,
+            'min_fill': row.fill_min or 0.0,
+            'avg_time': row.processing_time_sum / row.analyses if row.analyses else 0.0
+        } for row in rows]
+        
+        analyses = sum(row.analyses for row in rows)
+        average_fill_count = sum(row.average_fill_count for row in rows)
+        fill_max = [row.fill_max for row in rows if row.fill_max is not None]
+        fill_min = [row.fill_min for row in rows if row.fill_min is not None]
         
         total_stats = {
-            'analyses': len(recent_records),
-            'books': sum(r.total_books or 0 for r in recent_records),
-            'avg_fill': np.mean([np.mean(r.fill_percentages_list) for r in recent_records if r.fill_percentages_list]) if recent_records else 0,
-            'max_fill': max([max(r.fill_percentages_list) for r in recent_records if r.fill_percentages_list]) if recent_records else 0,
-            'min_fill': min([min(r.fill_percentages_list) for r in recent_records if r.fill_percentages_list]) if recent_records else 0,
-            'avg_time': np.mean([r.processing_time or 0 for r in recent_records]) if recent_records else 0
+            'analyses': analyses,
+            'books': sum(row.books for row in rows),
+            'avg_fill': sum(row.average_fill_sum for row in rows) / average_fill_count if average_fill_count else 0,
+            'max_fill': max(fill_max) if fill_max else 0,
+            'min_fill': min(fill_min) if fill_min else 0,
+            'avg_time': sum(row.processing_time_sum for row in rows) / analyses if analyses else 0
         }
         
         shelf_types = [
-            {'name': 'Открытые шкафы', 'count': len([r for r in recent_records if r.average_fill and r.average_fill > 50])},
-            {'name': 'Закрытые шкафы', 'count': len([r for r in recent_records if r.average_fill and r.average_fill <= 50])},
-            {'name': 'Полностью заполненные', 'count': len([r for r in recent_records if r.average_fill and r.average_fill > 80])},
-            {'name': 'Частично заполненные', 'count': len([r for r in recent_records if r.average_fill and 30 <= r.average_fill <= 80])},
-            {'name': 'Почти пустые', 'count': len([r for r in recent_records if r.average_fill and r.average_fill < 30])}
+            {'name': 'Открытые шкафы', 'count': sum(row.open_count for row in rows)},
+            {'name': 'Закрытые шкафы', 'count': sum(row.closed_count for row in rows)},
+            {'name': 'Полностью заполненные', 'count': sum(row.full_count for row in rows)},
+            {'name': 'Частично заполненные', 'count': sum(row.partial_count for row in rows)},
+            {'name': 'Почти пустые', 'count': sum(row.empty_count for row in rows)}
         ]
         
+        recent_records = AnalysisRecord.query\
+            .filter(AnalysisRecord.timestamp >= datetime.combine(window_start, datetime.min.time()))\
+            .order_by(AnalysisRecord.id.desc())\
+            .limit(10)\
+            .all()[::-1]
+        
         recent_activity = []
-        for record in recent_records[-10:]:
+        for record in recent_records:
             recent_activity.append({
                 'timestamp': record.timestamp.isoformat(),
                 'user': 'Анонимный пользователь',
@@ -430,6 +1447,7 @@ def get_detailed_stats():
             'success': True,
             'daily_stats': formatted_daily_stats,
             'daily_trends': formatted_daily_stats,
+            'window_days': days,
             'total': total_stats,
             'shelf_types': shelf_types,
             'recent_activity': recent_activity,
@@ -439,6 +1457,10 @@ def get_detailed_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+STARTUP_TIME = round(time.time() - STARTUP_BEGIN, 3)
+if SERVER_PROCESS:
+    print(f"Приложение запущено за {STARTUP_TIME:.2f} секунд (загрузка модели: {Config.MODEL_LOADING})")
+
 if __name__ == '__main__':
     os.makedirs(Config.ORIGINAL_FOLDER, exist_ok=True)
     os.makedirs(Config.PROCESSED_FOLDER, exist_ok=True)
@@ -0,0 +1,5 @@
+"""
+Бенчмарки конвейера анализа. Запуск из корня проекта:
+
+    python -m benchmarks.bench_shelf_segmentation
+"""
@@ -0,0 +1,180 @@
+"""
+Нагрузочный тест SQLite: параллельные сохранения анализов и чтения истории.
+
+Писатели в потоках сохраняют анализы (запись, детекции, полки, дневные
+агрегаты - как app.insert_analysis), читатели в это время листают историю
+и считают статистику. Сравниваются настройки по умолчанию (журнал DELETE),
+WAL с прагмами из db_setup и WAL с потоком-писателем WriteQueue:
+вставки и чтения в секунду, задержки p50/p95 и ошибки "database is locked".
+
+    python -m benchmarks.bench_db_concurrency --writers 8 --readers 4 --seconds 10
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from flask import Flask
+
+from benchmarks.bench_db_insert import _books
+from benchmarks.common import write_results
+from database import db, AnalysisRecord, DailyStats, insert_detections, insert_shelves
+from db_setup import WriteQueue, configure_sqlite, engine_options, sqlite_settings
+
+MODES = ('default', 'wal', 'wal+queue')
+
+
+def insert_record(books):
+    """Запись анализа без фиксации транзакции; возвращает id"""
+    record = AnalysisRecord(
+        filename='bench.jpg',
+        original_path='bench.jpg',
+        total_books=len(books),
+        shelf_count=6,
+        fill_percentages=[50.0] * 6,
+        average_fill=50.0,
+        processing_time=0.1,
+        image_width=1024,
+        image_height=1024
+    )
+    db.session.add(record)
+    db.session.flush()
+    insert_detections(record.id, books)
+    insert_shelves(record.id, [{'shelf_number': i + 1} for i in range(6)], [50.0] * 6)
+    DailyStats.add_record(record, [50.0] * 6)
+    return record.id
+
+
+def read_history():
+    """Страница истории и статистика за неделю, как на страницах приложения"""
+    records = AnalysisRecord.history_query(sort='newest').limit(20).all()
+    for record in records:
+        record.to_dict()
+    DailyStats.query.filter(DailyStats.date >= DailyStats.window_start(7)).all()
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+
+def run(mode, workdir, writers, readers, seconds, books):
+    app = Flask(__name__)
+    uri = 'sqlite:///' + os.path.join(workdir, f'{mode.replace("+", "_")}_{writers}.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    if mode != 'default':
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+            uri, pool_size=writers + readers, busy_timeout=10.0
+        )
+    db.init_app(app)
+
+    with app.app_context():
+        if mode != 'default':
+            configure_sqlite(db.engine, busy_timeout=10.0)
+        db.create_all()
+        settings = sqlite_settings(db.engine)
+
+    writer = None
+    if mode == 'wal+queue':
+        writer = WriteQueue(app, db.session, max_batch=32)
+        writer.start()
+
+    write_latency, read_latency = [], []
+    errors = {'write': 0, 'read': 0}
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+
+    def write_loop():
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    if writer is not None:
+                        writer.submit(insert_record, books).result()
+                    else:
+                        insert_record(books)
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    with lock:
+                        errors['write'] += 1
+                    continue
+                with lock:
+                    write_latency.append(time.perf_counter() - start)
+
+    def read_loop():
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    read_history()
+                    db.session.rollback()
+                except Exception:
+                    db.session.rollback()
+                    with lock:
+                        errors['read'] += 1
+                    continue
+                with lock:
+                    read_latency.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=write_loop) for _ in range(writers)] + \
+              [threading.Thread(target=read_loop) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    row = {
+        'mode': mode,
+        'writers': writers,
+        'readers': readers,
+        'books': len(books),
+        'journal_mode': settings.get('journal_mode'),
+        'inserts_per_second': round(len(write_latency) / elapsed, 1),
+        'reads_per_second': round(len(read_latency) / elapsed, 1),
+        'write_p50_ms': _percentile(write_latency, 0.5),
+        'write_p95_ms': _percentile(write_latency, 0.95),
+        'read_p50_ms': _percentile(read_latency, 0.5),
+        'read_p95_ms': _percentile(read_latency, 0.95),
+        'write_errors': errors['write'],
+        'read_errors': errors['read']
+    }
+    if writer is not None:
+        writer.stop()
+        row['average_batch'] = writer.stats()['average_batch']
+
+    with app.app_context():
+        stored = AnalysisRecord.query.count()
+        aggregated = db.session.query(db.func.sum(DailyStats.analyses)).scalar() or 0
+        row['consistent'] = stored == aggregated == len(write_latency)
+        db.engine.dispose()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--books', type=int, default=200, help='детекций в одном анализе')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    books = _books(args.books)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for writers in args.writers:
+            for mode in args.modes:
+                results.append(run(mode, tmp, writers, args.readers, args.seconds, books))
+
+    write_results('db_concurrency', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
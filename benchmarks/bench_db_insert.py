@@ -0,0 +1,85 @@
+"""
+Пропускная способность сохранения анализа в SQLite: прежний путь
+(коммит записи, затем db.session.add для каждой книги и второй коммит)
+против пакетной вставки детекций в одной транзакции.
+"""
+import argparse
+import os
+import tempfile
+
+from flask import Flask
+
+from benchmarks.common import measure, write_results
+from benchmarks.synthetic import synthetic_shelf_boxes
+from database import db, AnalysisRecord, BookDetection, insert_detections
+
+
+def _books(n_books: int) -> list:
+    boxes = synthetic_shelf_boxes(n_books, 6, seed=n_books)
+    return [{
+        'bbox': [x1, y1, x2, y2],
+        'width': x2 - x1,
+        'height': y2 - y1,
+        'confidence': 0.9,
+        'shelf_number': shelf + 1
+    } for x1, y1, x2, y2, shelf in zip(boxes['x1'].tolist(), boxes['y1'].tolist(),
+                                       boxes['x2'].tolist(), boxes['y2'].tolist(),
+                                       boxes['shelf'].tolist())]
+
+
+def _save_per_row(books: list):
+    record = AnalysisRecord(filename='bench.jpg', total_books=len(books))
+    db.session.add(record)
+    db.session.commit()
+    for book in books:
+        db.session.add(BookDetection(
+            analysis_id=record.id,
+            x_min=book['bbox'][0], y_min=book['bbox'][1],
+            x_max=book['bbox'][2], y_max=book['bbox'][3],
+            width=book['width'], height=book['height'],
+            confidence=book['confidence'], shelf_number=book['shelf_number']
+        ))
+    db.session.commit()
+
+
+def _save_bulk(books: list):
+    record = AnalysisRecord(filename='bench.jpg', total_books=len(books))
+    db.session.add(record)
+    db.session.flush()
+    insert_detections(record.id, books)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        db.init_app(app)
+
+        results = []
+        with app.app_context():
+            db.create_all()
+            for n_books in args.books:
+                books = _books(n_books)
+                row = {'books': n_books}
+                for name, save in (('per_row', _save_per_row), ('bulk', _save_bulk)):
+                    timing = measure(lambda: save(books), repeat=args.repeat)
+                    row[f'{name}_ms'] = round(timing['median'] * 1000, 2)
+                    row[f'{name}_rows_per_second'] = round(n_books / timing['median'])
+                row['speedup'] = round(row['per_row_ms'] / row['bulk_ms'], 1)
+                results.append(row)
+
+            stored = BookDetection.query.filter(BookDetection.shelf_number.is_(None)).count()
+            print(f"Детекций без номера полки: {stored}")
+
+    write_results('db_insert', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Загрузка снимка: прежний путь (файл на диск, cv2.imread в полном размере,
+resize до 1024, копии кадра для разметки) против декодирования из байтов
+запроса с уменьшением средствами libjpeg (IMREAD_REDUCED_*).
+
+Для каждой стадии - медиана времени и пик памяти (tracemalloc учитывает
+массивы NumPy/OpenCV).
+
+    python -m benchmarks.bench_decode --sizes 2000x1500 4000x3000 6000x4000
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from models.analyzer import decode_image
+
+
+def synthetic_photo(width: int, height: int, seed: int = 0) -> bytes:
+    """JPEG с полками из цветных корешков и шумом, чтобы сжатие было реалистичным"""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(150, 200, (height, width, 3), dtype=np.uint8)
+    spine = max(4, width // 300)
+    for y in range(0, height, height // 4):
+        for x in range(0, width - spine, spine + 2):
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(image, (x, y + height // 20), (x + spine, y + height // 4 - 5), color, -1)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def legacy_stages(data: bytes, path: str, max_size: int = 1024) -> dict:
+    """Стадии прежнего пути загрузки"""
+    def save():
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def decode():
+        return cv2.imread(path)
+
+    def resize(image):
+        height, width = image.shape[:2]
+        scale = max_size / max(height, width)
+        if scale >= 1:
+            return image
+        return cv2.resize(image, (int(width * scale), int(height * scale)),
+                          interpolation=cv2.INTER_LINEAR)
+
+    def copies(image):
+        # _detect_books и _create_visualization копировали кадр перед разметкой
+        return image.copy().copy()
+
+    return {'save': save, 'decode': decode, 'resize': resize, 'copies': copies}
+
+
+def _stage(fn, *args, repeat: int):
+    """Время и пик памяти одной стадии"""
+    tracemalloc.start()
+    result = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timing = measure(lambda: fn(*args), repeat=repeat, warmup=0)
+    return result, {'ms': round(timing['median'] * 1000, 2), 'peak_mb': round(peak / 2 ** 20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1280x960', '2000x1500', '4000x3000', '6000x4000'])
+    parser.add_argument('--max-size', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            width, height = map(int, size.split('x'))
+            data = synthetic_photo(width, height)
+            path = os.path.join(tmp_dir, 'upload.jpg')
+
+            stages = legacy_stages(data, path, args.max_size)
+            _, save = _stage(stages['save'], repeat=args.repeat)
+            full, decode = _stage(stages['decode'], repeat=args.repeat)
+            legacy, resize = _stage(stages['resize'], full, repeat=args.repeat)
+            _, copies = _stage(stages['copies'], legacy, repeat=args.repeat)
+            del full
+
+            def run_legacy():
+                stages['save']()
+                stages['copies'](stages['resize'](stages['decode']()))
+
+            _, total = _stage(run_legacy, repeat=args.repeat)
+            results.append({
+                'pipeline': 'legacy',
+                'image': size,
+                'jpeg_kb': len(data) // 1024,
+                'stages': {'save': save, 'decode': decode, 'resize': resize, 'copies': copies},
+                'total_ms': total['ms'],
+                'peak_mb': total['peak_mb']
+            })
+
+            (image, _, _), decode = _stage(decode_image, data, args.max_size, repeat=args.repeat)
+            difference = np.abs(image.astype(np.int16) - legacy.astype(np.int16)).mean() \
+                if image.shape == legacy.shape else None
+            results.append({
+                'pipeline': 'decode_once',
+                'image': size,
+                'jpeg_kb': len(data) // 1024,
+                'stages': {'decode': decode},
+                'total_ms': decode['ms'],
+                'peak_mb': decode['peak_mb'],
+                'output': f'{image.shape[1]}x{image.shape[0]}',
+                'mean_abs_diff_vs_legacy': round(float(difference), 3) if difference is not None else None
+            })
+
+    write_results('decode', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
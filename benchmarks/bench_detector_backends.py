@@ -0,0 +1,123 @@
+"""
+Сравнение бэкендов детектора (PyTorch, ONNX Runtime, ONNX INT8) на одних и
+тех же изображениях: задержка на CPU и совпадение детекций с эталоном.
+
+    python -m benchmarks.bench_detector_backends --images photos/ --export
+"""
+import argparse
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from config import Config
+from models.analyzer import create_detector_backend, export_onnx_model
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _match(reference: np.ndarray, candidate: np.ndarray, iou_threshold: float) -> int:
+    """Жадное сопоставление боксов одного класса, возвращает число совпадений"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    iou = _iou_matrix(reference[:, :4], candidate[:, :4])
+    iou[reference[:, None, 5] != candidate[None, :, 5]] = 0
+    matched = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            return matched
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+
+
+def _load_images(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        paths.extend(sorted(glob.glob(pattern)))
+
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        scale = 1024 / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        images.append(image)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', nargs='+', required=True)
+    parser.add_argument('--models', nargs='+', default=['yolo', 'yolo_onnx', 'yolo_onnx_int8'],
+                        help='ключи Config.MODEL_PATHS; первый считается эталоном')
+    parser.add_argument('--export', action='store_true', help='экспортировать ONNX и INT8 перед замером')
+    parser.add_argument('--conf', type=float, default=Config.CONFIDENCE_THRESHOLD)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx_model(Config.MODEL_PATHS['yolo'], quantize=True)
+
+    images = _load_images(args.images)
+    if not images:
+        parser.error('изображения не найдены')
+
+    reference = None
+    results = []
+    for key in args.models:
+        path = Config.MODEL_PATHS[key]
+        if not os.path.exists(path):
+            print(f"Модель {key} не найдена: {path}, пропускаю")
+            continue
+
+        backend = create_detector_backend(path, {'iou_threshold': Config.IOU_THRESHOLD})
+        detections = [backend.predict([image], conf=args.conf)[0] for image in images]
+        latencies = [
+            measure(lambda image=image: backend.predict([image], conf=args.conf),
+                    repeat=args.repeat)['median']
+            for image in images
+        ]
+
+        row = {
+            'model': key,
+            'backend': backend.name,
+            'images': len(images),
+            'median_latency_ms': round(float(np.median(latencies)) * 1000, 2),
+            'images_per_second': round(1 / float(np.mean(latencies)), 2),
+            'boxes': int(sum(len(d) for d in detections))
+        }
+
+        if reference is None:
+            reference = detections
+        else:
+            matched = sum(_match(r, d, args.iou) for r, d in zip(reference, detections))
+            ref_total = sum(len(r) for r in reference)
+            row['recall_vs_reference'] = round(matched / ref_total, 4) if ref_total else 1.0
+            row['precision_vs_reference'] = round(matched / row['boxes'], 4) if row['boxes'] else 1.0
+
+        results.append(row)
+
+    write_results('detector_backends', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
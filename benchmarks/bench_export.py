@@ -0,0 +1,85 @@
+"""
+Потоковая выгрузка истории (/api/export) против сборки всей таблицы
+в памяти через pandas: время и пиковое потребление памяти Python.
+
+    python -m benchmarks.bench_export --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+
+from benchmarks.common import write_results
+from benchmarks.synthetic import synthetic_history_rows
+from database import db, AnalysisRecord
+from exporter import stream_export
+
+
+def _run(fn) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': round(elapsed, 3), 'output_mb': round(size / 2 ** 20, 2),
+            'peak_memory_mb': round(peak / 2 ** 20, 2)}
+
+
+def _streamed(fmt: str, chunk_size: int):
+    def run():
+        chunks, _, _ = stream_export(fmt, 'records', chunk_size)
+        return sum(len(chunk) for chunk in chunks)
+    return run
+
+
+def _in_memory():
+    import pandas as pd
+
+    frame = pd.read_sql(db.select(AnalysisRecord.__table__), db.session.connection())
+    return len(frame.to_csv(index=False).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'export.db')
+        db.init_app(app)
+
+        results = []
+        with app.app_context():
+            db.create_all()
+            for offset in range(0, args.rows, 50000):
+                db.session.execute(AnalysisRecord.__table__.insert(),
+                                   synthetic_history_rows(offset, min(offset + 50000, args.rows)))
+            db.session.commit()
+
+            runs = [('pandas_in_memory_csv', _in_memory)]
+            for fmt in ('csv', 'ndjson', 'parquet'):
+                if fmt == 'parquet':
+                    try:
+                        import pyarrow  # noqa: F401
+                    except ImportError:
+                        print("pyarrow не установлен, Parquet пропущен")
+                        continue
+                runs.append((f'stream_{fmt}', _streamed(fmt, args.chunk_size)))
+
+            for name, fn in runs:
+                row = {'rows': args.rows, 'method': name}
+                row.update(_run(fn))
+                results.append(row)
+
+    write_results('export', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Запросы истории на большой таблице analysis_records: первая и глубокая
+страница (OFFSET против курсора), фильтр по дате, поиск и сортировки -
+без индексов и с индексами из ensure_indexes().
+
+    python -m benchmarks.bench_history --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from benchmarks.common import measure, write_results
+from benchmarks.synthetic import synthetic_history_rows
+from database import db, AnalysisRecord, ensure_indexes
+
+
+def _fill_table(n_rows: int, chunk: int = 50000):
+    for offset in range(0, n_rows, chunk):
+        db.session.execute(AnalysisRecord.__table__.insert(),
+                           synthetic_history_rows(offset, min(offset + chunk, n_rows)))
+    db.session.commit()
+
+
+def _scenarios(n_rows: int, per_page: int) -> dict:
+    middle = n_rows // 2
+    day = (datetime(2024, 1, 1) + timedelta(seconds=30 * middle)).strftime('%Y-%m-%d')
+    anchor = AnalysisRecord.history_query().offset(middle - 1).limit(1).one()
+    cursor = anchor.history_cursor('newest')
+
+    return {
+        'first_page': lambda: AnalysisRecord.history_query().limit(per_page).all(),
+        'first_page_with_total': lambda: (AnalysisRecord.history_query().limit(per_page).all(),
+                                          AnalysisRecord.history_query().order_by(None).count()),
+        'deep_page_offset': lambda: AnalysisRecord.history_query().offset(middle).limit(per_page).all(),
+        'deep_page_cursor': lambda: AnalysisRecord.history_query(cursor=cursor).limit(per_page).all(),
+        'date_filter': lambda: AnalysisRecord.history_query(date=day).limit(per_page).all(),
+        'search': lambda: AnalysisRecord.history_query(search='bookcase_12').limit(per_page).all(),
+        'sort_most_books': lambda: AnalysisRecord.history_query(sort='most_books').limit(per_page).all(),
+        'sort_least_filled': lambda: AnalysisRecord.history_query(sort='least_filled').limit(per_page).all()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'history.db')
+        db.init_app(app)
+
+        results = []
+        with app.app_context():
+            db.create_all()
+            for index in AnalysisRecord.__table__.indexes:
+                index.drop(db.engine)
+            print(f"Заполнение таблицы: {args.rows} записей...")
+            _fill_table(args.rows)
+
+            timings = {}
+            for indexed in (False, True):
+                if indexed:
+                    ensure_indexes()
+                for name, fn in _scenarios(args.rows, args.per_page).items():
+                    timing = measure(fn, repeat=args.repeat)
+                    timings.setdefault(name, {})[indexed] = timing['median']
+
+            for name, by_mode in timings.items():
+                results.append({
+                    'rows': args.rows,
+                    'scenario': name,
+                    'no_index_ms': round(by_mode[False] * 1000, 2),
+                    'indexed_ms': round(by_mode[True] * 1000, 2),
+                    'speedup': round(by_mode[False] / by_mode[True], 1) if by_mode[True] else None
+                })
+
+    write_results('history', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Стадии анализа после детектора на синтетических полках от 10 до 2000 книг:
+разбор выхода детектора (_detect_books с детектором-заглушкой), полки,
+статистика, визуализация, сохранение в SQLite и отчеты PDF/Excel.
+
+Модель не нужна: заглушка возвращает заранее сгенерированные боксы, среди
+которых есть объекты других классов и с низкой уверенностью, чтобы фильтрация
+работала как на настоящем выходе YOLO.
+
+    python -m benchmarks.bench_pipeline --books 10 100 500 2000
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from flask import Flask
+
+from benchmarks.common import measure, write_results
+from benchmarks.synthetic import synthetic_shelf_boxes
+from config import Config
+from database import db, AnalysisRecord, DailyStats, insert_detections, insert_shelves
+from models.analyzer import BookShelfAnalyzer, DetectorBackend
+from models.shelf_segmentation import get_segmenter
+
+
+class StubDetector(DetectorBackend):
+    """Детектор-заглушка: отдает заданный массив детекций [x1, y1, x2, y2, conf, cls]"""
+
+    name = 'stub'
+    names = {0: 'book', 1: 'person', 2: 'books'}
+
+    def __init__(self, detections: np.ndarray):
+        self.detections = detections
+
+    def predict(self, images, conf, imgsz=None):
+        return [self.detections[self.detections[:, 4] >= conf] for _ in images]
+
+
+def synthetic_detections(n_books: int, n_shelves: int, size: int = 1024, seed: int = 0) -> np.ndarray:
+    """Выход детектора: книги плюс 10% посторонних объектов и слабых срабатываний"""
+    rng = np.random.default_rng(seed)
+    boxes = synthetic_shelf_boxes(n_books, n_shelves, size, size, seed=seed)
+    books = np.stack([boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2']], axis=1).astype(np.float32)
+    classes = rng.choice([0, 2], n_books).astype(np.float32)
+    confidence = rng.uniform(0.5, 0.99, n_books).astype(np.float32)
+
+    noise = max(1, n_books // 10)
+    noise_boxes = books[rng.integers(0, n_books, noise)] + rng.normal(0, 5, (noise, 4)).astype(np.float32)
+    noise_classes = rng.choice([1, 0], noise).astype(np.float32)
+    noise_confidence = rng.uniform(0.1, 0.6, noise).astype(np.float32)
+
+    return np.concatenate([
+        np.concatenate([books, confidence[:, None], classes[:, None]], axis=1),
+        np.concatenate([noise_boxes, noise_confidence[:, None], noise_classes[:, None]], axis=1)
+    ])
+
+
+def synthetic_image(detections: np.ndarray, size: int = 1024, seed: int = 0) -> np.ndarray:
+    """Изображение полки с корешками на местах книг"""
+    rng = np.random.default_rng(seed)
+    image = np.full((size, size, 3), 230, dtype=np.uint8)
+    for x1, y1, x2, y2 in detections[:, :4].astype(int):
+        color = tuple(int(c) for c in rng.integers(0, 200, 3))
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, -1)
+    return image
+
+
+def stub_analyzer(detections: np.ndarray, processed_folder: str) -> BookShelfAnalyzer:
+    """Анализатор с заглушкой вместо YOLO, без загрузки модели"""
+    analyzer = BookShelfAnalyzer.__new__(BookShelfAnalyzer)
+    analyzer.detector = StubDetector(detections)
+    analyzer.shelf_segmenter = get_segmenter(Config.SHELF_SEGMENTER)
+    analyzer.config = {
+        'confidence_threshold': 0.5,
+        'processed_folder': processed_folder,
+        'render': 'eager'
+    }
+    return analyzer
+
+
+def save_record(results: dict) -> AnalysisRecord:
+    """Запись анализа, как в app.save_analysis: запись, детекции, полки и дневные агрегаты"""
+    statistics = results['statistics']
+    record = AnalysisRecord(
+        filename='bench.jpg',
+        original_path='bench.jpg',
+        processed_path=results['visualization_path'],
+        total_books=statistics['total_books'],
+        shelf_count=statistics['shelf_count'],
+        fill_percentages=statistics['fill_percentages'],
+        average_fill=statistics['average_fill'],
+        processing_time=0.0,
+        image_width=1024,
+        image_height=1024
+    )
+    db.session.add(record)
+    db.session.flush()
+    insert_detections(record.id, results['books'])
+    insert_shelves(record.id, results['shelves'], statistics['fill_percentages'])
+    DailyStats.add_record(record, statistics['fill_percentages'])
+    db.session.commit()
+    return record
+
+
+def _ms(timing: dict) -> float:
+    return round(timing['median'] * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--shelves', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--report-repeat', type=int, default=2)
+    parser.add_argument('--no-reports', action='store_true', help='не замерять генерацию PDF/Excel')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        db.init_app(app)
+
+        generator = None
+        if not args.no_reports:
+            from report_generator import ReportGenerator
+            generator = ReportGenerator(output_dir=os.path.join(tmp, 'reports'))
+
+        # Стадии анализатора печатают ход работы; в замер это не входит
+        with app.app_context(), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            db.create_all()
+            for n_books in args.books:
+                detections = synthetic_detections(n_books, args.shelves, seed=n_books)
+                image = synthetic_image(detections, seed=n_books)
+                analyzer = stub_analyzer(detections, tmp)
+                height, width = image.shape[:2]
+
+                books = analyzer._detect_books(image)
+                shelves = analyzer._detect_shelves(image, books.copy())
+                statistics = analyzer._calculate_statistics(books, shelves, width, height)
+                row = {
+                    'books': n_books,
+                    'detections': len(detections),
+                    'found': len(books),
+                    'shelves': len(shelves),
+                    'postprocess_ms': _ms(measure(lambda: analyzer._detect_books(image), args.repeat)),
+                    'shelves_ms': _ms(measure(lambda: analyzer._detect_shelves(image, books.copy()), args.repeat)),
+                    'statistics_ms': _ms(measure(
+                        lambda: analyzer._calculate_statistics(books, shelves, width, height), args.repeat
+                    )),
+                    # Визуализация рисует поверх кадра, поэтому каждый прогон на своей копии
+                    'visualization_ms': _ms(measure(lambda: analyzer._create_visualization(
+                        os.path.join(tmp, 'bench.jpg'), image.copy(), books, shelves, statistics
+                    ), args.repeat))
+                }
+
+                full = analyzer._finish_analysis(
+                    os.path.join(tmp, 'bench.jpg'), image.copy(), analyzer._detect_books(image),
+                    1024, 1024, {}, 'eager'
+                )
+                row['db_write_ms'] = _ms(measure(lambda: save_record(full), args.repeat))
+
+                if generator is not None:
+                    record = save_record(full).to_dict()
+                    row['report_pdf_ms'] = _ms(measure(
+                        lambda: generator.generate_pdf_report(
+                            record, processed_image_path=full['visualization_path']
+                        ), args.report_repeat
+                    ))
+                    row['report_excel_ms'] = _ms(measure(
+                        lambda: generator.generate_excel_report(record), args.report_repeat
+                    ))
+
+                results.append(row)
+
+    write_results('pipeline', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Сравнение алгоритмов определения полок: разрывы по высоте и K-means.
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from benchmarks.synthetic import synthetic_shelf_boxes
+from models.shelf_segmentation import get_segmenter
+
+
+def _purity(labels: np.ndarray, truth: np.ndarray) -> float:
+    """Доля книг, совпадающих с преобладающей истинной полкой своей группы"""
+    correct = 0
+    for label in np.unique(labels):
+        correct += np.bincount(truth[labels == label]).max()
+    return correct / len(truth)
+
+
+def _accuracy(labels: np.ndarray, truth: np.ndarray) -> float:
+    """Штрафует и слияние полок, и лишнее дробление"""
+    return min(_purity(labels, truth), _purity(truth, labels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--shelves', type=int, nargs='+', default=[3, 6, 10])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    engines = ['gap']
+    try:
+        import sklearn  # noqa: F401
+        engines.append('kmeans')
+    except ImportError:
+        print("scikit-learn не установлен, K-means пропущен")
+
+    results = []
+    for n_shelves in args.shelves:
+        for n_books in args.books:
+            if n_books < n_shelves:
+                continue
+            data = synthetic_shelf_boxes(n_books, n_shelves, seed=n_books + n_shelves)
+            y1 = data['y1'].astype(np.float64)
+            y2 = data['y2'].astype(np.float64)
+
+            for engine in engines:
+                segmenter = get_segmenter(engine)
+                labels = segmenter.segment(y1, y2, 1024)
+                timing = measure(lambda: segmenter.segment(y1, y2, 1024), repeat=args.repeat)
+                results.append({
+                    'engine': engine,
+                    'books': n_books,
+                    'true_shelves': len(np.unique(data['shelf'])),
+                    'found_shelves': int(labels.max()) + 1,
+                    'accuracy': round(_accuracy(labels, data['shelf']), 4),
+                    'median_ms': round(timing['median'] * 1000, 3)
+                })
+
+    write_results('shelf_segmentation', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
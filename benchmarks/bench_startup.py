@@ -0,0 +1,69 @@
+"""
+Время запуска приложения в разных режимах загрузки модели.
+
+Каждый замер выполняется в отдельном процессе: время импорта app.py (после
+него сервер отвечает на /api/health) и время до готовности модели.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import write_results
+
+_PROBE = '''
+import json, sys, time
+start = time.time()
+import app
+imported = time.time() - start
+heavy = sorted(m for m in ('torch', 'ultralytics', 'sklearn', 'cv2', 'reportlab', 'pandas') if m in sys.modules)
+if app.Config.MODEL_LOADING == 'lazy':
+    app.get_analyzer()
+while app.model_state['status'] in ('not_loaded', 'loading'):
+    time.sleep(0.01)
+print(json.dumps({
+    'import_s': round(imported, 3),
+    'ready_s': round(time.time() - start, 3),
+    'model_status': app.model_state['status'],
+    'heavy_modules_at_import': heavy
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', default=['eager', 'background', 'lazy'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for mode in args.modes:
+        env = dict(os.environ, MODEL_LOADING=mode)
+        runs = []
+        for _ in range(args.repeat):
+            completed = subprocess.run(
+                [sys.executable, '-c', _PROBE], cwd=root, env=env,
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(completed.stderr)
+                break
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        if runs:
+            results.append({
+                'mode': mode,
+                'import_s': min(r['import_s'] for r in runs),
+                'ready_s': min(r['ready_s'] for r in runs),
+                'model_status': runs[-1]['model_status'],
+                'heavy_modules_at_import': runs[-1]['heavy_modules_at_import']
+            })
+
+    write_results('startup', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
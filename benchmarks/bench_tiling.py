@@ -0,0 +1,165 @@
+"""
+Тайловый анализ против уменьшения до 1024 px на широких панорамах полок.
+
+Без модели используется контурный детектор: он находит книги как связные
+области на входе сети (letterbox до 640 px), поэтому, как и YOLO, теряет
+корешки, которые после уменьшения сливаются с соседними. Точность считается
+по известной разметке синтетических панорам. С --model дополнительно
+замеряется задержка настоящего детектора на тех же изображениях.
+
+    python -m benchmarks.bench_tiling --widths 4000 8000 --model yolo_onnx
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_detector_backends import _iou_matrix
+from benchmarks.common import measure, write_results
+from config import Config
+from models.analyzer import BookShelfAnalyzer, DetectorBackend, create_detector_backend, letterbox
+
+
+class ContourDetector(DetectorBackend):
+    """Детектор-заглушка: связные области не цвета фона на входе сети"""
+
+    name = 'contours'
+    names = {0: 'book'}
+
+    def predict(self, images, conf, imgsz=None):
+        size = imgsz or 640
+        detections = []
+        for image in images:
+            canvas, scale, pad = letterbox(image, size, color=(255, 255, 255))
+            mask = (canvas.min(axis=2) < 200).astype(np.uint8)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+            x, y, w, h = stats[1:, :4].T.astype(np.float32)
+            keep = (w >= 2) & (h >= 2)
+            boxes = np.stack([x, y, x + w, y + h], axis=1)[keep]
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / scale
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / scale
+            detections.append(np.concatenate([
+                boxes, np.ones((len(boxes), 1)), np.zeros((len(boxes), 1))
+            ], axis=1).astype(np.float32))
+        return detections
+
+
+def synthetic_panorama(width: int, height: int, shelves: int, seed: int = 0):
+    """Панорама длинной полки: тонкие корешки с узкими просветами, возвращает изображение и разметку"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    pitch = height / shelves
+    boxes = []
+
+    for shelf in range(shelves):
+        bottom = int((shelf + 1) * pitch - pitch * 0.05)
+        x = int(rng.integers(5, 30))
+        while True:
+            spine = int(rng.integers(12, 32))
+            if x + spine >= width - 5:
+                break
+            top = bottom - int(rng.uniform(0.55, 0.9) * pitch)
+            color = tuple(int(c) for c in rng.integers(0, 170, 3))
+            cv2.rectangle(image, (x, top), (x + spine - 1, bottom - 1), color, -1)
+            boxes.append([x, top, x + spine, bottom])
+            x += spine + int(rng.integers(4, 9))
+
+    return image, np.asarray(boxes, dtype=np.float32)
+
+
+def _accuracy(found: np.ndarray, truth: np.ndarray, iou_threshold: float = 0.5) -> dict:
+    """Полнота и точность при жадном сопоставлении по IoU"""
+    matched = 0
+    if len(found) and len(truth):
+        iou = _iou_matrix(truth, found)
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < iou_threshold:
+                break
+            matched += 1
+            iou[i, :] = 0
+            iou[:, j] = 0
+    return {
+        'recall': round(matched / len(truth), 4) if len(truth) else 1.0,
+        'precision': round(matched / len(found), 4) if len(found) else 1.0
+    }
+
+
+def _analyzer(detector: DetectorBackend, tiled: bool, tile_size: int, overlap: int):
+    """Анализатор с готовым детектором, без загрузки модели с диска"""
+    analyzer = BookShelfAnalyzer.__new__(BookShelfAnalyzer)
+    analyzer.detector = detector
+    analyzer.config = {
+        'confidence_threshold': 0.5,
+        'batch_size': Config.ANALYSIS_BATCH_SIZE,
+        'tiled_inference': tiled,
+        'tile_size': tile_size,
+        'tile_overlap': overlap,
+        'tile_min_side': Config.TILE_MIN_SIDE,
+        'tile_max_side': Config.TILE_MAX_SIDE,
+        'tile_merge_threshold': Config.TILE_MERGE_THRESHOLD
+    }
+    return analyzer
+
+
+def _prepare(image: np.ndarray, max_size: int):
+    """Уменьшение, как в BookShelfAnalyzer._load_image"""
+    scale = min(1.0, max_size / max(image.shape[:2]))
+    if scale < 1:
+        image = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)),
+                           interpolation=cv2.INTER_LINEAR)
+    return image, scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--widths', type=int, nargs='+', default=[2000, 4000, 8000])
+    parser.add_argument('--height', type=int, default=1500)
+    parser.add_argument('--shelves', type=int, default=3)
+    parser.add_argument('--tile-size', type=int, default=Config.TILE_SIZE)
+    parser.add_argument('--overlap', type=int, default=Config.TILE_OVERLAP)
+    parser.add_argument('--model', help='ключ Config.MODEL_PATHS для замера задержки настоящего детектора')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    detectors = [ContourDetector()]
+    if args.model:
+        path = Config.MODEL_PATHS[args.model]
+        if os.path.exists(path):
+            detectors.append(create_detector_backend(path, {'iou_threshold': Config.IOU_THRESHOLD}))
+        else:
+            print(f"Модель {args.model} не найдена: {path}, пропускаю")
+
+    results = []
+    for width in args.widths:
+        panorama, truth = synthetic_panorama(width, args.height, args.shelves, seed=width)
+
+        for detector in detectors:
+            for mode, tiled in (('downscale', False), ('tiled', True)):
+                analyzer = _analyzer(detector, tiled, args.tile_size, args.overlap)
+                image, scale = _prepare(panorama, Config.TILE_MAX_SIDE if tiled else 1024)
+                books = analyzer._detect_books(image)
+                timing = measure(lambda: analyzer._detect_books(image), repeat=args.repeat)
+
+                row = {
+                    'detector': detector.name,
+                    'mode': mode,
+                    'image': f'{width}x{args.height}',
+                    'input': f'{image.shape[1]}x{image.shape[0]}',
+                    'books': len(truth),
+                    'found': len(books),
+                    'median_ms': round(timing['median'] * 1000, 2)
+                }
+                if isinstance(detector, ContourDetector):
+                    found = np.stack([books['x1'], books['y1'], books['x2'], books['y2']],
+                                     axis=1).astype(np.float32) / scale
+                    row.update(_accuracy(found, truth))
+                results.append(row)
+
+    write_results('tiling', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
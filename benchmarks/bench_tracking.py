@@ -0,0 +1,113 @@
+"""
+Потоковый анализ камеры с трекером сессии и без него.
+
+Последовательность кадров - окно синтетической полки с дрожанием камеры
+в несколько пикселей; детектор-заглушка случайно теряет часть книг, как
+настоящая модель на соседних кадрах. Сравниваются время на кадр, доля
+кадров без повторной сегментации полок и дрожание выдаваемых счетчиков
+(стандартное отклонение числа книг и доля кадров, где сменилось число полок).
+
+    python -m benchmarks.bench_tracking --frames 200 --dropout 0.05
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_tiling import ContourDetector, _analyzer, synthetic_panorama
+from benchmarks.common import write_results
+from models.shelf_segmentation import get_segmenter
+from models.tracker import ShelfTracker
+
+
+class DropoutDetector(ContourDetector):
+    """Контурный детектор, теряющий долю боксов и сдвигающий остальные на пару пикселей"""
+
+    name = 'contours+dropout'
+
+    def __init__(self, dropout: float, seed: int = 0):
+        self.dropout = dropout
+        self.rng = np.random.default_rng(seed)
+
+    def predict(self, images, conf, imgsz=None):
+        detections = []
+        for boxes in super().predict(images, conf, imgsz):
+            boxes = boxes[self.rng.random(len(boxes)) >= self.dropout]
+            boxes[:, :4] += self.rng.normal(0, 1.0, (len(boxes), 4)).astype(np.float32)
+            detections.append(boxes)
+        return detections
+
+
+def camera_frames(count: int, width: int, height: int, shake: int, seed: int = 0):
+    """JPEG-кадры окна панорамы со случайным смещением камеры"""
+    panorama, _ = synthetic_panorama(width + 4 * shake, height + 4 * shake, shelves=3, seed=seed)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        dx, dy = rng.integers(0, 2 * shake + 1, 2) + shake
+        crop = panorama[dy:dy + height, dx:dx + width]
+        frames.append(cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return frames
+
+
+def run(frames, dropout: float, tracker):
+    analyzer = _analyzer(DropoutDetector(dropout), False, 640, 0)
+    analyzer.shelf_segmenter = get_segmenter('gap')
+    segment = analyzer._detect_shelves
+    segment_time = []
+
+    def timed_segment(image, books):
+        start = time.perf_counter()
+        shelves = segment(image, books)
+        segment_time.append(time.perf_counter() - start)
+        return shelves
+
+    analyzer._detect_shelves = timed_segment
+
+    totals, shelf_counts, frame_ms = [], [], []
+    for data in frames:
+        start = time.perf_counter()
+        result = analyzer.analyze_frame(data, 640, tracker=tracker)
+        frame_ms.append((time.perf_counter() - start) * 1000)
+        stats = result.get('smoothed', result)
+        totals.append(stats['total_books'])
+        shelf_counts.append(result['shelf_count'])
+
+    totals = np.asarray(totals, dtype=np.float64)
+    return {
+        'median_frame_ms': round(float(np.median(frame_ms)), 2),
+        'segmentations': len(segment_time),
+        'segmentation_ms_total': round(sum(segment_time) * 1000, 2),
+        'total_books_mean': round(float(totals.mean()), 2),
+        'total_books_std': round(float(totals.std()), 3),
+        'frame_to_frame_change': round(float(np.abs(np.diff(totals)).mean()), 3),
+        'shelf_count_changes': int((np.diff(shelf_counts) != 0).sum())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--shake', type=int, default=4)
+    parser.add_argument('--dropout', type=float, nargs='+', default=[0.02, 0.05, 0.1])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    frames = camera_frames(args.frames, args.width, args.height, args.shake)
+    results = []
+    for dropout in args.dropout:
+        for mode, tracker in (('independent', None), ('tracked', ShelfTracker())):
+            row = {'mode': mode, 'frames': len(frames), 'dropout': dropout}
+            row.update(run(frames, dropout, tracker))
+            if tracker is not None:
+                row['tracks'] = tracker.stats()['tracks']
+            results.append(row)
+
+    write_results('tracking', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+
+
+def measure(fn, repeat: int = 5, warmup: int = 1) -> dict:
+    """Замеряет время вызова fn, возвращает статистику в секундах"""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'repeat': repeat
+    }
+
+
+def write_results(name: str, results: list, output: str = None) -> str:
+    """Печатает результаты и сохраняет их в JSON для отслеживания регрессий"""
+    payload = {
+        'benchmark': name,
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+    for row in results:
+        print(json.dumps(row, ensure_ascii=False))
+
+    if output is None:
+        output = os.path.join(os.path.dirname(__file__), 'results', f'{name}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+    print(f"Результаты сохранены: {output}")
+    return output
@@ -0,0 +1,143 @@
+"""
+Запуск всех офлайн-бенчмарков и сравнение с прошлым прогоном.
+
+Каждый бенчмарк выполняется в отдельном процессе и пишет JSON в каталог
+результатов. С --baseline времена (поля *_ms) сравниваются построчно с
+результатами из другого каталога; замедление больше --threshold считается
+регрессией, с --fail-on-regression код возврата 1. Бенчмарк детекторов
+(bench_detector_backends) требует фотографий и моделей и в набор не входит.
+
+    python -m benchmarks.run_all --quick --output-dir /tmp/bench
+    python -m benchmarks.run_all --baseline benchmarks/results --fail-on-regression
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import write_results
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Имя результата: модуль, аргументы полного и быстрого прогона
+SUITE = {
+    'pipeline': ('benchmarks.bench_pipeline', [], ['--books', '10', '500', '--repeat', '3', '--report-repeat', '1']),
+    'shelf_segmentation': ('benchmarks.bench_shelf_segmentation', [], ['--books', '100', '2000', '--repeat', '3']),
+    'db_insert': ('benchmarks.bench_db_insert', [], ['--books', '100', '1000', '--repeat', '3']),
+    'db_concurrency': ('benchmarks.bench_db_concurrency', [], ['--writers', '1', '4', '--seconds', '2']),
+    'decode': ('benchmarks.bench_decode', [], ['--sizes', '2000x1500', '4000x3000', '--repeat', '3']),
+    'tiling': ('benchmarks.bench_tiling', [], ['--widths', '4000', '--repeat', '1']),
+    'tracking': ('benchmarks.bench_tracking', [], ['--frames', '60', '--dropout', '0.05']),
+    'history': ('benchmarks.bench_history', ['--rows', '200000'], ['--rows', '20000', '--repeat', '3']),
+    'export': ('benchmarks.bench_export', [], ['--rows', '20000']),
+    'startup': ('benchmarks.bench_startup', [], ['--modes', 'lazy', '--repeat', '1'])
+}
+
+# Числовые параметры прогона, по которым строки должны совпадать
+IDENTITY_KEYS = ('books', 'rows', 'true_shelves', 'frames', 'dropout', 'writers', 'readers')
+
+
+def _flatten(row, prefix=''):
+    """Вложенные словари результата в плоский словарь с ключами через точку"""
+    flat = {}
+    for key, value in row.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{name}.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _is_timing(key):
+    return key.endswith('_ms') or key.endswith('.ms')
+
+
+def compare(baseline, current, threshold, min_ms):
+    """Строки с замедлением больше threshold (и не меньше min_ms по абсолютной величине)"""
+    regressions = []
+    for index, (old, new) in enumerate(zip(baseline, current)):
+        old, new = _flatten(old), _flatten(new)
+        # Строки сопоставляются по порядку; разные параметры прогона не сравниваются
+        labels = {k: v for k, v in new.items() if isinstance(v, str) or k in IDENTITY_KEYS}
+        if any(old.get(k) != v for k, v in labels.items()):
+            continue
+        for key, value in new.items():
+            previous = old.get(key)
+            if not _is_timing(key) or not isinstance(value, (int, float)) \
+                    or not isinstance(previous, (int, float)) or previous <= 0:
+                continue
+            if value - previous >= min_ms and value > previous * (1 + threshold):
+                regressions.append({
+                    'row': index,
+                    'labels': labels,
+                    'metric': key,
+                    'baseline_ms': previous,
+                    'current_ms': value,
+                    'change': round(value / previous - 1, 3)
+                })
+    return regressions
+
+
+def _load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=sorted(SUITE), help='запустить только эти бенчмарки')
+    parser.add_argument('--quick', action='store_true', help='уменьшенные размеры и число повторов')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--baseline', help='каталог с результатами прошлого прогона')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление (доля)')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='меньшие изменения считаются шумом')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary, regressions = [], []
+
+    for name in args.only or list(SUITE):
+        module, full_args, quick_args = SUITE[name]
+        output = os.path.join(args.output_dir, f'{name}.json')
+        command = [sys.executable, '-m', module] + (quick_args if args.quick else full_args) + ['--output', output]
+        print(f"== {name}: {' '.join(command[1:])}")
+
+        start = time.perf_counter()
+        completed = subprocess.run(command)
+        row = {
+            'benchmark': name,
+            'ok': completed.returncode == 0,
+            'seconds': round(time.perf_counter() - start, 2),
+            'output': output
+        }
+
+        if row['ok'] and args.baseline:
+            baseline_path = os.path.join(args.baseline, f'{name}.json')
+            if os.path.exists(baseline_path):
+                found = compare(_load_results(baseline_path), _load_results(output),
+                                args.threshold, args.min_ms)
+                row['regressions'] = len(found)
+                regressions.extend(dict(item, benchmark=name) for item in found)
+            else:
+                row['regressions'] = None
+        summary.append(row)
+
+    for item in regressions:
+        print(f"Регрессия {item['benchmark']} {item['labels']} {item['metric']}: "
+              f"{item['baseline_ms']} -> {item['current_ms']} мс (+{item['change']:.0%})")
+
+    write_results('suite', summary + regressions, os.path.join(args.output_dir, 'suite.json'))
+
+    failed = [row['benchmark'] for row in summary if not row['ok']]
+    if failed:
+        print(f"Завершились с ошибкой: {', '.join(failed)}")
+    if failed or (args.fail_on_regression and regressions):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Синтетические наборы детекций и истории анализов для бенчмарков.
+"""
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def synthetic_shelf_boxes(n_books: int, n_shelves: int, image_width: int = 1024,
+                          image_height: int = 1024, seed: int = 0) -> dict:
+    """Генерирует боксы книг, стоящих на n_shelves полках.
+
+    Книги прижаты к основанию полки, высота и ширина случайные. Возвращает
+    столбцы x1, y1, x2, y2 и истинный номер полки для каждой книги.
+    """
+    rng = np.random.default_rng(seed)
+    pitch = image_height / n_shelves
+
+    shelf = np.sort(rng.integers(0, n_shelves, n_books))
+    base = (shelf + 1) * pitch - pitch * 0.05 + rng.normal(0, pitch * 0.01, n_books)
+    height = rng.uniform(0.45, 0.85, n_books) * pitch
+    width = rng.uniform(0.2, 1.0, n_books) * max(image_width / max(n_books / n_shelves, 1), 4)
+    x1 = rng.uniform(0, image_width - width)
+
+    y2 = np.clip(base, 1, image_height - 1)
+    y1 = np.clip(y2 - height, 0, image_height - 2)
+
+    return {
+        'x1': x1.astype(np.int32),
+        'y1': y1.astype(np.int32),
+        'x2': (x1 + width).astype(np.int32),
+        'y2': y2.astype(np.int32),
+        'shelf': shelf.astype(np.int32)
+    }
+
+
+def synthetic_history_rows(start: int, stop: int, seed: int = 0) -> list:
+    """Строки analysis_records с номерами start..stop-1 (раз в 30 секунд с 2024-01-01)"""
+    rng = random.Random(seed * 1000003 + start)
+    origin = datetime(2024, 1, 1)
+    names = ['shelf', 'library', 'IMG', 'photo', 'bookcase', 'camera']
+    return [{
+        'timestamp': origin + timedelta(seconds=30 * i + rng.randint(0, 29)),
+        'filename': f'{rng.choice(names)}_{i}.jpg',
+        'original_path': f'/uploads/original/{i}.jpg',
+        'processed_path': f'/uploads/processed/{i}.jpg',
+        'total_books': rng.randint(0, 200),
+        'shelf_count': rng.randint(1, 6),
+        'average_fill': round(rng.uniform(0, 100), 2),
+        'processing_time': rng.uniform(0.2, 3.0),
+        'image_width': 1024,
+        'image_height': 768
+    } for i in range(start, stop)]
@@ -0,0 +1,207 @@
+"""
+Потоковый анализ камеры: кадры приходят бинарными POST-запросами, результаты
+уходят клиенту через Server-Sent Events.
+
+Кадры не сохраняются на диск. У сессии один слот под ожидающий кадр: новый
+кадр вытесняет еще не обработанный, поэтому при медленном инференсе
+анализируется самый свежий кадр, а очередь не растет. Состояние между
+кадрами (трекер книг) создается фабрикой state_factory на каждую сессию.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SessionLimitError(Exception):
+    """Достигнут предел одновременных сессий камеры"""
+
+
+class CameraSession:
+    """Сессия потока: слот последнего кадра, поток анализа и последний результат"""
+
+    def __init__(self, session_id, analyze, inference_lock, state=None):
+        self.id = session_id
+        self.created = time.time()
+        self.last_seen = self.created
+        self.closed = False
+
+        self._analyze = analyze
+        self._inference_lock = inference_lock
+        self.state = state
+        self._condition = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._result = None
+
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name=f'camera-{session_id}', daemon=True)
+        self._thread.start()
+
+    def push(self, data):
+        """Кладет кадр в слот; необработанный предыдущий кадр отбрасывается"""
+        with self._condition:
+            if self.closed:
+                raise ValueError('Сессия закрыта')
+            if self._frame is not None:
+                self.dropped += 1
+            self._seq += 1
+            self.received += 1
+            self.last_seen = time.time()
+            self._frame = (self._seq, data, self.last_seen)
+            self._condition.notify_all()
+            return self._seq
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._frame is not None or self.closed)
+                if self.closed:
+                    return
+                seq, data, received_at = self._frame
+                self._frame = None
+
+            try:
+                with self._inference_lock:
+                    inference_start = time.time()
+                    result = self._analyze(data, self.state)
+                result['inference_ms'] = round((time.time() - inference_start) * 1000, 1)
+            except Exception as e:
+                print(f"Ошибка анализа кадра камеры ({self.id}): {e}")
+                result = {'error': str(e)}
+
+            result['seq'] = seq
+            result['latency_ms'] = round((time.time() - received_at) * 1000, 1)
+
+            with self._condition:
+                if 'error' in result:
+                    self.failed += 1
+                else:
+                    self.processed += 1
+                result['dropped'] = self.dropped
+                self._result = result
+                self._condition.notify_all()
+
+    def wait_result(self, after_seq, timeout):
+        """Результат новее after_seq или None по таймауту/закрытию"""
+        def ready():
+            return self.closed or (self._result is not None and self._result['seq'] > after_seq)
+
+        with self._condition:
+            self._condition.wait_for(ready, timeout)
+            if self._result is not None and self._result['seq'] > after_seq:
+                return self._result
+            return None
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._frame = None
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            stats = {
+                'session_id': self.id,
+                'received': self.received,
+                'dropped': self.dropped,
+                'processed': self.processed,
+                'failed': self.failed,
+                'pending': self._frame is not None,
+                'age': round(time.time() - self.created, 1),
+                'idle': round(time.time() - self.last_seen, 1)
+            }
+        if hasattr(self.state, 'stats'):
+            stats['state'] = self.state.stats()
+        return stats
+
+
+class CameraStreamManager:
+    """Сессии потокового анализа; неактивные сессии закрываются по session_ttl.
+
+    analyze(data, state) получает байты кадра и состояние сессии,
+    созданное state_factory (None, если фабрика не задана).
+    """
+
+    def __init__(self, analyze, max_sessions=4, session_ttl=60, heartbeat=15, state_factory=None):
+        self.analyze = analyze
+        self.state_factory = state_factory
+        self.max_sessions = max(1, int(max_sessions))
+        self.session_ttl = session_ttl
+        self.heartbeat = heartbeat
+
+        # Один инференс за раз для всех сессий: модель общая
+        self._inference_lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self):
+        """Открывает новую сессию"""
+        self.reap()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError(
+                    f'Слишком много сессий камеры (максимум {self.max_sessions})'
+                )
+            state = self.state_factory() if self.state_factory is not None else None
+            session = CameraSession(uuid.uuid4().hex, self.analyze, self._inference_lock, state)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def reap(self):
+        """Закрывает сессии без кадров дольше session_ttl"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if now - s.last_seen > self.session_ttl]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            session.close()
+        return len(expired)
+
+    def iter_events(self, session):
+        """Поток SSE: событие detections на каждый новый результат, комментарий-пинг при простое"""
+        last_seq = 0
+        yield 'retry: 2000\n\n'
+        while not session.closed:
+            result = session.wait_result(last_seq, self.heartbeat)
+            if result is None:
+                # Пинг держит соединение открытым и заодно закрывает брошенные сессии
+                self.reap()
+                yield ': keepalive\n\n'
+                continue
+            last_seq = result['seq']
+            yield f"event: detections\ndata: {json.dumps(result, separators=(',', ':'))}\n\n"
+        yield 'event: closed\ndata: {}\n\n'
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'sessions': [session.stats() for session in sessions],
+            'max_sessions': self.max_sessions,
+            'session_ttl': self.session_ttl
+        }
+
+    def shutdown(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
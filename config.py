@@ -10,6 +10,21 @@ class Config:
         f'sqlite:///{os.path.join(BASE_DIR, "bookshelf.db")}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite: режим журнала и прагмы каждого соединения (см. db_setup.py)
+    # и пул соединений. С DB_WRITE_QUEUE вставки анализов из всех потоков
+    # выполняет один поток-писатель группами до DB_WRITE_BATCH в транзакции:
+    # хвост задержек записи короче, но пропускная способность немного ниже
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+    DB_BUSY_TIMEOUT = 10.0
+    DB_CACHE_SIZE_KB = 64 * 1024
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    DB_MAX_OVERFLOW = 16
+    DB_POOL_TIMEOUT = 30
+    DB_WRITE_QUEUE = os.environ.get('DB_WRITE_QUEUE', '0').lower() in ('1', 'true', 'yes')
+    DB_WRITE_BATCH = 32
+    DB_WRITE_QUEUE_MAX = 1000
+    
     # Папки для загрузки
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
     ORIGINAL_FOLDER = os.path.join(UPLOAD_FOLDER, 'original')
@@ -24,12 +39,139 @@ class Config:
     # Настройки моделей
     MODEL_PATHS = {
         'yolo': 'yolo.pt', 
+        'yolo_onnx': 'yolo.onnx',
+        'yolo_onnx_int8': 'yolo.int8.onnx'
     }
     
+    # Ключ модели из MODEL_PATHS; бэкенд выбирается по расширению файла:
+    # .pt - PyTorch, .onnx - ONNX Runtime на CPU
+    DETECTOR_MODEL = os.environ.get('DETECTOR_MODEL', 'yolo')
+    ONNX_THREADS = int(os.environ.get('ONNX_THREADS', 0))
+    
+    # Загрузка модели: 'background' - в фоне после старта, 'lazy' - при
+    # первом анализе, 'eager' - до запуска сервера
+    MODEL_LOADING = os.environ.get('MODEL_LOADING', 'background')
+    
     # Пороги уверенности
     CONFIDENCE_THRESHOLD = 0.5
     IOU_THRESHOLD = 0.45
     
+    # Алгоритм определения полок: 'gap' (разрывы по высоте) или 'kmeans'
+    SHELF_SEGMENTER = os.environ.get('SHELF_SEGMENTER', 'gap')
+    
+    # Очередь фоновых анализов
+    ASYNC_ANALYSIS = os.environ.get('ASYNC_ANALYSIS', '0').lower() in ('1', 'true', 'yes')
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+    ANALYSIS_QUEUE_MAX_PENDING = int(os.environ.get('ANALYSIS_QUEUE_MAX_PENDING', 32))
+    ANALYSIS_JOB_HISTORY = 1000
+    # Срок выполнения задания (секунды от постановки в очередь)
+    ANALYSIS_JOB_TIMEOUT = float(os.environ.get('ANALYSIS_JOB_TIMEOUT', 600))
+    # Неудачных запусков рабочего процесса подряд до отказа очереди
+    ANALYSIS_WORKER_MAX_START_FAILURES = int(os.environ.get('ANALYSIS_WORKER_MAX_START_FAILURES', 5))
+    ANALYSIS_WORKER_MAX_RESTART_DELAY = 60
+    
+    # Кэш результатов анализа по содержимому изображения
+    RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    RESULT_CACHE_PATH = os.path.join(BASE_DIR, 'analysis_cache.db')
+    RESULT_CACHE_MEMORY_ITEMS = 256
+    RESULT_CACHE_MAX_ITEMS = 10000
+    RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    
+    # Максимальный размер страницы истории
+    HISTORY_MAX_PER_PAGE = 100
+    
+    # Кэш и фоновый рендеринг отчетов
+    REPORT_CACHE_DIR = os.path.join(BASE_DIR, 'reports', 'cache')
+    REPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+    # Сколько запрос ждет рендера, прежде чем ответить 202 и продолжить в фоне
+    REPORT_RENDER_TIMEOUT = float(os.environ.get('REPORT_RENDER_TIMEOUT', 10))
+    REPORT_RETRY_AFTER = 2
+    # Миниатюры визуализаций для PDF (длинная сторона, пикселей)
+    REPORT_THUMBNAIL_DIR = os.path.join(BASE_DIR, 'reports', 'thumbnails')
+    REPORT_THUMBNAIL_SIZE = 800
+    # Максимум записей в сводном отчете
+    BATCH_REPORT_MAX_RECORDS = int(os.environ.get('BATCH_REPORT_MAX_RECORDS', 500))
+    
+    # Размер порции строк при потоковой выгрузке истории
+    EXPORT_CHUNK_SIZE = 5000
+    
+    # Окно детальной статистики по умолчанию (дней), переопределяется ?days=
+    STATS_WINDOW_DAYS = int(os.environ.get('STATS_WINDOW_DAYS', 7))
+    STATS_MAX_WINDOW_DAYS = 3660
+    
+    # Пакетный анализ
+    BATCH_MAX_FILES = 50
+    ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', 8))
+    ANALYSIS_BATCH_IMGSZ = 640
+    
+    # Тайловый анализ больших снимков: вместо уменьшения до 1024 px изображение
+    # режется на перекрывающиеся тайлы, боксы с соседних тайлов объединяются
+    TILED_INFERENCE = os.environ.get('TILED_INFERENCE', '0').lower() in ('1', 'true', 'yes')
+    TILE_SIZE = int(os.environ.get('TILE_SIZE', 640))
+    TILE_OVERLAP = int(os.environ.get('TILE_OVERLAP', 128))
+    TILE_MIN_SIDE = 1024
+    TILE_MAX_SIDE = int(os.environ.get('TILE_MAX_SIDE', 3072))
+    TILE_MERGE_THRESHOLD = 0.6
+    
+    # Визуализация результата: 'eager' - рисуется сразу при анализе,
+    # 'lazy' - по первому запросу /api/visualization/<id> из сохраненных
+    # детекций, 'none' - как lazy, но в ответе нет ссылки на изображение
+    RENDER_MODES = ('none', 'lazy', 'eager')
+    VISUALIZATION_RENDER = os.environ.get('VISUALIZATION_RENDER', 'eager')
+    CAMERA_RENDER = os.environ.get('CAMERA_RENDER', 'eager')
+    
+    # Потоковый анализ камеры (кадры не пишутся на диск)
+    CAMERA_STREAM_MAX_SESSIONS = int(os.environ.get('CAMERA_STREAM_MAX_SESSIONS', 4))
+    CAMERA_STREAM_SESSION_TTL = 60
+    CAMERA_STREAM_HEARTBEAT = 15
+    CAMERA_STREAM_MAX_SIDE = 640
+    CAMERA_STREAM_MAX_FRAME_BYTES = 4 * 1024 * 1024
+    
+    # Сопровождение книг между кадрами сессии: при стабильной раскладке
+    # полки не сегментируются заново (но не дольше CAMERA_TRACK_MAX_REUSE
+    # кадров подряд), счетчики сглаживаются с коэффициентом CAMERA_SMOOTHING
+    CAMERA_TRACKING = os.environ.get('CAMERA_TRACKING', '1').lower() in ('1', 'true', 'yes')
+    CAMERA_TRACK_IOU = 0.3
+    CAMERA_TRACK_MAX_MISSES = 5
+    CAMERA_TRACK_STABLE_RATIO = 0.85
+    CAMERA_TRACK_MAX_REUSE = 30
+    CAMERA_SMOOTHING = 0.3
+    
+    # Хранилище снимков с адресацией по содержимому (в ORIGINAL_FOLDER).
+    # Оригиналы старше IMAGE_RETENTION_DAYS или сверх IMAGE_STORE_MAX_BYTES
+    # заменяются превью IMAGE_PREVIEW_MAX_SIDE px; 0 - без ограничения
+    IMAGE_RETENTION_DAYS = int(os.environ.get('IMAGE_RETENTION_DAYS', 90))
+    IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 5 * 1024 ** 3))
+    IMAGE_PREVIEW_MAX_SIDE = 1024
+    # Визуализации рисуются заново по детекциям, поэтому хранятся недолго
+    PROCESSED_RETENTION_DAYS = int(os.environ.get('PROCESSED_RETENTION_DAYS', 30))
+    # Фоновая очистка: интервал (0 - отключена), файлов за проход, пауза
+    # между файлами и возраст, после которого файл без записи считается мусором
+    STORAGE_SWEEP_INTERVAL = int(os.environ.get('STORAGE_SWEEP_INTERVAL', 3600))
+    STORAGE_SWEEP_BATCH = 200
+    STORAGE_SWEEP_PAUSE = 0.01
+    STORAGE_ORPHAN_GRACE = 3600
+    
+    # Уменьшенные копии для истории (/api/image/<id>?w=): размер округляется
+    # вверх до одного из IMAGE_VARIANT_WIDTHS, копии IMAGE_VARIANT_PRECOMPUTE
+    # готовятся в фоне сразу после анализа. Браузер кэширует ответ
+    # IMAGE_VARIANT_MAX_AGE секунд, файлы копий живут IMAGE_VARIANT_RETENTION_DAYS
+    IMAGE_VARIANT_DIR = os.path.join(UPLOAD_FOLDER, 'variants')
+    IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+    IMAGE_VARIANT_PRECOMPUTE = (160, 640)
+    IMAGE_VARIANT_QUALITY = 80
+    IMAGE_VARIANT_MAX_AGE = 7 * 86400
+    IMAGE_VARIANT_RETENTION_DAYS = int(os.environ.get('IMAGE_VARIANT_RETENTION_DAYS', 30))
+    
+    # Удаление записей: записей на транзакцию; файлы удаляются в фоне
+    # порциями FILE_REAPER_BATCH с паузой FILE_REAPER_PAUSE между ними.
+    # clear_all переносит каталоги снимков в TRASH_FOLDER и удаляет их там
+    DELETE_CHUNK_SIZE = 500
+    FILE_REAPER_BATCH = 500
+    FILE_REAPER_PAUSE = 0.05
+    TRASH_FOLDER = os.path.join(UPLOAD_FOLDER, '.trash')
+    
     @staticmethod
     def init_app(app):
         # Создание необходимых папок
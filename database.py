@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+import base64
 import json
 
 db = SQLAlchemy()
@@ -7,6 +8,26 @@ db = SQLAlchemy()
 class AnalysisRecord(db.Model):
     """Модель для хранения истории анализов"""
     __tablename__ = 'analysis_records'
+    __table_args__ = (
+        db.Index('ix_analysis_records_timestamp', 'timestamp'),
+        db.Index('ix_analysis_records_filename', 'filename'),
+        db.Index('ix_analysis_records_average_fill', 'average_fill'),
+        db.Index('ix_analysis_records_total_books', 'total_books'),
+        # Проверка, используют ли файл другие записи, при удалении
+        db.Index('ix_analysis_records_original_path', 'original_path'),
+        db.Index('ix_analysis_records_processed_path', 'processed_path'),
+    )
+    
+    # Варианты сортировки истории: поле и порядок по убыванию
+    HISTORY_SORTS = {
+        'newest': ('timestamp', True),
+        'oldest': ('timestamp', False),
+        'most_books': ('total_books', True),
+        'least_books': ('total_books', False),
+        'most_filled': ('average_fill', True),
+        'least_filled': ('average_fill', False),
+        'name': ('filename', False)
+    }
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -17,7 +38,7 @@ class AnalysisRecord(db.Model):
     # Результаты анализа
     total_books = db.Column(db.Integer)
     shelf_count = db.Column(db.Integer)
-    fill_percentages = db.Column(db.Text)  # JSON массив процентов заполнения
+    fill_percentages = db.Column(db.Text)  # JSON массив (для совместимости, см. ShelfResult)
     average_fill = db.Column(db.Float)
     
     # Дополнительные данные
@@ -25,6 +46,14 @@ class AnalysisRecord(db.Model):
     image_width = db.Column(db.Integer)
     image_height = db.Column(db.Integer)
     
+    # Размер изображения, на котором получены координаты детекций
+    # (нужен для отложенной визуализации)
+    processed_width = db.Column(db.Integer)
+    processed_height = db.Column(db.Integer)
+    
+    # Длительность стадий анализа в секундах, JSON {стадия: время}
+    stage_timings = db.Column(db.Text)
+    
     def __init__(self, **kwargs):
         super(AnalysisRecord, self).__init__(**kwargs)
         if self.fill_percentages and isinstance(self.fill_percentages, list):
@@ -40,16 +69,85 @@ class AnalysisRecord(db.Model):
             'processed_path': self.processed_path,
             'total_books': self.total_books,
             'shelf_count': self.shelf_count,
-            'fill_percentages': json.loads(self.fill_percentages) if self.fill_percentages else [],
+            'fill_percentages': self.fill_percentages_list,
+            'shelves': [shelf.to_dict() for shelf in self.shelves],
             'average_fill': self.average_fill,
             'processing_time': self.processing_time,
             'image_width': self.image_width,
-            'image_height': self.image_height
+            'image_height': self.image_height,
+            'stage_timings': self.stage_timings_dict
         }
     
+    @classmethod
+    def history_query(cls, search=None, date=None, sort='newest', cursor=None):
+        """Запрос истории с поиском, фильтром по дате (UTC) и сортировкой.
+        
+        Порядок всегда дополняется id, поэтому пригоден для курсорной
+        пагинации: cursor - значение, полученное из history_cursor().
+        """
+        field, descending = cls.HISTORY_SORTS.get(sort, cls.HISTORY_SORTS['newest'])
+        column = getattr(cls, field)
+        query = cls.query
+        
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(cls.filename.ilike(f'%{escaped}%', escape='\\'))
+        
+        if date:
+            day = datetime.strptime(date, '%Y-%m-%d')
+            query = query.filter(cls.timestamp >= day, cls.timestamp < day + timedelta(days=1))
+        
+        if cursor:
+            try:
+                value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except TypeError:
+                raise ValueError('Некорректный курсор')
+            if not isinstance(last_id, int) or isinstance(value, (list, dict, bool)):
+                raise ValueError('Некорректный курсор')
+            if field == 'timestamp' and value is not None:
+                value = datetime.fromisoformat(value)
+            # (column, id) после курсора; первое условие использует индекс по column.
+            # SQLite ставит NULL первым при сортировке по возрастанию и последним
+            # по убыванию, поэтому записи с NULL в column обрабатываются отдельно
+            if value is None:
+                if descending:
+                    query = query.filter(column.is_(None), cls.id < last_id)
+                else:
+                    query = query.filter(column.is_(None) & (cls.id > last_id) | column.isnot(None))
+            elif descending:
+                query = query.filter(
+                    (column <= value) & ((column < value) | (cls.id < last_id)) | column.is_(None)
+                )
+            else:
+                query = query.filter(column >= value, (column > value) | (cls.id > last_id))
+        
+        if descending:
+            return query.order_by(column.desc(), cls.id.desc())
+        return query.order_by(column.asc(), cls.id.asc())
+    
+    def history_cursor(self, sort='newest'):
+        """Курсор для следующей страницы истории после этой записи"""
+        field, _ = self.HISTORY_SORTS.get(sort, self.HISTORY_SORTS['newest'])
+        value = getattr(self, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([value, self.id]).encode()).decode()
+    
+    @property
+    def stage_timings_dict(self):
+        """Возвращает stage_timings как словарь (пустой для старых записей)"""
+        if not self.stage_timings:
+            return {}
+        try:
+            return json.loads(self.stage_timings)
+        except ValueError:
+            return {}
+    
     @property
     def fill_percentages_list(self):
         """Возвращает fill_percentages как список"""
+        if self.shelves:
+            return [shelf.fill_percentage for shelf in self.shelves]
         if isinstance(self.fill_percentages, str):
             try:
                 return json.loads(self.fill_percentages)
@@ -62,6 +160,9 @@ class AnalysisRecord(db.Model):
 class BookDetection(db.Model):
     """Модель для хранения информации о детектированных книгах"""
     __tablename__ = 'book_detections'
+    __table_args__ = (
+        db.Index('ix_book_detections_analysis_id', 'analysis_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_records.id'))
@@ -83,4 +184,349 @@ class BookDetection(db.Model):
     shelf_number = db.Column(db.Integer)
     
     # Связь с записью анализа
-    analysis = db.relationship('AnalysisRecord', backref='detections')
\ No newline at end of file
+    analysis = db.relationship('AnalysisRecord', backref='detections')
+    
+    @staticmethod
+    def rows_from_books(analysis_id, books):
+        """Строки для пакетной вставки из словарей книг результата анализа"""
+        return [{
+            'analysis_id': analysis_id,
+            'x_min': book['bbox'][0],
+            'y_min': book['bbox'][1],
+            'x_max': book['bbox'][2],
+            'y_max': book['bbox'][3],
+            'width': book['width'],
+            'height': book['height'],
+            'confidence': book['confidence'],
+            'shelf_number': book.get('shelf_number')
+        } for book in books]
+
+class ShelfResult(db.Model):
+    """Модель для хранения результатов по отдельным полкам"""
+    __tablename__ = 'shelf_results'
+    __table_args__ = (
+        db.Index('ix_shelf_results_analysis_shelf', 'analysis_id', 'shelf_number', unique=True),
+        db.Index('ix_shelf_results_fill', 'fill_percentage'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_records.id'), nullable=False)
+    shelf_number = db.Column(db.Integer, nullable=False)
+    
+    # Границы полки по вертикали (нет у записей, перенесенных из JSON)
+    y1 = db.Column(db.Integer)
+    y2 = db.Column(db.Integer)
+    
+    book_count = db.Column(db.Integer)
+    fill_percentage = db.Column(db.Float)
+    
+    analysis = db.relationship('AnalysisRecord', backref=db.backref(
+        'shelves', order_by='ShelfResult.shelf_number', lazy='selectin',
+        cascade='all, delete-orphan'
+    ))
+    
+    def to_dict(self):
+        """Преобразование объекта в словарь"""
+        return {
+            'shelf_number': self.shelf_number,
+            'y1': self.y1,
+            'y2': self.y2,
+            'book_count': self.book_count,
+            'fill_percentage': self.fill_percentage
+        }
+
+def insert_detections(analysis_id, books):
+    """Пакетная вставка детекций одним executemany в текущей транзакции"""
+    rows = BookDetection.rows_from_books(analysis_id, books)
+    if rows:
+        db.session.execute(BookDetection.__table__.insert(), rows)
+    return len(rows)
+
+def insert_shelves(analysis_id, shelves, fill_percentages):
+    """Пакетная вставка полок анализа в текущей транзакции"""
+    rows = [{
+        'analysis_id': analysis_id,
+        'shelf_number': shelf['shelf_number'],
+        'y1': shelf.get('y1'),
+        'y2': shelf.get('y2'),
+        'book_count': shelf.get('book_count'),
+        'fill_percentage': fill_percentages[i] if i < len(fill_percentages) else None
+    } for i, shelf in enumerate(shelves)]
+    if rows:
+        db.session.execute(ShelfResult.__table__.insert(), rows)
+    return len(rows)
+
+def delete_records(ids, chunk_size=500):
+    """Удаляет записи анализа вместе с детекциями и полками пакетными DELETE.
+    
+    Каждая порция из chunk_size записей - отдельная транзакция, поэтому
+    блокировка записи SQLite не держится на все удаление; дневные агрегаты
+    затронутых дней пересчитываются в той же транзакции. Возвращает число
+    удаленных записей и пути их файлов (файлы не удаляются).
+    """
+    ids = sorted(set(ids))
+    deleted = 0
+    paths = set()
+    for start in range(0, len(ids), chunk_size):
+        rows = db.session.query(
+            AnalysisRecord.id, AnalysisRecord.timestamp,
+            AnalysisRecord.original_path, AnalysisRecord.processed_path
+        ).filter(AnalysisRecord.id.in_(ids[start:start + chunk_size])).all()
+        if not rows:
+            continue
+        found = [row.id for row in rows]
+        
+        try:
+            BookDetection.query.filter(BookDetection.analysis_id.in_(found))\
+                .delete(synchronize_session=False)
+            ShelfResult.query.filter(ShelfResult.analysis_id.in_(found))\
+                .delete(synchronize_session=False)
+            deleted += AnalysisRecord.query.filter(AnalysisRecord.id.in_(found))\
+                .delete(synchronize_session=False)
+            for day in sorted({row.timestamp.date() for row in rows if row.timestamp}):
+                DailyStats.rebuild(day)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        paths.update(path for row in rows for path in (row.original_path, row.processed_path) if path)
+    db.session.expire_all()
+    return deleted, paths
+
+def ensure_columns():
+    """Добавляет в существующие таблицы столбцы, появившиеся в моделях
+    
+    db.create_all() не меняет созданные ранее таблицы; новые столбцы
+    должны допускать NULL.
+    """
+    inspector = db.inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    )
+                    added.append(f'{table.name}.{column.name}')
+    return added
+
+def ensure_indexes():
+    """Создает индексы, объявленные в моделях, в уже существующих таблицах
+    
+    db.create_all() не добавляет новые индексы к созданным ранее таблицам.
+    """
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+def migrate_shelf_results(chunk_size=1000):
+    """Переносит fill_percentages из JSON старых записей в shelf_results.
+    
+    Идемпотентна: обрабатываются только записи без строк в shelf_results.
+    Число книг на полке берется из детекций, если у них есть номер полки.
+    """
+    has_shelves = db.session.query(ShelfResult.id)\
+        .filter(ShelfResult.analysis_id == AnalysisRecord.id)\
+        .exists()
+    pending = db.session.query(AnalysisRecord.id, AnalysisRecord.fill_percentages)\
+        .filter(AnalysisRecord.fill_percentages.notin_(['', '[]']), ~has_shelves)\
+        .order_by(AnalysisRecord.id)
+    
+    migrated = 0
+    last_id = 0
+    while True:
+        batch = pending.filter(AnalysisRecord.id > last_id).limit(chunk_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        
+        counts = dict(((a, n), c) for a, n, c in db.session.query(
+            BookDetection.analysis_id, BookDetection.shelf_number, db.func.count(BookDetection.id)
+        ).filter(
+            BookDetection.analysis_id.in_([row.id for row in batch]),
+            BookDetection.shelf_number.isnot(None)
+        ).group_by(BookDetection.analysis_id, BookDetection.shelf_number))
+        
+        rows = []
+        for analysis_id, raw in batch:
+            try:
+                fills = json.loads(raw) or []
+            except (TypeError, ValueError):
+                continue
+            if not fills:
+                continue
+            rows.extend({
+                'analysis_id': analysis_id,
+                'shelf_number': i + 1,
+                'y1': None,
+                'y2': None,
+                'book_count': counts.get((analysis_id, i + 1)),
+                'fill_percentage': fill
+            } for i, fill in enumerate(fills))
+            migrated += 1
+        
+        if rows:
+            db.session.execute(ShelfResult.__table__.insert(), rows)
+        db.session.commit()
+    return migrated
+
+class DailyStats(db.Model):
+    """Дневные агрегаты по анализам, поддерживаются при вставке и удалении записей"""
+    __tablename__ = 'daily_stats'
+    
+    date = db.Column(db.Date, primary_key=True)
+    
+    analyses = db.Column(db.Integer, nullable=False, default=0)
+    books = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Заполнение отдельных полок
+    fill_sum = db.Column(db.Float, nullable=False, default=0)
+    fill_count = db.Column(db.Integer, nullable=False, default=0)
+    fill_min = db.Column(db.Float)
+    fill_max = db.Column(db.Float)
+    
+    # Среднее заполнение по записям (average_fill)
+    average_fill_sum = db.Column(db.Float, nullable=False, default=0)
+    average_fill_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Время обработки
+    processing_time_sum = db.Column(db.Float, nullable=False, default=0)
+    processing_time_min = db.Column(db.Float)
+    processing_time_max = db.Column(db.Float)
+    
+    # Распределение записей по среднему заполнению
+    open_count = db.Column(db.Integer, nullable=False, default=0)
+    closed_count = db.Column(db.Integer, nullable=False, default=0)
+    full_count = db.Column(db.Integer, nullable=False, default=0)
+    partial_count = db.Column(db.Integer, nullable=False, default=0)
+    empty_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    _SUM_FIELDS = ('analyses', 'books', 'fill_sum', 'fill_count', 'average_fill_sum',
+                   'average_fill_count', 'processing_time_sum', 'open_count',
+                   'closed_count', 'full_count', 'partial_count', 'empty_count')
+    _MIN_FIELDS = ('fill_min', 'processing_time_min')
+    _MAX_FIELDS = ('fill_max', 'processing_time_max')
+    
+    @staticmethod
+    def contribution(record, fills):
+        """Вклад одной записи анализа в дневные агрегаты"""
+        average_fill = record.average_fill
+        processing_time = record.processing_time or 0
+        return {
+            'analyses': 1,
+            'books': record.total_books or 0,
+            'fill_sum': float(sum(fills)),
+            'fill_count': len(fills),
+            'fill_min': float(min(fills)) if fills else None,
+            'fill_max': float(max(fills)) if fills else None,
+            'average_fill_sum': average_fill or 0,
+            'average_fill_count': 1 if average_fill is not None else 0,
+            'processing_time_sum': processing_time,
+            'processing_time_min': processing_time,
+            'processing_time_max': processing_time,
+            'open_count': int(bool(average_fill) and average_fill > 50),
+            'closed_count': int(bool(average_fill) and average_fill <= 50),
+            'full_count': int(bool(average_fill) and average_fill > 80),
+            'partial_count': int(bool(average_fill) and 30 <= average_fill <= 80),
+            'empty_count': int(bool(average_fill) and average_fill < 30)
+        }
+    
+    @classmethod
+    def add_record(cls, record, fills):
+        """Учитывает новую запись в агрегатах ее дня (в текущей транзакции)"""
+        day = (record.timestamp or datetime.utcnow()).date()
+        values = cls.contribution(record, fills)
+        
+        # UPDATE ... SET x = x + ? без чтения строки, чтобы параллельные
+        # вставки не теряли обновления
+        updates = {getattr(cls, f): getattr(cls, f) + values[f] for f in cls._SUM_FIELDS}
+        for field in cls._MIN_FIELDS + cls._MAX_FIELDS:
+            if values[field] is None:
+                continue
+            column = getattr(cls, field)
+            better = column > values[field] if field in cls._MIN_FIELDS else column < values[field]
+            updates[column] = db.case((column.is_(None) | better, values[field]), else_=column)
+        
+        updated = db.session.execute(
+            db.update(cls).where(cls.date == day).values(updates)
+        ).rowcount
+        if not updated:
+            db.session.add(cls(date=day, **values))
+            db.session.flush()
+    
+    @classmethod
+    def rebuild(cls, day=None):
+        """Пересчитывает агрегаты дня (или всех дней) агрегатными SQL-запросами"""
+        record_day = db.func.date(AnalysisRecord.timestamp)
+        average_fill = AnalysisRecord.average_fill
+        processing_time = db.func.coalesce(AnalysisRecord.processing_time, 0)
+        
+        def count_if(condition):
+            return db.func.sum(db.case((condition, 1), else_=0))
+        
+        records = db.session.query(
+            record_day,
+            db.func.count(AnalysisRecord.id),
+            db.func.sum(db.func.coalesce(AnalysisRecord.total_books, 0)),
+            db.func.sum(db.func.coalesce(average_fill, 0)),
+            db.func.count(average_fill),
+            db.func.sum(processing_time),
+            db.func.min(processing_time),
+            db.func.max(processing_time),
+            count_if(average_fill > 50),
+            count_if((average_fill != 0) & (average_fill <= 50)),
+            count_if(average_fill > 80),
+            count_if(average_fill.between(30, 80)),
+            count_if((average_fill != 0) & (average_fill < 30))
+        ).group_by(record_day)
+        
+        shelves = db.session.query(
+            record_day,
+            db.func.sum(ShelfResult.fill_percentage),
+            db.func.count(ShelfResult.fill_percentage),
+            db.func.min(ShelfResult.fill_percentage),
+            db.func.max(ShelfResult.fill_percentage)
+        ).join(ShelfResult, ShelfResult.analysis_id == AnalysisRecord.id).group_by(record_day)
+        
+        if day is not None:
+            start = datetime.combine(day, datetime.min.time())
+            window = (AnalysisRecord.timestamp >= start,
+                      AnalysisRecord.timestamp < start + timedelta(days=1))
+            records = records.filter(*window)
+            shelves = shelves.filter(*window)
+            cls.query.filter_by(date=day).delete()
+        else:
+            cls.query.delete()
+        
+        shelf_stats = {row[0]: row[1:] for row in shelves}
+        rebuilt = 0
+        for row in records:
+            fill_sum, fill_count, fill_min, fill_max = shelf_stats.get(row[0], (0, 0, None, None))
+            db.session.add(cls(
+                date=datetime.strptime(str(row[0]), '%Y-%m-%d').date(),
+                analyses=row[1], books=row[2],
+                fill_sum=fill_sum or 0, fill_count=fill_count, fill_min=fill_min, fill_max=fill_max,
+                average_fill_sum=row[3], average_fill_count=row[4],
+                processing_time_sum=row[5], processing_time_min=row[6], processing_time_max=row[7],
+                open_count=row[8], closed_count=row[9], full_count=row[10],
+                partial_count=row[11], empty_count=row[12]
+            ))
+            rebuilt += 1
+        return rebuilt
+    
+    @classmethod
+    def window_start(cls, days):
+        """Первый день окна из days последних дней (включая сегодня, UTC)"""
+        return datetime.utcnow().date() - timedelta(days=max(1, days) - 1)
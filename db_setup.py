@@ -0,0 +1,169 @@
+"""
+Настройка SQLite для параллельной работы.
+
+engine_options() - параметры пула соединений для SQLALCHEMY_ENGINE_OPTIONS,
+configure_sqlite() - прагмы на каждом новом соединении: WAL (читатели не
+ждут писателя и наоборот), synchronous=NORMAL (в режиме WAL fsync только при
+checkpoint, целостность базы сохраняется), busy_timeout и кэш страниц.
+WriteQueue выполняет записи из многих потоков в одном потоке-писателе и
+фиксирует их группами: писатели не конкурируют за блокировку базы, а один
+COMMIT приходится на несколько вставок.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri, pool_size=5, max_overflow=10, pool_timeout=30, busy_timeout=5.0):
+    """SQLALCHEMY_ENGINE_OPTIONS для файла SQLite; для других баз - пустой словарь"""
+    if not is_sqlite_file(uri):
+        return {}
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        # Соединение из пула может достаться другому потоку
+        'connect_args': {'timeout': busy_timeout, 'check_same_thread': False}
+    }
+
+
+def configure_sqlite(engine, journal_mode='WAL', synchronous='NORMAL', busy_timeout=5.0,
+                     cache_size_kb=64 * 1024):
+    """Устанавливает прагмы на каждом новом соединении engine; для других баз ничего не делает"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # Режим журнала хранится в файле базы, остальные прагмы - в соединении
+            if journal_mode:
+                cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+            cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout * 1000)}')
+            # Отрицательное значение - размер в КиБ, а не в страницах
+            cursor.execute(f'PRAGMA cache_size={-int(cache_size_kb)}')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+        finally:
+            cursor.close()
+
+    return True
+
+
+def sqlite_settings(engine):
+    """Действующие прагмы соединения (для проверки настройки)"""
+    if engine.dialect.name != 'sqlite':
+        return {}
+    with engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size')
+        }
+
+
+class WriteQueue:
+    """Поток-писатель: задания из любых потоков выполняются по очереди.
+
+    Задание - функция, работающая с session в контексте приложения без
+    фиксации. До max_batch заданий подряд фиксируются одним COMMIT; если
+    группа не удалась, она откатывается и задания повторяются по одному,
+    чтобы ошибка одного не отменила остальные. submit() возвращает Future
+    с результатом функции после фиксации; при max_pending ожидающих
+    заданий submit() ждет места в очереди.
+    """
+
+    def __init__(self, app, session, max_batch=32, max_pending=1000):
+        self.app = app
+        self.session = session
+        self.max_batch = max_batch
+
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.wait_time = 0.0
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, time.perf_counter(), fn, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            started = time.perf_counter()
+            self.wait_time += sum(started - queued for _, queued, _, _, _ in batch)
+            try:
+                with self.app.app_context():
+                    self._write([entry for entry in batch if entry[0].set_running_or_notify_cancel()])
+            except Exception as e:
+                print(f"Ошибка потока записи в базу: {e}")
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            results = [fn(*args, **kwargs) for _, _, fn, args, kwargs in batch]
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            if len(batch) == 1:
+                self.failed += 1
+                batch[0][0].set_exception(e)
+                return
+            for entry in batch:
+                self._write([entry])
+            return
+
+        self.batches += 1
+        self.committed += len(batch)
+        for (future, *_), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'committed': self.committed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'average_batch': round(self.committed / self.batches, 2) if self.batches else 0,
+            'average_wait_ms': round(self.wait_time / (self.committed + self.failed) * 1000, 2)
+            if self.committed + self.failed else 0
+        }
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,160 @@
+"""
+Потоковая выгрузка истории анализов в CSV, NDJSON и Parquet.
+
+Строки читаются из базы порциями (yield_per), а ответ формируется
+генератором, поэтому память не зависит от размера истории.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from database import db, AnalysisRecord, BookDetection, ShelfResult
+
+EXPORT_TABLES = {
+    'records': AnalysisRecord.__table__,
+    'shelves': ShelfResult.__table__,
+    'detections': BookDetection.__table__
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+class ExportError(ValueError):
+    """Некорректные параметры выгрузки"""
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(table, chunk_size=5000):
+    """Строки таблицы по возрастанию id, порциями по chunk_size"""
+    statement = db.select(table).order_by(table.c.id)
+    result = db.session.execute(
+        statement.execution_options(yield_per=chunk_size, stream_results=True)
+    )
+    for partition in result.partitions():
+        yield partition
+
+
+def iter_csv(table, chunk_size=5000):
+    """CSV с заголовком; отдается блоками по мере заполнения буфера"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in table.columns])
+
+    for partition in iter_rows(table, chunk_size):
+        writer.writerows(
+            [_json_value(value) for value in row] for row in partition
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(tables, chunk_size=5000):
+    """По одному JSON-объекту на строку; при нескольких таблицах добавляется поле table"""
+    for name, table in tables:
+        columns = [column.name for column in table.columns]
+        for partition in iter_rows(table, chunk_size):
+            lines = []
+            for row in partition:
+                item = dict(zip(columns, map(_json_value, row)))
+                if len(tables) > 1:
+                    item['table'] = name
+                lines.append(json.dumps(item, ensure_ascii=False))
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файловый объект для pyarrow: накапливает записанные байты до выдачи"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_type(column):
+    import pyarrow as pa
+
+    python_type = column.type.python_type
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is datetime:
+        return pa.timestamp('us')
+    if python_type is date:
+        return pa.date32()
+    return pa.string()
+
+
+def iter_parquet(table, chunk_size=5000):
+    """Parquet: каждая порция строк записывается отдельной группой строк"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column.name, _arrow_type(column)) for column in table.columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for partition in iter_rows(table, chunk_size):
+            columns = list(zip(*partition))
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt, table='records', chunk_size=5000):
+    """Возвращает (генератор байтов, mimetype, расширение файла)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Неподдерживаемый формат выгрузки: {fmt}")
+    if table != 'all' and table not in EXPORT_TABLES:
+        raise ExportError(f"Неизвестная таблица: {table}")
+    if table == 'all' and fmt != 'ndjson':
+        raise ExportError("Выгрузка всех таблиц в одном файле доступна только в формате ndjson")
+
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Для выгрузки в Parquet установите пакет pyarrow")
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    if fmt == 'ndjson':
+        tables = list(EXPORT_TABLES.items()) if table == 'all' else [(table, EXPORT_TABLES[table])]
+        return iter_ndjson(tables, chunk_size), mimetype, extension
+    if fmt == 'csv':
+        return iter_csv(EXPORT_TABLES[table], chunk_size), mimetype, extension
+    return iter_parquet(EXPORT_TABLES[table], chunk_size), mimetype, extension
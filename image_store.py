@@ -0,0 +1,468 @@
+"""
+Хранилище снимков с адресацией по содержимому и политика хранения.
+
+Снимок сохраняется под именем SHA-256 своего содержимого в каталоге из
+первых символов хэша (ab/cd/<hash>.jpg), поэтому повторная загрузка того же
+файла не создает копию. Полноразмерные оригиналы старше retention_days или
+сверх max_bytes заменяются превью в размере анализа: детекции в базе
+остаются, а визуализацию можно нарисовать заново по превью.
+"""
+import collections
+import hashlib
+import os
+import threading
+import time
+
+PREVIEW_DIR = 'previews'
+
+
+def _remove(path):
+    """Удаляет файл; возвращает освобожденный размер (0, если файла уже нет)"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _source_key(path):
+    """Префикс имен уменьшенных копий файла"""
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+
+
+def make_thumbnail(image_path: str, thumb_dir: str, max_size: int = 800, quality: int = 80) -> str:
+    """Уменьшенная копия изображения (отчеты, история); создается один раз и берется из кэша
+    
+    Для JPEG используется draft-режим: декодер сразу уменьшает изображение
+    в 2-8 раз, не распаковывая полное разрешение.
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None
+    
+    stat = os.stat(image_path)
+    source = _source_key(image_path)
+    thumb_path = os.path.join(
+        thumb_dir, f"{source}_{stat.st_size}_{stat.st_mtime_ns}_{max_size}_{quality}.jpg"
+    )
+    if os.path.exists(thumb_path):
+        return thumb_path
+    
+    os.makedirs(thumb_dir, exist_ok=True)
+    from PIL import Image
+    
+    tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(image_path) as img:
+            img.draft('RGB', (max_size, max_size))
+            img = img.convert('RGB')
+            img.thumbnail((max_size, max_size))
+            img.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+        os.replace(tmp_path, thumb_path)
+    except FileNotFoundError:
+        # Исходный файл или его копии удалены во время создания - отмена, а не ошибка
+        _remove(tmp_path)
+        return None
+    return thumb_path
+
+
+def sweep_directory(folder, referenced, max_age=0, orphan_grace=3600, batch=200, pause=0.0, now=None):
+    """Удаляет из плоского каталога файлы старше max_age секунд и файлы без ссылок старше orphan_grace.
+
+    Возвращает список удаленных путей. За вызов удаляется не больше batch
+    файлов, между удалениями - пауза pause, чтобы не забивать диск.
+    """
+    now = now or time.time()
+    removed = []
+    try:
+        entries = sorted(os.scandir(folder), key=lambda e: e.stat().st_mtime)
+    except FileNotFoundError:
+        return removed
+
+    for entry in entries:
+        if len(removed) >= batch:
+            break
+        if not entry.is_file():
+            continue
+        age = now - entry.stat().st_mtime
+        path = os.path.normpath(entry.path)
+        expired = max_age and age > max_age
+        orphan = path not in referenced and age > orphan_grace
+        if expired or orphan:
+            _remove(path)
+            removed.append(path)
+            if pause:
+                time.sleep(pause)
+    return removed
+
+
+class ImageStore:
+    """Каталог оригиналов: ab/cd/<sha256>.<ext> и превью в previews/ab/<имя>.jpg"""
+
+    def __init__(self, root, max_bytes=0, retention_days=0, preview_max_side=1024, preview_quality=85):
+        self.root = os.path.normpath(root)
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.preview_max_side = preview_max_side
+        self.preview_quality = preview_quality
+
+        self.stored = 0
+        self.deduplicated = 0
+        self.last_sweep = None
+        self._lock = threading.Lock()
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest[2:4], f'{digest}.{ext.lower()}')
+
+    def put(self, data, ext):
+        """Сохраняет снимок и возвращает его путь; тот же снимок повторно не записывается"""
+        path = self.path_for(hashlib.sha256(data).hexdigest(), ext)
+        with self._lock:
+            if os.path.exists(path):
+                # Повторная загрузка продлевает срок хранения оригинала
+                os.utime(path)
+                self.deduplicated += 1
+                return path
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.stored += 1
+            return path
+
+    def preview_path(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.root, PREVIEW_DIR, name[:2], f'{name}.jpg')
+
+    def resolve(self, path):
+        """Существующий файл снимка: оригинал, иначе превью, иначе None"""
+        if not path:
+            return None
+        if os.path.exists(path):
+            return path
+        preview = self.preview_path(path)
+        return preview if os.path.exists(preview) else None
+
+    def discard(self, path):
+        """Удаляет оригинал и превью снимка"""
+        if path:
+            _remove(path)
+            _remove(self.preview_path(path))
+
+    def discard_unreferenced(self, paths, is_referenced):
+        """Удаляет файлы paths ({путь: время постановки в очередь}) без ссылок из записей.
+
+        Проверка ссылок и удаление идут под блокировкой put(): повторная
+        загрузка того же снимка либо завершилась раньше и обновила mtime
+        (такой файл новее постановки в очередь и остается), либо запишет
+        файл заново после удаления. Возвращает удаленные пути.
+        """
+        removed = []
+        with self._lock:
+            keep = is_referenced(list(paths))
+            for path, queued_at in paths.items():
+                if path in keep:
+                    continue
+                try:
+                    if os.path.getmtime(path) > queued_at:
+                        continue
+                except FileNotFoundError:
+                    pass
+                self.discard(path)
+                removed.append(path)
+        return removed
+
+    def make_preview(self, path):
+        """Сохраняет уменьшенную копию оригинала в размере анализа"""
+        import cv2
+        from models.analyzer import decode_image
+
+        with open(path, 'rb') as f:
+            image, _, _ = decode_image(f.read(), self.preview_max_side)
+        preview = self.preview_path(path)
+        os.makedirs(os.path.dirname(preview), exist_ok=True)
+        if not cv2.imwrite(preview, image, [cv2.IMWRITE_JPEG_QUALITY, self.preview_quality]):
+            raise ValueError(f"Не удалось сохранить превью: {preview}")
+        return preview
+
+    def originals(self):
+        """Оригиналы в хранилище (включая файлы старой плоской раскладки): путь, размер, mtime"""
+        files = []
+        for directory, subdirs, names in os.walk(self.root):
+            if directory == self.root and PREVIEW_DIR in subdirs:
+                subdirs.remove(PREVIEW_DIR)
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def sweep(self, referenced, batch=200, pause=0.0, orphan_grace=3600, now=None, is_referenced=None):
+        """Один проход политики хранения.
+
+        Снимки без записей (старше orphan_grace) удаляются. Оригиналы записей
+        старше retention_days, а также самые старые сверх max_bytes,
+        заменяются превью. За проход обрабатывается не больше batch файлов.
+
+        referenced - пути из записей на начало прохода; перед удалением
+        каждого файла под блокировкой put() перечитывается его mtime (повторная
+        загрузка продлевает срок), а для снимка без записей ссылки
+        перепроверяются через is_referenced(paths), как в discard_unreferenced.
+        """
+        now = now or time.time()
+        files = sorted(self.originals(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        report = {'scanned': len(files), 'orphans_removed': 0, 'evicted': 0, 'freed_bytes': 0, 'errors': 0}
+        max_age = self.retention_days * 86400 if self.retention_days else 0
+
+        def due(orphan, mtime):
+            age = now - mtime
+            if orphan:
+                return age > orphan_grace
+            return bool(max_age and age > max_age) or bool(self.max_bytes and total > self.max_bytes)
+
+        processed = 0
+        for path, size, mtime in files:
+            if processed >= batch:
+                break
+            orphan = path not in referenced
+            if not due(orphan, mtime):
+                continue
+
+            processed += 1
+            try:
+                with self._lock:
+                    try:
+                        mtime = os.path.getmtime(path)
+                    except FileNotFoundError:
+                        continue
+                    if orphan and is_referenced is not None and path in is_referenced([path]):
+                        orphan = False
+                    if not due(orphan, mtime):
+                        continue
+                    if orphan:
+                        freed = _remove(path) + _remove(self.preview_path(path))
+                        report['orphans_removed'] += 1
+                    else:
+                        freed = size - os.path.getsize(self.make_preview(path))
+                        _remove(path)
+                        report['evicted'] += 1
+                total -= size
+                report['freed_bytes'] += max(freed, 0)
+            except Exception as e:
+                print(f"Ошибка очистки хранилища ({path}): {e}")
+                report['errors'] += 1
+            if pause:
+                time.sleep(pause)
+
+        report['bytes'] = total
+        self.last_sweep = dict(report, finished_at=now)
+        return report
+
+    def stats(self):
+        files = self.originals()
+        return {
+            'originals': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'max_bytes': self.max_bytes,
+            'retention_days': self.retention_days,
+            'stored': self.stored,
+            'deduplicated': self.deduplicated,
+            'last_sweep': self.last_sweep
+        }
+
+
+class ImageVariants:
+    """Дисковый кэш уменьшенных копий снимков и визуализаций для страниц истории.
+
+    Запрошенный размер округляется вверх до одного из widths (по большей
+    стороне), поэтому на один снимок приходится не больше len(widths) файлов.
+    """
+
+    def __init__(self, root, widths, quality=80):
+        self.root = os.path.normpath(root)
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.generated = 0
+
+    def width_for(self, requested):
+        for width in self.widths:
+            if width >= requested:
+                return width
+        return self.widths[-1]
+
+    def get(self, path, requested):
+        """Путь к копии не больше requested px (создается при первом запросе); None, если снимка нет"""
+        return make_thumbnail(path, self.root, self.width_for(requested), self.quality)
+
+    def precompute(self, paths, widths):
+        """Готовит копии заранее; вызывается в фоне после анализа"""
+        for path in paths:
+            for width in widths:
+                try:
+                    if self.get(path, width):
+                        self.generated += 1
+                except Exception as e:
+                    print(f"Ошибка подготовки копии {width}px ({path}): {e}")
+
+    def discard(self, paths):
+        """Удаляет все копии файлов paths за один проход по каталогу"""
+        keys = {_source_key(path) for path in paths}
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return removed
+        for entry in entries:
+            if entry.name[:16] in keys:
+                _remove(entry.path)
+                removed += 1
+        return removed
+
+    def sweep(self, max_age, batch=200, pause=0.0):
+        """Удаляет копии старше max_age секунд; нужные создадутся заново по запросу"""
+        if not max_age:
+            return []
+        return sweep_directory(self.root, set(), max_age=max_age, orphan_grace=max_age,
+                               batch=batch, pause=pause)
+
+    def stats(self):
+        try:
+            files = [entry.stat().st_size for entry in os.scandir(self.root) if entry.is_file()]
+        except FileNotFoundError:
+            files = []
+        return {
+            'files': len(files),
+            'bytes': sum(files),
+            'widths': list(self.widths),
+            'generated': self.generated
+        }
+
+
+class FileReaper:
+    """Фоновое удаление файлов удаленных записей порциями по batch.
+
+    Порция передается в remove({путь: время постановки в очередь}), который
+    сам проверяет, что на файл больше не ссылаются записи (одинаковые снимки
+    хранятся одним файлом), и возвращает удаленные пути. Каталоги из
+    remove_tree удаляются целиком. Между порциями - пауза pause.
+    """
+
+    def __init__(self, remove, batch=500, pause=0.0):
+        self.remove = remove
+        self.batch = batch
+        self.pause = pause
+
+        self.removed = 0
+        self.kept = 0
+        self.errors = 0
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='file-reaper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, paths):
+        """Ставит файлы в очередь на удаление"""
+        queued_at = time.time()
+        with self._lock:
+            self._queue.extend(('file', path, queued_at) for path in paths if path)
+            self._wakeup.set()
+
+    def remove_tree(self, path):
+        """Ставит в очередь удаление каталога со всем содержимым"""
+        with self._lock:
+            self._queue.append(('tree', path, time.time()))
+            self._wakeup.set()
+
+    def _next_batch(self):
+        with self._lock:
+            items = [self._queue.popleft() for _ in range(min(self.batch, len(self._queue)))]
+            if not items:
+                self._wakeup.clear()
+            return items
+
+    def _run(self):
+        while not self._stop.is_set():
+            items = self._next_batch()
+            if not items:
+                self._wakeup.wait()
+                continue
+            try:
+                self._reap(items)
+            except Exception as e:
+                print(f"Ошибка фонового удаления файлов: {e}")
+                self.errors += 1
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _reap(self, items):
+        files = {}
+        for kind, path, queued_at in items:
+            if kind == 'tree':
+                self._remove_tree(path)
+            else:
+                files[path] = max(queued_at, files.get(path, 0))
+
+        if files:
+            removed = self.remove(files)
+            self.removed += len(removed)
+            self.kept += len(files) - len(removed)
+
+    def _remove_tree(self, root):
+        """Удаляет каталог снизу вверх, делая паузу после каждых batch файлов"""
+        count = 0
+        for directory, _, names in os.walk(root, topdown=False):
+            for name in names:
+                _remove(os.path.join(directory, name))
+                count += 1
+                if self.pause and count % self.batch == 0:
+                    time.sleep(self.pause)
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        self.removed += count
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._queue)
+        return {'pending': pending, 'removed': self.removed, 'kept': self.kept, 'errors': self.errors}
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+
+class StorageSweeper:
+    """Фоновый поток, запускающий очистку раз в interval секунд"""
+
+    def __init__(self, sweep, interval):
+        self.sweep = sweep
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='storage-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        # Первый проход - через interval, чтобы не нагружать диск при старте
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Ошибка фоновой очистки хранилища: {e}")
+
+    def stop(self):
+        self._stop.set()
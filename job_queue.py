@@ -0,0 +1,433 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFullError(Exception):
+    """Очередь анализов переполнена"""
+
+
+class QueueUnavailableError(Exception):
+    """Рабочие процессы не запускаются (например, не загружается модель)"""
+
+
+def _worker_main(analyzer_config, tasks, events, cancelled_seq):
+    """Рабочий процесс: держит собственный анализатор и обрабатывает задания.
+
+    Задания с номером не больше cancelled_seq (отменены при отказе очереди)
+    и с истекшим сроком пропускаются без анализа.
+    """
+    from models.analyzer import BookShelfAnalyzer
+
+    pid = os.getpid()
+    try:
+        analyzer = BookShelfAnalyzer(analyzer_config)
+    except Exception as e:
+        events.put(('failed_start', None, pid, str(e)))
+        return
+
+    events.put(('ready', None, pid, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        job_id, seq, image_path, render, deadline = task
+        if seq <= cancelled_seq.value or (deadline and time.time() > deadline):
+            events.put(('skipped', job_id, pid, seq))
+            continue
+        events.put(('started', job_id, pid, seq))
+
+        try:
+            results = analyzer.analyze_image(image_path, render=render)
+        except Exception as e:
+            results = {'success': False, 'error': str(e)}
+
+        events.put(('finished', job_id, pid, results))
+
+
+class AnalysisJobQueue:
+    """Очередь фоновых анализов с пулом рабочих процессов.
+
+    Упавший рабочий процесс перезапускается; после неудачного запуска
+    (процесс завершился, не загрузив модель) - с экспоненциальной паузой до
+    max_restart_delay. Если ни один процесс не готов, а неудачных запусков
+    подряд max_start_failures, очередь считается недоступной: ожидающие
+    задания завершаются ошибкой, submit() бросает QueueUnavailableError.
+    Задание, не завершенное за job_timeout секунд, завершается ошибкой.
+    """
+
+    def __init__(self, analyzer_config, workers=2, max_pending=32,
+                 history_limit=1000, on_complete=None, start_method='spawn',
+                 job_timeout=600, max_start_failures=5, restart_delay=1.0,
+                 max_restart_delay=60.0, check_interval=1.0):
+        self.analyzer_config = analyzer_config
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.history_limit = history_limit
+        self.on_complete = on_complete
+        self.job_timeout = job_timeout
+        self.max_start_failures = max_start_failures
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.check_interval = check_interval
+
+        self._ctx = multiprocessing.get_context(start_method)
+        self._tasks = None
+        self._events = None
+        self._processes = {}
+        self._slot_by_pid = {}
+        self._running_by_pid = {}
+        self._ready_workers = set()
+        # Неудачные запуски подряд и время следующего запуска по слотам
+        self._start_failures = [0] * self.workers
+        self._respawn_at = {}
+        self._unavailable = None
+        self._last_start_error = None
+        self._monitor = None
+
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = 0
+        # Номер последнего задания, взятого рабочим процессом из _tasks: очередь
+        # FIFO, поэтому все задания с большими номерами еще лежат в ней
+        self._taken_seq = 0
+        self._cancelled_seq = None
+        self._started = False
+        self._stopping = False
+        self._collector = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        """Запускает рабочие процессы и поток сбора результатов"""
+        with self._lock:
+            if self._started:
+                return
+            self._tasks = self._ctx.Queue()
+            self._events = self._ctx.Queue()
+            self._cancelled_seq = self._ctx.Value('q', 0)
+            for slot in range(self.workers):
+                self._spawn_worker(slot)
+            self._collector = threading.Thread(
+                target=self._collect_loop, name='analysis-job-collector', daemon=True
+            )
+            self._collector.start()
+            # Проверка процессов и сроков заданий - по своему таймеру, а не
+            # только когда в очереди событий тихо
+            self._monitor = threading.Thread(
+                target=self._monitor_loop, name='analysis-job-monitor', daemon=True
+            )
+            self._monitor.start()
+            self._started = True
+        print(f"Очередь анализов запущена: {self.workers} рабочих процессов")
+
+    def stop(self, timeout=5):
+        """Останавливает рабочие процессы"""
+        if not self._started:
+            return
+        self._stopping = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in list(self._processes.values()):
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._started = False
+
+    def _spawn_worker(self, slot):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.analyzer_config, self._tasks, self._events, self._cancelled_seq),
+            name='analysis-worker',
+            daemon=True
+        )
+        process.start()
+        self._processes[process.pid] = process
+        self._slot_by_pid[process.pid] = slot
+
+    def submit(self, image_path, filename=None, meta=None, render=None):
+        """Ставит изображение в очередь и возвращает идентификатор задания.
+
+        render - режим визуализации для analyze_image ('eager', 'lazy', 'none')
+        """
+        if not self._started:
+            self.start()
+
+        with self._lock:
+            if self._unavailable:
+                self._rejected += 1
+                raise QueueUnavailableError(self._unavailable)
+            pending = self._pending_count()
+            if pending >= self.max_pending:
+                self._rejected += 1
+                raise QueueFullError(
+                    f'Очередь анализов заполнена ({pending}/{self.max_pending})'
+                )
+
+            self._seq += 1
+            seq = self._seq
+            job_id = uuid.uuid4().hex
+            created_at = time.time()
+            self._jobs[job_id] = {
+                'id': job_id,
+                'seq': seq,
+                'status': 'queued',
+                'filename': filename,
+                'image_path': image_path,
+                'render': render,
+                'meta': meta or {},
+                'created_at': created_at,
+                'started_at': None,
+                'finished_at': None,
+                'worker_pid': None,
+                'result': None,
+                'error': None
+            }
+            self._submitted += 1
+            self._prune_history()
+
+        deadline = created_at + self.job_timeout if self.job_timeout else None
+        self._tasks.put((job_id, seq, image_path, render, deadline))
+        return job_id
+
+    def get(self, job_id):
+        """Возвращает публичное состояние задания или None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return self._public_view(job)
+
+    def stats(self):
+        """Возвращает глубину очереди и счетчики"""
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j['status'] == 'queued')
+            running = sum(1 for j in self._jobs.values() if j['status'] == 'running')
+            pending = self._pending_count()
+            return {
+                'enabled': True,
+                'started': self._started,
+                'available': self._unavailable is None,
+                'unavailable_reason': self._unavailable,
+                'start_failures': list(self._start_failures),
+                'workers': self.workers,
+                'workers_alive': sum(1 for p in self._processes.values() if p.is_alive()),
+                'workers_ready': len(self._ready_workers),
+                'queued': queued,
+                'running': running,
+                'depth': queued + running,
+                # Вместе с отмененными заданиями, которые еще не вынуты из очереди
+                'pending_tasks': pending,
+                'max_pending': self.max_pending,
+                'available_slots': max(0, self.max_pending - pending),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected
+            }
+
+    def _pending_count(self):
+        """Задания в очереди процессов (в том числе уже завершенные ошибкой) и выполняемые"""
+        return self._seq - self._taken_seq + len(self._running_by_pid)
+
+    def _prune_history(self):
+        """Удаляет самые старые завершенные задания сверх лимита"""
+        overflow = len(self._jobs) - self.history_limit
+        if overflow <= 0:
+            return
+        for job_id in list(self._jobs.keys()):
+            if overflow <= 0:
+                break
+            if self._jobs[job_id]['status'] in ('done', 'failed'):
+                del self._jobs[job_id]
+                overflow -= 1
+
+    def _public_view(self, job):
+        view = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'filename': job['filename'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+        if job['status'] == 'queued':
+            view['queue_position'] = sum(
+                1 for j in self._jobs.values()
+                if j['status'] == 'queued' and j['seq'] < job['seq']
+            ) + 1
+        if job['started_at']:
+            end = job['finished_at'] or time.time()
+            view['elapsed'] = round(end - job['started_at'], 3)
+        if job['status'] == 'done':
+            view['result'] = job['result']
+        if job['status'] == 'failed':
+            view['error'] = job['error']
+        return view
+
+    def _collect_loop(self):
+        """Получает события от рабочих процессов и завершает задания"""
+        while not self._stopping:
+            try:
+                event, job_id, pid, payload = self._events.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if event == 'ready':
+                with self._lock:
+                    self._ready_workers.add(pid)
+                    slot = self._slot_by_pid.get(pid)
+                    if slot is not None:
+                        self._start_failures[slot] = 0
+                    self._unavailable = None
+            elif event == 'failed_start':
+                print(f"Рабочий процесс {pid} не смог загрузить модель: {payload}")
+                with self._lock:
+                    self._last_start_error = payload
+            elif event == 'skipped':
+                with self._lock:
+                    self._taken_seq = max(self._taken_seq, payload)
+            elif event == 'started':
+                with self._lock:
+                    self._taken_seq = max(self._taken_seq, payload)
+                    job = self._jobs.get(job_id)
+                    # Задание могло уже завершиться ошибкой по сроку
+                    if job and job['status'] == 'queued':
+                        job['status'] = 'running'
+                        job['started_at'] = time.time()
+                        job['worker_pid'] = pid
+                    self._running_by_pid[pid] = job_id
+            elif event == 'finished':
+                with self._lock:
+                    self._running_by_pid.pop(pid, None)
+                self._finish(job_id, payload)
+
+    def _monitor_loop(self):
+        while not self._stopping:
+            time.sleep(self.check_interval)
+            try:
+                self._check_workers()
+                self._check_deadlines()
+            except Exception as e:
+                print(f"Ошибка проверки рабочих процессов: {e}")
+
+    def _finish(self, job_id, results):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        # Завершенное (например, по сроку) задание повторно не завершается
+        if job is None or job['status'] in ('done', 'failed'):
+            return
+
+        result, error = None, None
+        if not results.get('success'):
+            error = results.get('error', 'Ошибка анализа')
+        elif self.on_complete:
+            try:
+                result = self.on_complete(job, results)
+            except Exception as e:
+                error = f'Ошибка сохранения результатов: {e}'
+        else:
+            result = results
+
+        with self._lock:
+            if job['status'] in ('done', 'failed'):
+                return
+            job['finished_at'] = time.time()
+            if error:
+                job['status'] = 'failed'
+                job['error'] = error
+                self._failed += 1
+            else:
+                job['status'] = 'done'
+                job['result'] = result
+                self._completed += 1
+
+    def _check_workers(self):
+        """Перезапускает упавшие рабочие процессы и помечает их задания ошибкой"""
+        if self._stopping:
+            return
+        now = time.time()
+        crashed = []
+        with self._lock:
+            for pid, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                slot = self._slot_by_pid.pop(pid)
+                del self._processes[pid]
+                if pid in self._ready_workers:
+                    self._ready_workers.discard(pid)
+                    print(f"Рабочий процесс {pid} завершился с кодом {process.exitcode}, перезапуск")
+                    self._respawn_at[slot] = now
+                else:
+                    # Процесс не дошел до готовности: перезапуск с растущей паузой
+                    self._start_failures[slot] += 1
+                    delay = min(self.restart_delay * 2 ** (self._start_failures[slot] - 1),
+                                self.max_restart_delay)
+                    print(f"Рабочий процесс {pid} не запустился "
+                          f"({self._start_failures[slot]} раз подряд), повтор через {delay:.0f} с")
+                    self._respawn_at[slot] = now + delay
+                job_id = self._running_by_pid.pop(pid, None)
+                if job_id:
+                    crashed.append(job_id)
+
+            for slot, respawn_at in list(self._respawn_at.items()):
+                if respawn_at <= now:
+                    del self._respawn_at[slot]
+                    self._spawn_worker(slot)
+
+            became_unavailable = (
+                self._unavailable is None and not self._ready_workers
+                and min(self._start_failures) >= self.max_start_failures
+            )
+            if became_unavailable:
+                self._unavailable = (
+                    f'Рабочие процессы анализа не запускаются ({self.max_start_failures} попыток подряд): '
+                    f'{self._last_start_error or "процесс завершился"}'
+                )
+                print(self._unavailable)
+                waiting = [job_id for job_id, job in self._jobs.items() if job['status'] == 'queued']
+                # Рабочие процессы пропустят эти задания, когда запустятся
+                self._cancelled_seq.value = self._seq
+
+        for job_id in crashed:
+            self._finish(job_id, {'success': False, 'error': 'Рабочий процесс аварийно завершился'})
+        if became_unavailable:
+            for job_id in waiting:
+                self._finish(job_id, {'success': False, 'error': self._unavailable})
+
+    def _check_deadlines(self):
+        """Завершает ошибкой задания старше job_timeout; зависший процесс останавливается"""
+        if not self.job_timeout:
+            return
+        now = time.time()
+        with self._lock:
+            expired = [
+                (job_id, job['worker_pid'] if job['status'] == 'running' else None)
+                for job_id, job in self._jobs.items()
+                if job['status'] in ('queued', 'running') and now - job['created_at'] > self.job_timeout
+            ]
+        for job_id, pid in expired:
+            self._finish(job_id, {
+                'success': False,
+                'error': f'Задание не выполнено за {self.job_timeout} с'
+            })
+            if not pid:
+                continue
+            # Под блокировкой: процесс мог уже сообщить о завершении и взять
+            # следующее задание, которое нельзя прерывать
+            with self._lock:
+                process = self._processes.get(pid)
+                if process is not None and self._running_by_pid.get(pid) == job_id:
+                    print(f"Рабочий процесс {pid} превысил срок задания, остановка")
+                    process.terminate()
@@ -0,0 +1,170 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+Гистограммы и счетчики живут в памяти процесса сервера; значения, которые
+уже считают другие компоненты (очередь, кэши, сессии камеры), снимаются
+функциями-коллекторами в момент запроса /metrics.
+"""
+import threading
+from bisect import bisect_left
+
+# Границы корзин по умолчанию (секунды): от долей миллисекунды до минуты
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, суммой и числом наблюдений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Счетчики по корзинам + корзина +Inf, сумма
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(round(total, 6))}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class MetricsRegistry:
+    """Набор метрик и коллекторов, отдаваемых одной страницей"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """collect() возвращает список (имя, тип, описание, {метки: значение})"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            # Имя семейства в HELP/TYPE должно совпадать с именем отсчетов
+            name = f'{metric.name}_total' if metric.kind == 'counter' else metric.name
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.samples())
+
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+                continue
+            for name, kind, documentation, values in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in values.items():
+                    label_names = [label for label, _ in labels]
+                    label_values = [v for _, v in labels]
+                    lines.append(f'{name}{_format_labels(label_names, label_values)} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'bookshelf_stage_seconds',
+    'Длительность стадий анализа изображения',
+    labelnames=('stage',)
+)
+ANALYSIS_SECONDS = registry.histogram(
+    'bookshelf_analysis_seconds',
+    'Полное время анализа изображения (без попаданий в кэш)'
+)
+ANALYSES = registry.counter(
+    'bookshelf_analyses',
+    'Сохраненные анализы по источнику результата',
+    labelnames=('source',)
+)
+
+
+def observe_analysis(results):
+    """Учитывает стадии одного сохраненного анализа"""
+    cached = bool(results.get('cached'))
+    ANALYSES.inc(source='cache' if cached else 'analysis')
+    if not cached and 'processing_time' in results:
+        ANALYSIS_SECONDS.observe(results['processing_time'])
+    for stage, duration in results.get('timings', {}).items():
+        STAGE_SECONDS.observe(duration, stage=stage)
@@ -2,4 +2,4 @@
 Включает анализатор на основе нейронных сетей.
 """
 
-__all__ = ['analyzer']
\ No newline at end of file
+__all__ = ['analyzer', 'shelf_segmentation', 'tracker']
\ No newline at end of file
@@ -1,32 +1,498 @@
-import torch
-import torchvision.transforms as transforms
-from ultralytics import YOLO
+import ast
+import io
 import cv2
 import numpy as np
 from PIL import Image
 import time
 import os
 from typing import Dict, List, Tuple, Any
-from sklearn.cluster import KMeans
+from models.shelf_segmentation import get_segmenter
+
+
+# Флаги декодирования с уменьшением в 2, 4 и 8 раз (для JPEG - средствами libjpeg)
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# Значения тега EXIF Orientation, при которых OpenCV поворачивает снимок на 90 градусов
+_EXIF_TRANSPOSED = (5, 6, 7, 8)
+
+
+def image_size(data: bytes) -> Tuple[int, int]:
+    """Ширина и высота снимка с учетом EXIF-поворота; читается только заголовок"""
+    with Image.open(io.BytesIO(data)) as header:
+        width, height = header.size
+        if header.getexif().get(0x0112) in _EXIF_TRANSPOSED:
+            width, height = height, width
+    return width, height
+
+
+def decode_image(data: bytes, max_size: int = None,
+                 timings: Dict[str, float] = None) -> Tuple[np.ndarray, int, int]:
+    """Декодирует изображение из байтов сразу в уменьшенном размере.
+    
+    Если снимок больше max_size, выбирается наибольшее уменьшение при
+    декодировании, после которого сторона не меньше max_size; до точного
+    размера изображение досжимается resize. Возвращает изображение и
+    исходные ширину и высоту; в timings, если передан, записываются
+    длительности 'decode' и 'resize'.
+    """
+    stage_start = time.time()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    flag = cv2.IMREAD_COLOR
+    
+    try:
+        original_width, original_height = image_size(data)
+    except Exception:
+        original_width = original_height = None
+    
+    if max_size and original_width:
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if max(original_width, original_height) >= max_size * factor:
+                flag = reduced_flag
+                break
+    
+    image = cv2.imdecode(buffer, flag)
+    if image is None:
+        raise ValueError("Не удалось декодировать изображение")
+    if original_width is None or flag == cv2.IMREAD_COLOR:
+        original_height, original_width = image.shape[:2]
+    if timings is not None:
+        timings['decode'] = time.time() - stage_start
+        stage_start = time.time()
+    
+    # Итоговый размер считается от исходного, как при полном декодировании
+    if max_size and max(original_width, original_height) > max_size:
+        scale = max_size / max(original_width, original_height)
+        size = (int(original_width * scale), int(original_height * scale))
+        if size != (image.shape[1], image.shape[0]):
+            image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+    if timings is not None:
+        timings['resize'] = time.time() - stage_start
+    
+    return image, original_width, original_height
+
+
+def letterbox(image: np.ndarray, size: int,
+              color: Tuple[int, int, int] = (114, 114, 114)) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Вписывает изображение в квадрат size x size, возвращает масштаб и смещение полей"""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    
+    pad_x = (size - new_width) // 2
+    pad_y = (size - new_height) // 2
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = image
+    
+    return canvas, scale, (pad_x, pad_y)
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float,
+                        class_ids: np.ndarray = None) -> np.ndarray:
+    """NMS на NumPy, возвращает индексы оставленных боксов по убыванию уверенности"""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    boxes = boxes.astype(np.float32)
+    if class_ids is not None:
+        # Смещаем боксы разных классов, чтобы они не подавляли друг друга
+        boxes = boxes + (class_ids.astype(np.float32) * (boxes.max() + 1))[:, None]
+    
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    
+    return np.asarray(keep, dtype=np.int64)
+
+
+def tile_origins(length: int, tile: int, overlap: int) -> List[int]:
+    """Начала тайлов вдоль одной оси: шаг tile - overlap, последний тайл прижат к краю"""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def merge_tiled_detections(detections: np.ndarray, cut: np.ndarray,
+                           threshold: float = 0.6) -> np.ndarray:
+    """Объединяет детекции одной книги с разных тайлов.
+    
+    Боксы сравниваются по доле пересечения от меньшего из них, поэтому часть
+    книги, обрезанная краем тайла, сливается с целой. Книга выше перекрытия,
+    разрезанная горизонтальной границей тайлов (cut), собирается из частей,
+    если они пересекаются по вертикали и совпадают по ширине. Результат -
+    объединение боксов с максимальной уверенностью.
+    """
+    if len(detections) == 0:
+        return detections
+    
+    boxes = detections[:, :4].astype(np.float32)
+    scores = detections[:, 4]
+    class_ids = detections[:, 5]
+    widths = boxes[:, 2] - boxes[:, 0]
+    areas = widths * (boxes[:, 3] - boxes[:, 1])
+    used = np.zeros(len(detections), dtype=bool)
+    merged = []
+    
+    for i in np.argsort(-scores, kind='stable'):
+        if used[i]:
+            continue
+        used[i] = True
+        box, box_cut = boxes[i].copy(), bool(cut[i])
+        
+        # Объединенный бокс растет, поэтому сравнение повторяется до стабилизации
+        while True:
+            rest = np.flatnonzero(~used & (class_ids == class_ids[i]))
+            if not len(rest):
+                break
+            inter_w = np.clip(np.minimum(box[2], boxes[rest, 2]) - np.maximum(box[0], boxes[rest, 0]), 0, None)
+            inter_h = np.clip(np.minimum(box[3], boxes[rest, 3]) - np.maximum(box[1], boxes[rest, 1]), 0, None)
+            box_width = box[2] - box[0]
+            box_area = box_width * (box[3] - box[1])
+            
+            ios = inter_w * inter_h / (np.minimum(box_area, areas[rest]) + 1e-9)
+            match = ios > threshold
+            width_overlap = inter_w / (np.minimum(box_width, widths[rest]) + 1e-9)
+            match |= (box_cut | cut[rest]) & (inter_h > 0) & (width_overlap > threshold)
+            
+            matched = rest[match]
+            if not len(matched):
+                break
+            used[matched] = True
+            box[:2] = np.minimum(box[:2], boxes[matched, :2].min(axis=0))
+            box[2:] = np.maximum(box[2:], boxes[matched, 2:].max(axis=0))
+            box_cut = box_cut or bool(cut[matched].any())
+        
+        merged.append([*box, scores[i], class_ids[i]])
+    
+    return np.asarray(merged, dtype=np.float32)
+
+
+class DetectorBackend:
+    """Бэкенд детектора: возвращает боксы в координатах входных изображений"""
+    
+    name = None
+    names: Dict[int, str] = {}
+    device = 'cpu'
+    
+    def predict(self, images: List[np.ndarray], conf: float,
+                imgsz: int = None) -> List[np.ndarray]:
+        """Для каждого изображения массив N x 6: x1, y1, x2, y2, conf, cls"""
+        raise NotImplementedError
+
+
+class TorchDetectorBackend(DetectorBackend):
+    """YOLO через PyTorch (ultralytics)"""
+    
+    name = 'torch'
+    
+    def __init__(self, model_path: str):
+        import torch
+        from ultralytics import YOLO
+        
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+    
+    def predict(self, images: List[np.ndarray], conf: float,
+                imgsz: int = None) -> List[np.ndarray]:
+        kwargs = {'conf': conf, 'verbose': False}
+        if imgsz:
+            kwargs['imgsz'] = imgsz
+        
+        results = self.model(images, **kwargs)
+        
+        detections = []
+        for result in results:
+            if result.boxes is None or len(result.boxes) == 0:
+                detections.append(np.empty((0, 6), dtype=np.float32))
+                continue
+            # Одна передача с устройства: [x1, y1, x2, y2, (track_id,) conf, cls]
+            data = result.boxes.data.cpu().numpy()
+            detections.append(np.concatenate([data[:, :4], data[:, -2:]], axis=1))
+        
+        return detections
+
+
+class OnnxDetectorBackend(DetectorBackend):
+    """YOLO, экспортированная в ONNX, через ONNX Runtime на CPU (без torch)"""
+    
+    name = 'onnx'
+    
+    def __init__(self, model_path: str, threads: int = 0, iou_threshold: float = 0.45):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self.device = 'cpu (onnxruntime)'
+        self.iou_threshold = iou_threshold
+        
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch_dim, _, height_dim = model_input.shape[:3]
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) else None
+        self.input_size = height_dim if isinstance(height_dim, int) else 640
+        
+        # ultralytics сохраняет имена классов в метаданных модели
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+    
+    def predict(self, images: List[np.ndarray], conf: float,
+                imgsz: int = None) -> List[np.ndarray]:
+        size = self.input_size
+        prepared = [letterbox(image, size) for image in images]
+        
+        # BGR -> RGB, HWC -> CHW, [0, 1]
+        blob = np.stack([item[0] for item in prepared])[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        
+        step = self.fixed_batch or len(images)
+        outputs = np.concatenate([
+            self.session.run(None, {self.input_name: blob[i:i + step]})[0]
+            for i in range(0, len(images), step)
+        ])
+        
+        detections = []
+        for output, (_, scale, pad) in zip(outputs, prepared):
+            boxes = self._decode(output, conf)
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / scale
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / scale
+            detections.append(boxes)
+        
+        return detections
+    
+    def _decode(self, output: np.ndarray, conf: float) -> np.ndarray:
+        """Разбирает выход модели в массив N x 6 в координатах входа сети"""
+        if output.ndim == 2 and output.shape[-1] == 6:
+            # Модели без NMS (end-to-end): [x1, y1, x2, y2, conf, cls]
+            return output[output[:, 4] >= conf].astype(np.float32)
+        
+        # Формат YOLOv8/11: (4 + число классов, число якорей), боксы cx, cy, w, h
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences >= conf
+        
+        cx, cy, w, h = predictions[mask, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        confidences, class_ids = confidences[mask], class_ids[mask]
+        
+        keep = non_max_suppression(boxes, confidences, self.iou_threshold, class_ids)
+        return np.concatenate([
+            boxes[keep], confidences[keep, None], class_ids[keep, None]
+        ], axis=1).astype(np.float32)
+
+
+def create_detector_backend(model_path: str, config: Dict[str, Any] = None) -> DetectorBackend:
+    """Выбирает бэкенд по расширению файла модели (.pt - PyTorch, .onnx - ONNX Runtime)"""
+    config = config or {}
+    if model_path.endswith('.onnx'):
+        return OnnxDetectorBackend(
+            model_path,
+            threads=config.get('onnx_threads', 0),
+            iou_threshold=config.get('iou_threshold', 0.45)
+        )
+    return TorchDetectorBackend(model_path)
+
+
+def export_onnx_model(model_path: str, imgsz: int = 640, quantize: bool = False) -> str:
+    """Экспортирует модель YOLO в ONNX (опционально с динамическим INT8-квантованием)"""
+    from ultralytics import YOLO
+    
+    onnx_path = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    print(f"Модель экспортирована в ONNX: {onnx_path}")
+    if not quantize:
+        return onnx_path
+    
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    
+    # Переносим метаданные (имена классов) в квантованную модель
+    source = onnx.load(onnx_path)
+    quantized = onnx.load(int8_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, int8_path)
+    
+    print(f"Квантованная INT8-модель сохранена: {int8_path}")
+    return int8_path
+
+
+# Книги хранятся столбцами в структурированном массиве; словари создаются
+# только при формировании ответа API (см. books_to_dicts)
+BOOK_DTYPE = np.dtype([
+    ('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+    ('confidence', np.float32), ('class_id', np.int32),
+    ('width', np.int32), ('height', np.int32), ('area', np.int64),
+    ('shelf_number', np.int32)
+])
+
+
+def books_to_dicts(books: np.ndarray) -> List[Dict]:
+    """Преобразует структурированный массив книг в список словарей"""
+    return [{
+        'bbox': [x1, y1, x2, y2],
+        'confidence': confidence,
+        'class_id': class_id,
+        'width': width,
+        'height': height,
+        'area': area,
+        'shelf_number': shelf_number
+    } for x1, y1, x2, y2, confidence, class_id, width, height, area, shelf_number in books.tolist()]
+
+
+def books_from_rows(rows) -> np.ndarray:
+    """Структурированный массив книг из строк (x1, y1, x2, y2, confidence, shelf_number)"""
+    rows = list(rows)
+    books = np.zeros(len(rows), dtype=BOOK_DTYPE)
+    if rows:
+        columns = list(zip(*rows))
+        for field, values in zip(('x1', 'y1', 'x2', 'y2', 'confidence'), columns):
+            books[field] = values
+        books['shelf_number'] = [value or 0 for value in columns[5]]
+        books['width'] = books['x2'] - books['x1']
+        books['height'] = books['y2'] - books['y1']
+        books['area'] = books['width'].astype(np.int64) * books['height']
+    return books
+
+
+def draw_books(image: np.ndarray, books: np.ndarray) -> np.ndarray:
+    """Рисует bounding box книг поверх изображения"""
+    for x1, y1, x2, y2, confidence in zip(books['x1'].tolist(), books['y1'].tolist(),
+                                          books['x2'].tolist(), books['y2'].tolist(),
+                                          books['confidence'].tolist()):
+        cv2.rectangle(image, 
+                    (x1, y1), 
+                    (x2, y2),
+                    (0, 255, 0), 2)
+        cv2.putText(image, 
+                  f'Book: {confidence:.2f}',
+                  (x1, y1 - 10),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                  (0, 255, 0), 2)
+    
+    return image
+
+
+def draw_visualization(image: np.ndarray, books: np.ndarray, shelves: List[Dict],
+                       statistics: Dict) -> np.ndarray:
+    """Рисует книги, полки и статистику поверх изображения"""
+    vis_image = draw_books(image, books)
+    height, width = vis_image.shape[:2]
+    
+    # Рисуем полки
+    colors = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (255, 255, 0), 
+             (255, 0, 255), (0, 255, 255)]
+    
+    for i, shelf in enumerate(shelves):
+        color = colors[i % len(colors)]
+        cv2.rectangle(vis_image,
+                    (0, shelf['y1']),
+                    (width, shelf['y2']),
+                    color, 2)
+        
+        # Подпись полки
+        if i < len(statistics['fill_percentages']):
+            fill_percent = statistics['fill_percentages'][i]
+            label = f"Полка {i+1}: {fill_percent}% ({shelf['book_count']} книг)"
+            cv2.putText(vis_image, label,
+                      (10, shelf['y1'] + 30),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                      color, 2)
+    
+    # Добавляем статистику на изображение
+    stats_text = [
+        f"Всего книг: {statistics['total_books']}",
+        f"Полок: {statistics['shelf_count']}",
+        f"Среднее заполнение: {statistics['average_fill']}%",
+        f"Плотность: {statistics['density_percentage']}%"
+    ]
+    
+    y_offset = 50
+    for text in stats_text:
+        cv2.putText(vis_image, text,
+                  (width - 300, y_offset),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                  (255, 255, 255), 2)
+        cv2.putText(vis_image, text,
+                  (width - 301, y_offset - 1),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                  (0, 0, 0), 2)
+        y_offset += 30
+    
+    return vis_image
+
+
+def visualization_path(processed_folder: str, original_path: str) -> str:
+    """Путь файла визуализации для исходного снимка"""
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    name, ext = os.path.splitext(os.path.basename(original_path))
+    return os.path.join(processed_folder, f"{name}_analyzed_{timestamp}{ext}")
+
+
+def render_visualization(original_path: str, processed_folder: str, books: np.ndarray,
+                         shelves: List[Dict], statistics: Dict, max_size: int,
+                         size: Tuple[int, int] = None) -> str:
+    """Отложенная визуализация: исходный снимок в размере обработки и сохраненные детекции.
+    
+    size - (ширина, высота) обработанного изображения; если снимок заменен
+    превью меньшего размера, он растягивается до size, чтобы совпали координаты.
+    """
+    with open(original_path, 'rb') as f:
+        image, _, _ = decode_image(f.read(), max_size)
+    if size and (image.shape[1], image.shape[0]) != tuple(size):
+        image = cv2.resize(image, tuple(size), interpolation=cv2.INTER_LINEAR)
+    
+    output_path = visualization_path(processed_folder, original_path)
+    if not cv2.imwrite(output_path, draw_visualization(image, books, shelves, statistics)):
+        raise ValueError(f"Не удалось сохранить визуализацию: {output_path}")
+    return output_path
+
 
 class BookShelfAnalyzer:
     """Основной класс анализатора книжного шкафа"""
     
     def __init__(self, config):
         self.config = config
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"Используется устройство: {self.device}")
         
-        # Инициализация моделей
+        # Инициализация моделей; torch и ultralytics импортируются только
+        # бэкендом PyTorch, чтобы модуль можно было подключать без них
         self._init_models()
+        self.device = self.detector.device
+        print(f"Используется устройство: {self.device}")
         
-        # Трансформации для изображений
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                              std=[0.229, 0.224, 0.225])
-        ])
+        # Алгоритм разбиения книг на полки
+        self.shelf_segmenter = get_segmenter(
+            config.get('shelf_segmenter', 'gap'),
+            **config.get('shelf_segmenter_params', {})
+        )
     
     def _init_models(self):
         """Инициализация всех моделей"""
@@ -40,8 +506,8 @@ class BookShelfAnalyzer:
                 print(f"Локальная модель найдена: {model_path}")
                 file_size = os.path.getsize(model_path) / (1024*1024)
                 print(f"Размер модели: {file_size:.1f} MB")
-                self.detector = YOLO(model_path)
-                print("Модель YOLO успешно загружена из локального файла")
+                self.detector = create_detector_backend(model_path, self.config)
+                print(f"Модель YOLO успешно загружена из локального файла (бэкенд: {self.detector.name})")
             else:
                 print(f"Локальная модель не найдена: {model_path}")
             
@@ -58,7 +524,7 @@ class BookShelfAnalyzer:
             print("Тестирование детектора...")
             # Создаем тестовое изображение
             test_image = np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)
-            results = self.detector(test_image, verbose=False)
+            self.detector.predict([test_image], conf=0.25)
             print("Детектор протестирован успешно")
             
             # Выводим информацию о классах
@@ -72,74 +538,36 @@ class BookShelfAnalyzer:
         except Exception as e:
             print(f"Ошибка тестирования детектора: {e}")
     
-    def analyze_image(self, image_path: str) -> Dict[str, Any]:
-        """Основной метод анализа изображения"""
+    def analyze_image(self, image_path: str, image_bytes: bytes = None,
+                      render: str = None) -> Dict[str, Any]:
+        """Основной метод анализа изображения.
+        
+        Если байты файла уже в памяти (загрузка через API), они декодируются
+        напрямую, без повторного чтения с диска. render: 'eager' - визуализация
+        рисуется сразу, 'lazy' и 'none' - не рисуется (visualization_path = None).
+        """
         start_time = time.time()
         
         try:
             print(f"Анализ изображения: {os.path.basename(image_path)}")
             
             # Загрузка изображения
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Не удалось загрузить изображение: {image_path}")
-            
-            original_height, original_width = image.shape[:2]
-            print(f"Размер изображения: {original_width}x{original_height}")
-            
-            # Уменьшаем изображение для ускорения обработки
-            max_size = 1024
-            if max(original_height, original_width) > max_size:
-                scale = max_size / max(original_height, original_width)
-                new_width = int(original_width * scale)
-                new_height = int(original_height * scale)
-                image = cv2.resize(image, (new_width, new_height), 
-                                 interpolation=cv2.INTER_LINEAR)
-                print(f"Изображение уменьшено до: {new_width}x{new_height}")
+            timings = {}
+            image, original_width, original_height = self._load_image(
+                image_path, image_bytes, timings
+            )
             
             # 1. Детектирование книг
             print("Детектирование книг...")
-            books, processed_image = self._detect_books(image)
+            books = self._detect_books(image, timings)
             print(f"Найдено книг: {len(books)}")
             
-            # 2. Определение полок
-            print("Определение полок...")
-            shelves = self._detect_shelves(image, books)
-            print(f"Найдено полок: {len(shelves)}")
-            
-            # 3. Расчет статистики
-            print("Расчет статистики...")
-            statistics = self._calculate_statistics(books, shelves, original_width, original_height)
-            
-            # 4. Создание визуализации
-            print("Создание визуализации...")
-            visualization_path = self._create_visualization(
-                image_path, processed_image, books, shelves, statistics
+            results = self._finish_analysis(
+                image_path, image, books, original_width, original_height, timings, render
             )
+            results['processing_time'] = time.time() - start_time
             
-            processing_time = time.time() - start_time
-            
-            
-            shelf_type = {
-                'type': 'open_shelf',
-                'confidence': 0.9
-            }
-            
-            results = {
-                'success': True,
-                'shelf_type': shelf_type,
-                'books': books,
-                'shelves': shelves,
-                'statistics': statistics,
-                'visualization_path': visualization_path,
-                'processing_time': processing_time,
-                'image_dimensions': {
-                    'width': original_width,
-                    'height': original_height
-                }
-            }
-            
-            print(f"Анализ завершен за {processing_time:.2f} секунд")
+            print(f"Анализ завершен за {results['processing_time']:.2f} секунд")
             return results
             
         except Exception as e:
@@ -151,84 +579,380 @@ class BookShelfAnalyzer:
                 'error': str(e)
             }
     
-    def _detect_books(self, image: np.ndarray) -> Tuple[List[Dict], np.ndarray]:
+    def analyze_batch(self, image_paths: List[str], images_bytes: List[bytes] = None,
+                      render: str = None) -> List[Dict[str, Any]]:
+        """Пакетный анализ: один прогон детектора на группу изображений"""
+        batch_size = max(1, int(self.config.get('batch_size', 8)))
+        results = [None] * len(image_paths)
+        
+        print(f"Пакетный анализ: {len(image_paths)} изображений, размер пакета {batch_size}")
+        
+        for chunk_start in range(0, len(image_paths), batch_size):
+            chunk_end = min(chunk_start + batch_size, len(image_paths))
+            chunk = [(index, image_paths[index]) for index in range(chunk_start, chunk_end)]
+            loaded = []
+            
+            # Декодирование; ошибки отдельных файлов не прерывают пакет
+            for index, image_path in chunk:
+                timings = {}
+                try:
+                    image, original_width, original_height = self._load_image(
+                        image_path, images_bytes[index] if images_bytes else None, timings
+                    )
+                    loaded.append((index, image_path, image, original_width, original_height,
+                                   timings))
+                except Exception as e:
+                    print(f"Ошибка загрузки {image_path}: {e}")
+                    results[index] = {'success': False, 'error': str(e)}
+            
+            if not loaded:
+                continue
+            
+            # 1. Детектирование книг одним пакетом; время пакета делится поровну
+            batch_timings = {}
+            try:
+                batch_books = self._detect_books_batch([item[2] for item in loaded], batch_timings)
+            except Exception as e:
+                print(f"Ошибка пакетного детектирования: {e}")
+                for item in loaded:
+                    results[item[0]] = {'success': False, 'error': str(e)}
+                continue
+            
+            # 2-4. Полки, статистика и визуализация для каждого изображения
+            for (index, image_path, image, original_width, original_height, timings), books \
+                    in zip(loaded, batch_books):
+                finish_start = time.time()
+                for stage, duration in batch_timings.items():
+                    timings[stage] = duration / len(loaded)
+                load_and_detect = sum(timings.values())
+                try:
+                    item_results = self._finish_analysis(
+                        image_path, image, books, original_width, original_height, timings, render
+                    )
+                    item_results['processing_time'] = load_and_detect + (time.time() - finish_start)
+                    results[index] = item_results
+                except Exception as e:
+                    print(f"Ошибка при анализе изображения {image_path}: {e}")
+                    results[index] = {'success': False, 'error': str(e)}
+        
+        return results
+    
+    def analyze_frame(self, image_bytes: bytes, max_size: int = 640,
+                      tracker=None) -> Dict[str, Any]:
+        """Анализ кадра видеопотока: без визуализации и записи на диск.
+        
+        Координаты возвращаются в размере исходного кадра, чтобы клиент рисовал
+        их поверх видео. Книги - [x1, y1, x2, y2, уверенность в %, номер полки],
+        полки - [y1, y2, число книг, заполнение в %]. С трекером (ShelfTracker
+        сессии камеры) к книгам добавляется id трека, при стабильной раскладке
+        полки берутся из прошлого кадра, а в 'smoothed' - сглаженные счетчики.
+        """
+        image, original_width, original_height = decode_image(image_bytes, max_size)
+        height, width = image.shape[:2]
+        
+        books = self._detect_books(image)
+        shelves = None
+        if tracker is not None:
+            track_ids = tracker.associate(books, width, height)
+            shelves = tracker.reuse_shelves(books, height)
+        reused = shelves is not None
+        if not reused:
+            shelves = self._detect_shelves(image, books)
+        statistics = self._calculate_statistics(books, shelves, width, height)
+        
+        scale = original_width / width
+        boxes = np.stack([books['x1'], books['y1'], books['x2'], books['y2']], axis=1) * scale
+        columns = [
+            np.rint(boxes).astype(np.int32),
+            np.rint(books['confidence'] * 100).astype(np.int32)[:, None],
+            books['shelf_number'][:, None]
+        ]
+        if tracker is not None:
+            columns.append(track_ids[:, None])
+        book_rows = np.concatenate(columns, axis=1)
+        fill_percentages = statistics['fill_percentages']
+        
+        result = {
+            'width': original_width,
+            'height': original_height,
+            'books': book_rows.tolist(),
+            'shelves': [[
+                int(round(shelf['y1'] * scale)), int(round(shelf['y2'] * scale)),
+                shelf['book_count'], fill_percentages[i] if i < len(fill_percentages) else 0
+            ] for i, shelf in enumerate(shelves)],
+            'total_books': statistics['total_books'],
+            'shelf_count': statistics['shelf_count'],
+            'average_fill': statistics['average_fill']
+        }
+        
+        if tracker is not None:
+            tracker.remember(books, track_ids, shelves, reused)
+            result['smoothed'] = tracker.smooth(statistics)
+            result['tracking'] = dict(tracker.stats(), stable=tracker.stable, shelves_reused=reused)
+        
+        return result
+        
+    def _load_image(self, image_path: str, image_bytes: bytes = None,
+                    timings: Dict[str, float] = None) -> Tuple[np.ndarray, int, int]:
+        """Декодирует изображение сразу в уменьшенном для обработки размере"""
+        if image_bytes is None:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        
+        # Уменьшаем изображение для ускорения обработки; в тайловом режиме
+        # сохраняем разрешение до tile_max_side, чтобы не терять тонкие корешки
+        max_size = 1024
+        if self.config.get('tiled_inference'):
+            max_size = int(self.config.get('tile_max_side', 3072))
+        
+        try:
+            image, original_width, original_height = decode_image(image_bytes, max_size, timings)
+        except ValueError:
+            raise ValueError(f"Не удалось загрузить изображение: {image_path}")
+        
+        print(f"Размер изображения: {original_width}x{original_height}")
+        height, width = image.shape[:2]
+        if (width, height) != (original_width, original_height):
+            print(f"Изображение уменьшено до: {width}x{height}")
+        
+        return image, original_width, original_height
+    
+    def _finish_analysis(self, image_path: str, image: np.ndarray, books: np.ndarray,
+                         original_width: int, original_height: int,
+                         timings: Dict[str, float], render: str = None) -> Dict[str, Any]:
+        """Определение полок, статистика и визуализация по найденным книгам.
+        
+        Визуализация рисуется прямо на image, поэтому после вызова
+        изображение содержит разметку.
+        """
+        render = render or self.config.get('render', 'eager')
+        # 2. Определение полок
+        print("Определение полок...")
+        stage_start = time.time()
+        shelves = self._detect_shelves(image, books)
+        timings['shelves'] = time.time() - stage_start
+        print(f"Найдено полок: {len(shelves)}")
+        
+        # 3. Расчет статистики (в координатах обработанного изображения, как и боксы)
+        print("Расчет статистики...")
+        stage_start = time.time()
+        height, width = image.shape[:2]
+        statistics = self._calculate_statistics(books, shelves, width, height)
+        timings['statistics'] = time.time() - stage_start
+        
+        # 4. Создание визуализации (при отложенном рендеринге - по запросу)
+        visualization_path = None
+        if render == 'eager':
+            print("Создание визуализации...")
+            stage_start = time.time()
+            visualization_path = self._create_visualization(
+                image_path, image, books, shelves, statistics
+            )
+            timings['visualization'] = time.time() - stage_start
+        
+        shelf_type = {
+            'type': 'open_shelf',
+            'confidence': 0.9
+        }
+        
+        # Граница API: переводим массивы в словари
+        for shelf in shelves:
+            shelf['books'] = books_to_dicts(shelf['books'])
+        
+        return {
+            'success': True,
+            'shelf_type': shelf_type,
+            'books': books_to_dicts(books),
+            'shelves': shelves,
+            'statistics': statistics,
+            'visualization_path': visualization_path,
+            'image_dimensions': {
+                'width': original_width,
+                'height': original_height
+            },
+            'processed_dimensions': {
+                'width': width,
+                'height': height
+            },
+            'timings': {stage: round(value, 4) for stage, value in timings.items()}
+        }
+    
+    def _detect_books(self, image: np.ndarray, timings: Dict[str, float] = None) -> np.ndarray:
         """Детектирование книг с использованием YOLO"""
         try:
             # Используем YOLO для детекции
-            results = self.detector(image, conf=self.config.get('confidence_threshold', 0.5))
+            stage_start = time.time()
+            if self._use_tiles(image):
+                detections = self._predict_tiled(image)
+            else:
+                detections = self.detector.predict(
+                    [image], conf=self.config.get('confidence_threshold', 0.5)
+                )[0]
+            if timings is not None:
+                timings['inference'] = time.time() - stage_start
+                stage_start = time.time()
             
-            books = []
-            processed_image = image.copy()
             height, width = image.shape[:2]
-            
-            # Ищем классы, связанные с книгами
-            book_class_ids = []
-            if hasattr(self.detector, 'names'):
-                for class_id, class_name in self.detector.names.items():
-                    if 'book' in class_name.lower() or 'books' in class_name.lower():
-                        book_class_ids.append(class_id)
-                        print(f"Использую класс для детекции книг: {class_id} - '{class_name}'")
-            
-            
-            if not book_class_ids:
-                book_class_ids = list(range(10))
-                print(f"Классы книг не найдены, использую первые 10 классов")
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = float(box.conf[0])
-                        cls = int(box.cls[0])
-                        
-                        # Фильтруем объекты по классу и уверенности
-                        if cls in book_class_ids and confidence > 0.3:
-                            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                            
-                            # Проверяем, что bounding box в пределах изображения
-                            x1 = max(0, min(x1, width - 1))
-                            y1 = max(0, min(y1, height - 1))
-                            x2 = max(0, min(x2, width - 1))
-                            y2 = max(0, min(y2, height - 1))
-                            
-                            if x2 > x1 and y2 > y1:  # Проверяем валидность bounding box
-                                book_data = {
-                                    'bbox': [x1, y1, x2, y2],
-                                    'confidence': confidence,
-                                    'class_id': cls,
-                                    'width': x2 - x1,
-                                    'height': y2 - y1,
-                                    'area': (x2 - x1) * (y2 - y1)
-                                }
-                                books.append(book_data)
-                                
-                                # Рисуем bounding box
-                                cv2.rectangle(processed_image, 
-                                            (x1, y1), 
-                                            (x2, y2),
-                                            (0, 255, 0), 2)
-                                cv2.putText(processed_image, 
-                                          f'Book: {confidence:.2f}',
-                                          (x1, y1 - 10),
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                          (0, 255, 0), 2)
-            
-            return books, processed_image
+            books = self._extract_books(detections, self._book_class_ids(), width, height)
+            if timings is not None:
+                timings['postprocess'] = time.time() - stage_start
+            return books
             
         except Exception as e:
             print(f"Ошибка детектирования книг: {e}")
-            return [], image
+            return np.empty(0, dtype=BOOK_DTYPE)
+    
+    def _detect_books_batch(self, images: List[np.ndarray],
+                            timings: Dict[str, float] = None) -> List[np.ndarray]:
+        """Пакетное детектирование: letterbox до общего размера и один вызов YOLO.
+        
+        В timings, если передан, записывается суммарное время пакета:
+        'inference' и 'postprocess' (перевод боксов в книги).
+        """
+        size = int(self.config.get('batch_imgsz', 640))
+        book_class_ids = self._book_class_ids()
+        batch_books = [None] * len(images)
+        batch_start = time.time()
+        postprocess = 0.0
+        
+        # Большие снимки в тайловом режиме обрабатываются своими пакетами тайлов
+        regular = []
+        for index, image in enumerate(images):
+            if self._use_tiles(image):
+                height, width = image.shape[:2]
+                detections = self._predict_tiled(image)
+                stage_start = time.time()
+                batch_books[index] = self._extract_books(detections, book_class_ids, width, height)
+                postprocess += time.time() - stage_start
+            else:
+                regular.append(index)
+        
+        if regular:
+            letterboxed = [letterbox(images[index], size) for index in regular]
+            batch_detections = self.detector.predict(
+                [item[0] for item in letterboxed],
+                conf=self.config.get('confidence_threshold', 0.5),
+                imgsz=size
+            )
+            
+            stage_start = time.time()
+            for index, (_, scale, pad), detections in zip(regular, letterboxed, batch_detections):
+                height, width = images[index].shape[:2]
+                batch_books[index] = self._extract_books(
+                    detections, book_class_ids, width, height, scale, pad
+                )
+            postprocess += time.time() - stage_start
+        
+        if timings is not None:
+            timings['inference'] = time.time() - batch_start - postprocess
+            timings['postprocess'] = postprocess
+        return batch_books
+    
+    def _use_tiles(self, image: np.ndarray) -> bool:
+        """Тайловый режим включен и изображение больше tile_min_side"""
+        return bool(self.config.get('tiled_inference')) and \
+            max(image.shape[:2]) > int(self.config.get('tile_min_side', 1024))
     
-    def _detect_shelves(self, image: np.ndarray, books: List[Dict]) -> List[Dict]:
+    def _predict_tiled(self, image: np.ndarray) -> np.ndarray:
+        """Детекция по перекрывающимся тайлам с объединением боксов на стыках"""
+        height, width = image.shape[:2]
+        size = int(self.config.get('tile_size', 640))
+        overlap = int(self.config.get('tile_overlap', 128))
+        batch_size = max(1, int(self.config.get('batch_size', 8)))
+        conf = self.config.get('confidence_threshold', 0.5)
+        
+        tiles = [(x, y) for y in tile_origins(height, size, overlap)
+                 for x in tile_origins(width, size, overlap)]
+        print(f"Тайловый анализ: {len(tiles)} тайлов {size}px, перекрытие {overlap}px")
+        
+        # Бокс у внутренней горизонтальной границы тайла - часть разрезанной книги
+        margin = 2
+        detections, cut = [], []
+        for start in range(0, len(tiles), batch_size):
+            chunk = tiles[start:start + batch_size]
+            tile_detections = self.detector.predict(
+                [image[y:y + size, x:x + size] for x, y in chunk], conf=conf, imgsz=size
+            )
+            for (x, y), boxes in zip(chunk, tile_detections):
+                boxes = boxes.astype(np.float32)
+                boxes[:, [0, 2]] += x
+                boxes[:, [1, 3]] += y
+                bottom = min(y + size, height)
+                detections.append(boxes)
+                cut.append(((boxes[:, 1] <= y + margin) & (y > 0)) |
+                           ((boxes[:, 3] >= bottom - margin) & (bottom < height)))
+        
+        return merge_tiled_detections(
+            np.concatenate(detections), np.concatenate(cut),
+            self.config.get('tile_merge_threshold', 0.6)
+        )
+    
+    def _book_class_ids(self) -> np.ndarray:
+        """Ищет классы, связанные с книгами (результат кэшируется)"""
+        if getattr(self, '_cached_book_class_ids', None) is not None:
+            return self._cached_book_class_ids
+        
+        book_class_ids = []
+        if hasattr(self.detector, 'names'):
+            for class_id, class_name in self.detector.names.items():
+                if 'book' in class_name.lower() or 'books' in class_name.lower():
+                    book_class_ids.append(class_id)
+                    print(f"Использую класс для детекции книг: {class_id} - '{class_name}'")
+        
+        
+        if not book_class_ids:
+            book_class_ids = list(range(10))
+            print(f"Классы книг не найдены, использую первые 10 классов")
+        
+        self._cached_book_class_ids = np.asarray(book_class_ids, dtype=np.int32)
+        return self._cached_book_class_ids
+    
+    def _extract_books(self, detections: np.ndarray, book_class_ids: np.ndarray,
+                       width: int, height: int, scale: float = 1.0,
+                       pad: Tuple[float, float] = (0, 0)) -> np.ndarray:
+        """Переводит боксы детектора в координаты исходного изображения и фильтрует их"""
+        if len(detections) == 0:
+            return np.empty(0, dtype=BOOK_DTYPE)
+        
+        confidence = detections[:, 4]
+        cls = detections[:, 5].astype(np.int32)
+        
+        # Фильтруем объекты по классу и уверенности
+        keep = np.isin(cls, book_class_ids) & (confidence > 0.3)
+        xyxy = detections[keep, :4].astype(np.float32)
+        
+        # Убираем поля letterbox и масштаб, затем обрезаем по границам изображения
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / scale
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / scale
+        coords = xyxy.astype(np.int32)
+        coords[:, [0, 2]] = np.clip(coords[:, [0, 2]], 0, width - 1)
+        coords[:, [1, 3]] = np.clip(coords[:, [1, 3]], 0, height - 1)
+        
+        box_width = coords[:, 2] - coords[:, 0]
+        box_height = coords[:, 3] - coords[:, 1]
+        valid = (box_width > 0) & (box_height > 0)
+        
+        books = np.empty(int(valid.sum()), dtype=BOOK_DTYPE)
+        books['x1'], books['y1'], books['x2'], books['y2'] = coords[valid].T
+        books['confidence'] = confidence[keep][valid]
+        books['class_id'] = cls[keep][valid]
+        books['width'] = box_width[valid]
+        books['height'] = box_height[valid]
+        books['area'] = box_width[valid].astype(np.int64) * box_height[valid]
+        books['shelf_number'] = 0
+        
+        return books
+    
+    def _detect_shelves(self, image: np.ndarray, books: np.ndarray) -> List[Dict]:
         """Обнаружение полок в книжном шкафу"""
         try:
             height, width = image.shape[:2]
             shelves = []
             
-            if not books or len(books) < 2:
+            if len(books) < 2:
                 print("Недостаточно книг для определения полок")
                 # Создаем одну полку на все изображение
+                books['shelf_number'] = 1
                 shelves.append({
                     'shelf_number': 1,
                     'y1': 0,
@@ -239,56 +963,48 @@ class BookShelfAnalyzer:
                 return shelves
             
             # Группируем книги по горизонтальным уровням (полкам)
-            book_y_centers = [(b['bbox'][1] + b['bbox'][3]) / 2 for b in books]
+            shelf_labels = self.shelf_segmenter.segment(
+                books['y1'].astype(np.float64), books['y2'].astype(np.float64), height
+            )
+            n_shelves = int(shelf_labels.max()) + 1
+            print(f"Определено полок ({self.shelf_segmenter.name}): {n_shelves}")
             
-            # Определяем количество полок
-            n_shelves = min(max(2, len(set([int(y // 50) for y in book_y_centers]))), 6)
-            print(f"Определение {n_shelves} полок...")
+            # Для каждой полки находим границы
+            order = np.argsort(shelf_labels, kind='stable')
+            boundaries = np.flatnonzero(np.diff(shelf_labels[order])) + 1
+            padding = height * 0.05
             
-            if len(book_y_centers) >= n_shelves:
-                # Используем K-means для кластеризации по высоте
-                kmeans = KMeans(n_clusters=n_shelves, random_state=42, n_init=10)
-                shelf_labels = kmeans.fit_predict(np.array(book_y_centers).reshape(-1, 1))
+            for indices in np.split(order, boundaries):
+                y_min, y_max = int(books['y1'][indices].min()), int(books['y2'][indices].max())
                 
-                # Для каждой полки находим границы
-                for i in range(n_shelves):
-                    shelf_books = [books[j] for j in range(len(books)) if shelf_labels[j] == i]
-                    
-                    if shelf_books:
-                        y_coords = []
-                        for book in shelf_books:
-                            y_coords.append(book['bbox'][1])  # верх
-                            y_coords.append(book['bbox'][3])  # низ
-                        
-                        y_min, y_max = min(y_coords), max(y_coords)
-                        
-                        # Добавляем отступы
-                        padding = height * 0.05
-                        shelf_y1 = max(0, int(y_min - padding))
-                        shelf_y2 = min(height, int(y_max + padding))
-                        
-                        shelf_data = {
-                            'shelf_number': i + 1,
-                            'y1': shelf_y1,
-                            'y2': shelf_y2,
-                            'height': shelf_y2 - shelf_y1,
-                            'book_count': len(shelf_books),
-                            'books': shelf_books
-                        }
-                        shelves.append(shelf_data)
+                # Добавляем отступы
+                shelf_y1 = max(0, int(y_min - padding))
+                shelf_y2 = min(height, int(y_max + padding))
+                
+                shelves.append({
+                    'shelf_number': len(shelves) + 1,
+                    'y1': shelf_y1,
+                    'y2': shelf_y2,
+                    'height': shelf_y2 - shelf_y1,
+                    'book_count': len(indices),
+                    'books': indices
+                })
             
             # Сортируем полки по вертикали
             shelves.sort(key=lambda x: x['y1'])
             
-            # Нумеруем заново после сортировки
+            # Нумеруем заново после сортировки и проставляем номер полки книгам
             for i, shelf in enumerate(shelves):
                 shelf['shelf_number'] = i + 1
+                books['shelf_number'][shelf['books']] = i + 1
+                shelf['books'] = books[shelf['books']]
             
             return shelves
             
         except Exception as e:
             print(f"Ошибка обнаружения полок: {e}")
             # Возвращаем одну полку на все изображение
+            books['shelf_number'] = 1
             return [{
                 'shelf_number': 1,
                 'y1': 0,
@@ -297,7 +1013,7 @@ class BookShelfAnalyzer:
                 'books': books
             }]
     
-    def _calculate_statistics(self, books: List[Dict], shelves: List[Dict], 
+    def _calculate_statistics(self, books: np.ndarray, shelves: List[Dict], 
                             width: int, height: int) -> Dict[str, Any]:
         """Расчет статистики заполнения"""
         try:
@@ -311,9 +1027,9 @@ class BookShelfAnalyzer:
             for shelf in shelves:
                 shelf_books = shelf['books']
                 
-                if shelf_books:
+                if len(shelf_books):
                     # Считаем суммарную ширину книг на полке
-                    total_book_width = sum([b['width'] for b in shelf_books])
+                    total_book_width = int(shelf_books['width'].sum())
                     
                     # Процент заполнения (ширина книг / ширина полки)
                     fill_percentage = min(100, (total_book_width / width) * 100)
@@ -328,7 +1044,7 @@ class BookShelfAnalyzer:
             
             # Плотность книг
             total_area = width * height
-            book_area = sum([b['area'] for b in books]) if books else 0
+            book_area = int(books['area'].sum())
             density_percentage = round((book_area / total_area) * 100, 2) if total_area > 0 else 0
             
             return {
@@ -356,62 +1072,15 @@ class BookShelfAnalyzer:
                 'error': str(e)
             }
     
-    def _create_visualization(self, original_path: str, processed_image: np.ndarray,
-                            books: List[Dict], shelves: List[Dict],
+    def _create_visualization(self, original_path: str, image: np.ndarray,
+                            books: np.ndarray, shelves: List[Dict],
                             statistics: Dict) -> str:
-        """Создание визуализации с результатами"""
+        """Создание визуализации с результатами (рисует поверх image, без копии кадра)"""
         try:
-            # Создаем визуализацию
-            vis_image = processed_image.copy()
-            height, width = vis_image.shape[:2]
-            
-            # Рисуем полки
-            colors = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (255, 255, 0), 
-                     (255, 0, 255), (0, 255, 255)]
-            
-            for i, shelf in enumerate(shelves):
-                color = colors[i % len(colors)]
-                cv2.rectangle(vis_image,
-                            (0, shelf['y1']),
-                            (width, shelf['y2']),
-                            color, 2)
-                
-                # Подпись полки
-                if i < len(statistics['fill_percentages']):
-                    fill_percent = statistics['fill_percentages'][i]
-                    label = f"Полка {i+1}: {fill_percent}% ({shelf['book_count']} книг)"
-                    cv2.putText(vis_image, label,
-                              (10, shelf['y1'] + 30),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7,
-                              color, 2)
-            
-            # Добавляем статистику на изображение
-            stats_text = [
-                f"Всего книг: {statistics['total_books']}",
-                f"Полок: {statistics['shelf_count']}",
-                f"Среднее заполнение: {statistics['average_fill']}%",
-                f"Плотность: {statistics['density_percentage']}%"
-            ]
-            
-            y_offset = 50
-            for text in stats_text:
-                cv2.putText(vis_image, text,
-                          (width - 300, y_offset),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                          (255, 255, 255), 2)
-                cv2.putText(vis_image, text,
-                          (width - 301, y_offset - 1),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                          (0, 0, 0), 2)
-                y_offset += 30
+            vis_image = draw_visualization(image, books, shelves, statistics)
             
             # Сохраняем результат
-            timestamp = time.strftime('%Y%m%d_%H%M%S')
-            filename = os.path.basename(original_path)
-            name, ext = os.path.splitext(filename)
-            output_filename = f"{name}_analyzed_{timestamp}{ext}"
-            output_path = os.path.join(self.config['processed_folder'], output_filename)
-            
+            output_path = visualization_path(self.config['processed_folder'], original_path)
             cv2.imwrite(output_path, vis_image)
             print(f"Визуализация сохранена: {output_path}")
             
@@ -0,0 +1,116 @@
+"""
+Алгоритмы разбиения найденных книг на полки.
+"""
+import numpy as np
+from typing import Dict, Type
+
+
+class ShelfSegmenter:
+    """Базовый класс: группирует книги в полки по вертикальным центрам"""
+
+    name = None
+
+    def segment(self, y1: np.ndarray, y2: np.ndarray, image_height: int) -> np.ndarray:
+        """Возвращает метки полок 0..k-1, пронумерованные сверху вниз"""
+        raise NotImplementedError
+
+
+class GapShelfSegmenter(ShelfSegmenter):
+    """Разбиение по разрывам в отсортированных центрах книг, O(n log n).
+
+    Новая полка начинается там, где расстояние между соседними центрами
+    больше gap_ratio медианной высоты книги. Соседние группы, чьи
+    вертикальные диапазоны перекрываются больше чем на merge_overlap
+    (например, высокие и низкие книги на одной полке), объединяются.
+    Количество полок не ограничено.
+    """
+
+    name = 'gap'
+
+    def __init__(self, gap_ratio: float = 0.5, merge_overlap: float = 0.5):
+        self.gap_ratio = gap_ratio
+        self.merge_overlap = merge_overlap
+
+    def segment(self, y1: np.ndarray, y2: np.ndarray, image_height: int) -> np.ndarray:
+        n = len(y1)
+        labels = np.zeros(n, dtype=np.int32)
+        if n < 2:
+            return labels
+
+        centers = (y1 + y2) / 2.0
+        order = np.argsort(centers, kind='stable')
+        sorted_centers = centers[order]
+
+        # Порог разрыва зависит от типичной высоты книги, а не от размера кадра
+        median_height = float(np.median(y2 - y1))
+        threshold = max(self.gap_ratio * median_height, 1.0)
+
+        group_starts = np.flatnonzero(np.diff(sorted_centers) > threshold) + 1
+        group_ids = np.zeros(n, dtype=np.int32)
+        group_ids[group_starts] = 1
+        group_ids = np.cumsum(group_ids)
+
+        # Диапазоны групп по вертикали
+        n_groups = int(group_ids[-1]) + 1
+        tops = np.full(n_groups, np.inf)
+        bottoms = np.full(n_groups, -np.inf)
+        np.minimum.at(tops, group_ids, y1[order])
+        np.maximum.at(bottoms, group_ids, y2[order])
+
+        # Объединяем соседние группы с сильным перекрытием
+        merged_ids = np.zeros(n_groups, dtype=np.int32)
+        current_top, current_bottom = tops[0], bottoms[0]
+        for g in range(1, n_groups):
+            overlap = min(current_bottom, bottoms[g]) - max(current_top, tops[g])
+            smaller_span = min(current_bottom - current_top, bottoms[g] - tops[g])
+            if smaller_span > 0 and overlap / smaller_span > self.merge_overlap:
+                merged_ids[g] = merged_ids[g - 1]
+                current_top = min(current_top, tops[g])
+                current_bottom = max(current_bottom, bottoms[g])
+            else:
+                merged_ids[g] = merged_ids[g - 1] + 1
+                current_top, current_bottom = tops[g], bottoms[g]
+
+        labels[order] = merged_ids[group_ids]
+        return labels
+
+
+class KMeansShelfSegmenter(ShelfSegmenter):
+    """Прежний алгоритм: K-means по центрам книг с эвристикой числа полок"""
+
+    name = 'kmeans'
+
+    def __init__(self, max_shelves: int = 6, bucket_size: int = 50,
+                 random_state: int = 42, n_init: int = 10):
+        self.max_shelves = max_shelves
+        self.bucket_size = bucket_size
+        self.random_state = random_state
+        self.n_init = n_init
+
+    def segment(self, y1: np.ndarray, y2: np.ndarray, image_height: int) -> np.ndarray:
+        from sklearn.cluster import KMeans
+
+        centers = (y1 + y2) / 2.0
+        n_shelves = min(max(2, len(np.unique(centers // self.bucket_size))), self.max_shelves)
+        if len(centers) < n_shelves:
+            return np.zeros(len(centers), dtype=np.int32)
+
+        kmeans = KMeans(n_clusters=n_shelves, random_state=self.random_state, n_init=self.n_init)
+        raw_labels = kmeans.fit_predict(centers.reshape(-1, 1))
+
+        # Нумеруем кластеры сверху вниз
+        rank = np.argsort(np.argsort(kmeans.cluster_centers_.ravel()))
+        return rank[raw_labels].astype(np.int32)
+
+
+SEGMENTERS: Dict[str, Type[ShelfSegmenter]] = {
+    GapShelfSegmenter.name: GapShelfSegmenter,
+    KMeansShelfSegmenter.name: KMeansShelfSegmenter
+}
+
+
+def get_segmenter(name: str = 'gap', **params) -> ShelfSegmenter:
+    """Создает алгоритм разбиения на полки по имени"""
+    if name not in SEGMENTERS:
+        raise ValueError(f"Неизвестный алгоритм определения полок: {name}")
+    return SEGMENTERS[name](**params)
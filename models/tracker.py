@@ -0,0 +1,226 @@
+"""
+Сопровождение книг между кадрами видеопотока.
+
+Соседние кадры одной полки почти не отличаются, поэтому книги сопоставляются
+с треками предыдущего кадра по IoU, а оставшиеся - по центрам с поправкой на
+общий сдвиг камеры. Если раскладка стабильна, границы полок берутся из
+прошлого кадра без повторной сегментации, а счетчики сглаживаются
+экспоненциальным средним, чтобы цифры не дрожали от кадра к кадру.
+"""
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Матрица IoU между боксами [x1, y1, x2, y2]"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _greedy_pairs(score: np.ndarray, threshold: float, higher_is_better: bool = True):
+    """Жадное сопоставление по матрице оценок: лучшие пары первыми, каждая строка и столбец один раз"""
+    if score.size == 0:
+        return []
+    if higher_is_better:
+        rows, cols = np.nonzero(score >= threshold)
+        order = np.argsort(-score[rows, cols], kind='stable')
+    else:
+        rows, cols = np.nonzero(score <= threshold)
+        order = np.argsort(score[rows, cols], kind='stable')
+
+    used_rows, used_cols, pairs = set(), set(), []
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+class ShelfTracker:
+    """Состояние одной камеры: треки книг, раскладка полок и сглаженные счетчики"""
+
+    def __init__(self, iou_threshold: float = 0.3, centroid_threshold: float = 0.5,
+                 max_misses: int = 5, stable_iou: float = 0.5, stable_ratio: float = 0.85,
+                 max_reuse: int = 30, smoothing: float = 0.3):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_misses = max_misses
+        self.stable_iou = stable_iou
+        self.stable_ratio = stable_ratio
+        self.max_reuse = max_reuse
+        self.smoothing = smoothing
+
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._misses = np.zeros(0, dtype=np.int32)
+        self._shelf = np.zeros(0, dtype=np.int32)
+        self._next_id = 1
+        self._frame_size = None
+
+        # Раскладка полок прошлого кадра: (номер, y1, y2)
+        self._layout = []
+        self._reused = 0
+        self.stable = False
+        self._smoothed = None
+
+        self.frames = 0
+        self.segmentations = 0
+
+    def reset(self):
+        """Сбрасывает треки и сглаживание, например при смене разрешения кадра"""
+        self.__init__(self.iou_threshold, self.centroid_threshold, self.max_misses,
+                      self.stable_iou, self.stable_ratio, self.max_reuse, self.smoothing)
+
+    def associate(self, books: np.ndarray, width: int, height: int) -> np.ndarray:
+        """Сопоставляет книги кадра с треками и возвращает идентификаторы треков"""
+        if self._frame_size != (width, height):
+            if self._frame_size is not None:
+                self.reset()
+            self._frame_size = (width, height)
+        self.frames += 1
+
+        boxes = np.stack([books['x1'], books['y1'], books['x2'], books['y2']], axis=1).astype(np.float32)
+        n_tracks, n_boxes = len(self._boxes), len(boxes)
+        track_of = np.full(n_boxes, -1, dtype=np.int64)
+
+        # Первый проход: перекрытие с прошлым положением трека
+        iou = box_iou(self._boxes, boxes) if n_tracks and n_boxes else np.zeros((n_tracks, n_boxes))
+        pairs = _greedy_pairs(iou, self.iou_threshold)
+        confident = sum(1 for r, c in pairs if iou[r, c] >= self.stable_iou)
+        for r, c in pairs:
+            track_of[c] = r
+
+        # Второй проход: центры с поправкой на медианный сдвиг камеры.
+        # Тонкие корешки теряют IoU уже при сдвиге на полширины
+        free_tracks = np.setdiff1d(np.arange(n_tracks), [r for r, _ in pairs])
+        free_boxes = np.flatnonzero(track_of < 0)
+        if len(free_tracks) and len(free_boxes):
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            track_centers = (self._boxes[:, :2] + self._boxes[:, 2:]) / 2
+            shift = np.zeros(2, dtype=np.float32)
+            if pairs:
+                rows, cols = np.array(pairs).T
+                shift = np.median(centers[cols] - track_centers[rows], axis=0)
+            predicted = track_centers[free_tracks] + shift
+            sizes = np.maximum(self._boxes[free_tracks, 2:] - self._boxes[free_tracks, :2], 1.0)
+            distance = np.abs(predicted[:, None, :] - centers[None, free_boxes, :]) / sizes[:, None, :]
+            distance = distance.max(axis=2)
+            for r, c in _greedy_pairs(distance, self.centroid_threshold, higher_is_better=False):
+                track_of[free_boxes[c]] = free_tracks[r]
+
+        matched = track_of >= 0
+        self.stable = bool(
+            n_tracks and n_boxes and self._layout
+            and confident >= self.stable_ratio * max(n_boxes, int((self._misses == 0).sum()))
+        )
+
+        # Обновляем треки: совпавшие переезжают, потерянные стареют, новые получают id
+        misses = self._misses + 1
+        misses[track_of[matched]] = 0
+        keep = misses <= self.max_misses
+        keep[track_of[matched]] = True
+
+        track_boxes = self._boxes.copy()
+        track_boxes[track_of[matched]] = boxes[matched]
+        ids = np.empty(n_boxes, dtype=np.int64)
+        ids[matched] = self._ids[track_of[matched]]
+        new = np.flatnonzero(~matched)
+        ids[new] = np.arange(self._next_id, self._next_id + len(new))
+        self._next_id += len(new)
+
+        shelf = np.zeros(n_boxes, dtype=np.int32)
+        shelf[matched] = self._shelf[track_of[matched]]
+        books['shelf_number'] = shelf
+
+        self._boxes = np.concatenate([track_boxes[keep], boxes[new]])
+        self._ids = np.concatenate([self._ids[keep], ids[new]])
+        self._misses = np.concatenate([misses[keep], np.zeros(len(new), dtype=np.int32)])
+        self._shelf = np.concatenate([self._shelf[keep], np.zeros(len(new), dtype=np.int32)])
+        return ids
+
+    def reuse_shelves(self, books: np.ndarray, height: int) -> Optional[List[Dict]]:
+        """Полки из раскладки прошлого кадра или None, если нужна новая сегментация.
+
+        Книги совпавших треков остаются на своих полках, новые относятся к
+        полке, в границы которой попадает их центр.
+        """
+        if not self.stable or self._reused >= self.max_reuse or not self._layout:
+            return None
+
+        numbers = np.array([s[0] for s in self._layout], dtype=np.int32)
+        tops = np.array([s[1] for s in self._layout], dtype=np.float32)
+        bottoms = np.array([s[2] for s in self._layout], dtype=np.float32)
+
+        shelf = books['shelf_number']
+        unknown = ~np.isin(shelf, numbers)
+        if unknown.any():
+            centers = (books['y1'][unknown] + books['y2'][unknown]) / 2
+            distance = np.maximum(tops[None, :] - centers[:, None], centers[:, None] - bottoms[None, :])
+            shelf[unknown] = numbers[np.argmin(distance, axis=1)]
+        books['shelf_number'] = shelf
+
+        self._reused += 1
+        return [{
+            'shelf_number': int(number),
+            'y1': int(y1),
+            'y2': int(y2),
+            'height': int(y2 - y1),
+            'book_count': int((shelf == number).sum()),
+            'books': books[shelf == number]
+        } for number, y1, y2 in self._layout]
+
+    def remember(self, books: np.ndarray, track_ids: np.ndarray, shelves: List[Dict], reused: bool):
+        """Запоминает полки книг и раскладку для следующего кадра"""
+        position = {int(track_id): i for i, track_id in enumerate(self._ids)}
+        rows = np.array([position[int(t)] for t in track_ids], dtype=np.int64)
+        if len(rows):
+            self._shelf[rows] = books['shelf_number']
+
+        if not reused:
+            self.segmentations += 1
+            self._reused = 0
+            layout = [(s['shelf_number'], s['y1'], s['y2']) for s in shelves]
+            if [s[0] for s in layout] != [s[0] for s in self._layout]:
+                # Сменилось число полок: прошлое сглаживание больше не соответствует полкам
+                self._smoothed = None
+            self._layout = layout
+
+    def smooth(self, statistics: Dict[str, Any]) -> Dict[str, Any]:
+        """Экспоненциальное сглаживание числа книг и заполнения по полкам"""
+        current = {
+            'total_books': float(statistics['total_books']),
+            'shelf_counts': np.asarray(statistics['book_distribution']['shelf_counts'], dtype=np.float64),
+            'fill_percentages': np.asarray(statistics['fill_percentages'], dtype=np.float64)
+        }
+        if self._smoothed is None or len(self._smoothed['shelf_counts']) != len(current['shelf_counts']):
+            self._smoothed = current
+        else:
+            alpha = self.smoothing
+            self._smoothed = {
+                key: alpha * value + (1 - alpha) * self._smoothed[key]
+                for key, value in current.items()
+            }
+
+        fill = self._smoothed['fill_percentages']
+        return {
+            'total_books': int(round(self._smoothed['total_books'])),
+            'shelf_counts': np.rint(self._smoothed['shelf_counts']).astype(int).tolist(),
+            'fill_percentages': np.round(fill, 2).tolist(),
+            'average_fill': round(float(fill.mean()), 2) if len(fill) else 0
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'tracks': int(len(self._ids)),
+            'frames': self.frames,
+            'segmentations': self.segmentations
+        }
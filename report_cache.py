@@ -0,0 +1,322 @@
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+
+# Меняется при изменении оформления отчетов, чтобы не отдавать старые файлы
+REPORT_CACHE_VERSION = 2
+
+REPORT_EXTENSIONS = {'pdf': 'pdf', 'excel': 'xlsx', 'json': 'json'}
+
+_worker_generator = None
+
+
+def _generator(tmp_dir):
+    """Генератор отчетов рабочего процесса (создается один раз на процесс)"""
+    global _worker_generator
+    if _worker_generator is None:
+        from report_generator import ReportGenerator
+        _worker_generator = ReportGenerator(output_dir=os.path.join(tmp_dir, str(os.getpid())))
+    return _worker_generator
+
+
+def _render_report(tmp_dir, report_type, analysis_data, recent_data, processed_image_path,
+                   target_path, thumb_dir=None, thumb_size=800):
+    """Рендер отчета в рабочем процессе; результат атомарно переносится в target_path"""
+    generator = _generator(tmp_dir)
+
+    if report_type == 'pdf':
+        from image_store import make_thumbnail
+
+        if thumb_dir:
+            processed_image_path = make_thumbnail(processed_image_path, thumb_dir, thumb_size)
+        path = generator.generate_pdf_report(
+            analysis_data, processed_image_path=processed_image_path
+        )
+    elif report_type == 'excel':
+        path = generator.generate_excel_report(analysis_data, recent_data)
+    else:
+        path = generator.generate_json_report(analysis_data)
+
+    if not path:
+        raise RuntimeError('Ошибка генерации отчета')
+    os.replace(path, target_path)
+    return target_path
+
+
+def _prepare_section(tmp_dir, record, thumb_dir, thumb_size, visualization=None):
+    """Раздел сводного PDF: подготовленные данные записи и миниатюра визуализации.
+
+    visualization - аргументы render_visualization для записи без готовой
+    визуализации: она рисуется по исходному снимку и сохраненным детекциям
+    во временном каталоге, миниатюра удаляется после сборки отчета.
+    """
+    from image_store import make_thumbnail
+
+    try:
+        if visualization is None:
+            thumbnail_path = make_thumbnail(record.get('processed_path'), thumb_dir, thumb_size)
+        else:
+            from models.analyzer import render_visualization
+
+            folder = os.path.join(tmp_dir, f'sections_{os.getpid()}')
+            os.makedirs(folder, exist_ok=True)
+            rendered = render_visualization(processed_folder=folder, **visualization)
+            try:
+                thumbnail_path = make_thumbnail(rendered, folder, thumb_size)
+            finally:
+                os.remove(rendered)
+    except Exception as e:
+        print(f"Не удалось уменьшить изображение записи {record.get('id')}: {e}")
+        thumbnail_path = None
+    return record.get('id'), _generator(tmp_dir)._prepare_analysis_data(record), thumbnail_path
+
+
+def _render_batch_report(tmp_dir, report_type, payload, description, target_path):
+    """Сводный отчет: payload - готовые разделы (PDF) или записи (Excel)"""
+    generator = _generator(tmp_dir)
+    if report_type == 'pdf':
+        path = generator.generate_batch_pdf_report(payload, description)
+    else:
+        path = generator.generate_batch_excel_report(payload, description)
+
+    if not path:
+        raise RuntimeError('Ошибка генерации сводного отчета')
+    os.replace(path, target_path)
+    return target_path
+
+
+class ReportCache:
+    """Кэш готовых отчетов на диске с LRU-вытеснением по размеру и фоновым рендером"""
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, workers=2, start_method='spawn',
+                 thumb_dir=None, thumb_size=800):
+        self.cache_dir = cache_dir
+        self.tmp_dir = os.path.join(cache_dir, 'tmp')
+        self.thumb_dir = thumb_dir
+        self.thumb_size = thumb_size
+        self.max_bytes = max_bytes
+        self.workers = max(1, int(workers))
+        self._ctx = multiprocessing.get_context(start_method)
+
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._bytes += size
+
+    @staticmethod
+    def _file_state(path):
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            return [stat.st_size, stat.st_mtime_ns]
+        return None
+
+    @classmethod
+    def make_version(cls, report_type, analysis_data, recent_data=None, processed_image_path=None):
+        """Версия отчета: хэш всех данных, от которых зависит его содержимое"""
+        payload = json.dumps({
+            'cache_version': REPORT_CACHE_VERSION,
+            'type': report_type,
+            'data': analysis_data,
+            'recent': recent_data if report_type == 'excel' else None,
+            'image': cls._file_state(processed_image_path) if report_type == 'pdf' else None
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    @classmethod
+    def make_batch_version(cls, report_type, records, description=None):
+        """Версия сводного отчета по набору записей"""
+        images = [cls._file_state(r.get('processed_path')) for r in records] if report_type == 'pdf' else None
+        return cls.make_version(f'batch-{report_type}', {
+            'records': records,
+            'images': images,
+            'description': description
+        })
+
+    def _filename(self, record_id, report_type, version):
+        return f'{record_id}_{report_type}_{version}.{REPORT_EXTENSIONS[report_type]}'
+
+    def _get_or_submit(self, name, start):
+        """Готовый файл, уже идущий рендер или новый рендер, запущенный start(path)"""
+        path = os.path.join(self.cache_dir, name)
+
+        with self._lock:
+            if name in self._files and os.path.exists(path):
+                self._files.move_to_end(name)
+                self.hits += 1
+                os.utime(path)
+                future = concurrent.futures.Future()
+                future.set_result(path)
+                return future
+
+            future = self._pending.get(name)
+            if future is not None:
+                return future
+
+            self.misses += 1
+            future = start(path)
+            self._pending[name] = future
+
+        future.add_done_callback(lambda f: self._rendered(name, f))
+        return future
+
+    def _submit(self, fn, *args):
+        try:
+            return self._get_pool().submit(fn, *args)
+        except BrokenProcessPool:
+            # Рабочий процесс аварийно завершился: пересоздаем пул
+            self._pool = None
+            return self._get_pool().submit(fn, *args)
+
+    def get_or_render(self, record_id, report_type, version, analysis_data,
+                      recent_data=None, processed_image_path=None):
+        """Возвращает Future с путем к готовому отчету; одинаковые запросы рендерятся один раз"""
+        return self._get_or_submit(
+            self._filename(record_id, report_type, version),
+            lambda path: self._submit(
+                _render_report, self.tmp_dir, report_type, analysis_data, recent_data,
+                processed_image_path, path, self.thumb_dir, self.thumb_size
+            )
+        )
+
+    def get_or_render_batch(self, report_type, version, records, description=None, visualizations=None):
+        """Future со сводным отчетом по записям.
+        
+        Для PDF разделы записей (данные и миниатюры) готовятся параллельно
+        в пуле, затем документ собирается одним заданием. visualizations -
+        {id записи: аргументы render_visualization} для записей без готовой
+        визуализации, она рисуется в пуле при подготовке раздела.
+        """
+        visualizations = visualizations or {}
+
+        def start(path):
+            if report_type != 'pdf':
+                return self._submit(_render_batch_report, self.tmp_dir, report_type,
+                                    records, description, path)
+
+            result = concurrent.futures.Future()
+            sections = [
+                self._submit(_prepare_section, self.tmp_dir, record, self.thumb_dir, self.thumb_size,
+                             visualizations.get(record.get('id')))
+                for record in records
+            ]
+
+            def assemble():
+                prepared = []
+                try:
+                    prepared = [section.result() for section in sections]
+                    final = self._submit(_render_batch_report, self.tmp_dir, report_type,
+                                         prepared, description, path)
+                    result.set_result(final.result())
+                except Exception as e:
+                    result.set_exception(e)
+                finally:
+                    # Миниатюры визуализаций, нарисованных для этого отчета
+                    for _, _, thumbnail_path in prepared:
+                        if thumbnail_path and thumbnail_path.startswith(self.tmp_dir + os.sep):
+                            try:
+                                os.remove(thumbnail_path)
+                            except OSError:
+                                pass
+
+            threading.Thread(target=assemble, name='batch-report', daemon=True).start()
+            return result
+
+        return self._get_or_submit(self._filename('batch', report_type, version), start)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=self._ctx
+            )
+        return self._pool
+
+    def _rendered(self, name, future):
+        with self._lock:
+            self._pending.pop(name, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            size = os.path.getsize(os.path.join(self.cache_dir, name))
+            self._files[name] = size
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не запрошенные отчеты сверх лимита размера"""
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def discard_record(self, record_id):
+        """Удаляет все отчеты по записи"""
+        self.discard_records([record_id])
+
+    def discard_records(self, record_ids):
+        """Удаляет все отчеты по записям за один проход по кэшу"""
+        ids = {str(record_id) for record_id in record_ids}
+        with self._lock:
+            for name in [n for n in self._files if n.split('_', 1)[0] in ids]:
+                self._bytes -= self._files.pop(name)
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Полностью очищает кэш отчетов"""
+        with self._lock:
+            for name in self._files:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+            self._files.clear()
+            self._bytes = 0
+            if self.thumb_dir:
+                shutil.rmtree(self.thumb_dir, ignore_errors=True)
+
+    def stats(self):
+        """Счетчики попаданий и занятое место"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'rendering': len(self._pending),
+                'files': len(self._files),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def shutdown(self):
+        """Останавливает пул рендеринга"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
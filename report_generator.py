@@ -2,13 +2,15 @@ import os
 from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+from reportlab.lib.utils import ImageReader
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 import pandas as pd
 import json
 import numpy as np
 
+
 class ReportGenerator:
     def __init__(self, output_dir='reports'):
         self.output_dir = output_dir
@@ -57,7 +59,11 @@ class ReportGenerator:
             
             # Получаем распределение книг по полкам
             shelf_counts = []
-            if 'shelf_counts' in db_record.get('statistics', {}):
+            shelves = db_record.get('shelves') or []
+            if shelves and all(shelf.get('book_count') is not None for shelf in shelves):
+                # Реальное распределение из таблицы shelf_results
+                shelf_counts = [shelf['book_count'] for shelf in shelves]
+            elif 'shelf_counts' in db_record.get('statistics', {}):
                 shelf_counts = db_record['statistics'].get('shelf_counts', [])
             else:
                 # Если нет конкретного распределения, создаем равномерное
@@ -183,6 +189,155 @@ class ReportGenerator:
             print(f"Неизвестный формат данных: {list(input_data.keys())}")
             return self._prepare_analysis_data_from_db_record(input_data)
     
+    def _pdf_record_elements(self, analysis_data: dict, processed_image_path: str = None,
+                             figure_caption: str = "Figure 1: Analysis results with detected shelves and books") -> list:
+        """Разделы PDF по одной записи: сведения, статистика, полки, визуализация, вывод"""
+        elements = []
+        
+        # Информация об анализе
+        elements.append(Paragraph("Analysis Information", self.styles['CustomHeading2']))
+        
+        analysis_info = [
+            ["Analysis Date:", analysis_data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))],
+            ["File Name:", analysis_data.get('filename', 'N/A')],
+            ["Processing Time:", f"{analysis_data.get('processing_time', 0):.2f} sec"],
+            ["Image Size:", f"{analysis_data.get('image_width', 0)}x{analysis_data.get('image_height', 0)}"]
+        ]
+        
+        info_table = Table(analysis_info, colWidths=[2*inch, 3*inch])
+        info_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(info_table)
+        elements.append(Spacer(1, 20))
+        
+        # Статистика полок
+        elements.append(Paragraph("Shelf Statistics", self.styles['CustomHeading2']))
+        
+        stats = analysis_data.get('statistics', {})
+        statistics_data = [
+            ["Total Books:", str(stats.get('total_books', 0))],
+            ["Number of Shelves:", str(stats.get('shelf_count', 0))],
+            ["Average Fill Percentage:", f"{stats.get('average_fill', 0):.2f}%"],
+            ["Density Percentage:", f"{stats.get('density_percentage', 0):.2f}%"]
+        ]
+        
+        stats_table = Table(statistics_data, colWidths=[3*inch, 2*inch])
+        stats_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(stats_table)
+        elements.append(Spacer(1, 20))
+        
+        # Подробный анализ по полкам
+        fill_percentages = stats.get('fill_percentages', [])
+        shelf_counts = stats.get('book_distribution', {}).get('shelf_counts', [])
+        
+        if fill_percentages and shelf_counts:
+            elements.append(Paragraph("Shelf-by-Shelf Analysis", self.styles['CustomHeading2']))
+            
+            shelf_data = [["Shelf Number", "Books Count", "Fill Percentage"]]
+            
+            for i, (count, fill) in enumerate(zip(shelf_counts, fill_percentages)):
+                shelf_data.append([
+                    f"Shelf {i+1}",
+                    str(count),
+                    f"{fill:.2f}%"
+                ])
+            
+            shelf_table = Table(shelf_data, colWidths=[2*inch, 2*inch, 2*inch])
+            shelf_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            elements.append(shelf_table)
+            elements.append(Spacer(1, 20))
+        elif fill_percentages:
+            # Если есть только fill_percentages без counts
+            elements.append(Paragraph("Shelf-by-Shelf Analysis", self.styles['CustomHeading2']))
+            
+            shelf_data = [["Shelf Number", "Fill Percentage"]]
+            
+            for i, fill in enumerate(fill_percentages):
+                shelf_data.append([
+                    f"Shelf {i+1}",
+                    f"{fill:.2f}%"
+                ])
+            
+            shelf_table = Table(shelf_data, colWidths=[3*inch, 3*inch])
+            shelf_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            elements.append(shelf_table)
+            elements.append(Spacer(1, 20))
+        
+        # Визуализация
+        if processed_image_path and os.path.exists(processed_image_path):
+            elements.append(Paragraph("Analysis Visualization", self.styles['CustomHeading2']))
+            
+            try:
+                # Сохраняем пропорции изображения, вписывая его в 5x6 дюймов
+                image_width, image_height = ImageReader(processed_image_path).getSize()
+                scale = min(5*inch / image_width, 6*inch / image_height)
+                img = Image(processed_image_path, width=image_width*scale, height=image_height*scale)
+                img.hAlign = 'CENTER'
+                elements.append(img)
+                elements.append(Spacer(1, 10))
+                elements.append(Paragraph(figure_caption, self.styles['CustomNormal']))
+            except Exception as img_error:
+                print(f"Ошибка загрузки изображения для отчета: {img_error}")
+                elements.append(Paragraph("Визуализация недоступна", self.styles['CustomNormal']))
+        
+        # Заключение
+        elements.append(Spacer(1, 20))
+        elements.append(Paragraph("Conclusion", self.styles['CustomHeading2']))
+        
+        total_books = stats.get('total_books', 0)
+        shelf_count = stats.get('shelf_count', 0)
+        avg_fill = stats.get('average_fill', 0)
+        
+        conclusion_text = f"Analysis detected {total_books} books distributed across {shelf_count} shelves. "
+        conclusion_text += f"The average shelf fill percentage is {avg_fill:.2f}%."
+        
+        if fill_percentages:
+            max_fill = max(fill_percentages) if fill_percentages else 0
+            min_fill = min(fill_percentages) if fill_percentages else 0
+            max_shelf_idx = fill_percentages.index(max_fill) + 1 if max_fill in fill_percentages else 0
+            min_shelf_idx = fill_percentages.index(min_fill) + 1 if min_fill in fill_percentages else 0
+            
+            if max_shelf_idx > 0 and min_shelf_idx > 0:
+                conclusion_text += f" Shelf {max_shelf_idx} is the most filled ({max_fill:.2f}%), "
+                conclusion_text += f"while shelf {min_shelf_idx} is the least filled ({min_fill:.2f}%)."
+        
+        elements.append(Paragraph(conclusion_text, self.styles['CustomNormal']))
+        
+        return elements
+    
     def generate_pdf_report(self, input_data: dict,
                           original_image_path: str = None,
                           processed_image_path: str = None) -> str:
@@ -201,145 +356,7 @@ class ReportGenerator:
             elements.append(Paragraph("Bookshelf Analysis Report", self.styles['CustomTitle']))
             elements.append(Spacer(1, 20))
             
-            # Информация об анализе
-            elements.append(Paragraph("Analysis Information", self.styles['CustomHeading2']))
-            
-            analysis_info = [
-                ["Analysis Date:", analysis_data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))],
-                ["File Name:", analysis_data.get('filename', 'N/A')],
-                ["Processing Time:", f"{analysis_data.get('processing_time', 0):.2f} sec"],
-                ["Image Size:", f"{analysis_data.get('image_width', 0)}x{analysis_data.get('image_height', 0)}"]
-            ]
-            
-            info_table = Table(analysis_info, colWidths=[2*inch, 3*inch])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(info_table)
-            elements.append(Spacer(1, 20))
-            
-            # Статистика полок
-            elements.append(Paragraph("Shelf Statistics", self.styles['CustomHeading2']))
-            
-            stats = analysis_data.get('statistics', {})
-            statistics_data = [
-                ["Total Books:", str(stats.get('total_books', 0))],
-                ["Number of Shelves:", str(stats.get('shelf_count', 0))],
-                ["Average Fill Percentage:", f"{stats.get('average_fill', 0):.2f}%"],
-                ["Density Percentage:", f"{stats.get('density_percentage', 0):.2f}%"]
-            ]
-            
-            stats_table = Table(statistics_data, colWidths=[3*inch, 2*inch])
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(stats_table)
-            elements.append(Spacer(1, 20))
-            
-            # Подробный анализ по полкам
-            fill_percentages = stats.get('fill_percentages', [])
-            shelf_counts = stats.get('book_distribution', {}).get('shelf_counts', [])
-            
-            if fill_percentages and shelf_counts:
-                elements.append(Paragraph("Shelf-by-Shelf Analysis", self.styles['CustomHeading2']))
-                
-                shelf_data = [["Shelf Number", "Books Count", "Fill Percentage"]]
-                
-                for i, (count, fill) in enumerate(zip(shelf_counts, fill_percentages)):
-                    shelf_data.append([
-                        f"Shelf {i+1}",
-                        str(count),
-                        f"{fill:.2f}%"
-                    ])
-                
-                shelf_table = Table(shelf_data, colWidths=[2*inch, 2*inch, 2*inch])
-                shelf_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                elements.append(shelf_table)
-                elements.append(Spacer(1, 20))
-            elif fill_percentages:
-                # Если есть только fill_percentages без counts
-                elements.append(Paragraph("Shelf-by-Shelf Analysis", self.styles['CustomHeading2']))
-                
-                shelf_data = [["Shelf Number", "Fill Percentage"]]
-                
-                for i, fill in enumerate(fill_percentages):
-                    shelf_data.append([
-                        f"Shelf {i+1}",
-                        f"{fill:.2f}%"
-                    ])
-                
-                shelf_table = Table(shelf_data, colWidths=[3*inch, 3*inch])
-                shelf_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                elements.append(shelf_table)
-                elements.append(Spacer(1, 20))
-            
-            # Визуализация
-            if processed_image_path and os.path.exists(processed_image_path):
-                elements.append(Paragraph("Analysis Visualization", self.styles['CustomHeading2']))
-                
-                try:
-                    img = Image(processed_image_path, width=5*inch, height=3.75*inch)
-                    img.hAlign = 'CENTER'
-                    elements.append(img)
-                    elements.append(Spacer(1, 10))
-                    elements.append(Paragraph("Figure 1: Analysis results with detected shelves and books", 
-                                            self.styles['CustomNormal']))
-                except Exception as img_error:
-                    print(f"Ошибка загрузки изображения для отчета: {img_error}")
-                    elements.append(Paragraph("Визуализация недоступна", self.styles['CustomNormal']))
-            
-            # Заключение
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph("Conclusion", self.styles['CustomHeading2']))
-            
-            total_books = stats.get('total_books', 0)
-            shelf_count = stats.get('shelf_count', 0)
-            avg_fill = stats.get('average_fill', 0)
-            
-            conclusion_text = f"Analysis detected {total_books} books distributed across {shelf_count} shelves. "
-            conclusion_text += f"The average shelf fill percentage is {avg_fill:.2f}%."
-            
-            if fill_percentages:
-                max_fill = max(fill_percentages) if fill_percentages else 0
-                min_fill = min(fill_percentages) if fill_percentages else 0
-                max_shelf_idx = fill_percentages.index(max_fill) + 1 if max_fill in fill_percentages else 0
-                min_shelf_idx = fill_percentages.index(min_fill) + 1 if min_fill in fill_percentages else 0
-                
-                if max_shelf_idx > 0 and min_shelf_idx > 0:
-                    conclusion_text += f" Shelf {max_shelf_idx} is the most filled ({max_fill:.2f}%), "
-                    conclusion_text += f"while shelf {min_shelf_idx} is the least filled ({min_fill:.2f}%)."
-            
-            elements.append(Paragraph(conclusion_text, self.styles['CustomNormal']))
+            elements.extend(self._pdf_record_elements(analysis_data, processed_image_path))
             
           
             elements.append(Spacer(1, 30))
@@ -472,6 +489,164 @@ class ReportGenerator:
             traceback.print_exc()
             return None
     
+    def _batch_summary(self, analyses: list) -> list:
+        """Сводка по набору записей: строки таблицы (параметр, значение)"""
+        stats = [a.get('statistics', {}) for a in analyses]
+        fills = [st.get('average_fill') or 0 for st in stats]
+        dates = sorted(str(a.get('timestamp')) for a in analyses if a.get('timestamp'))
+        return [
+            ["Analyses:", str(len(analyses))],
+            ["Period:", f"{dates[0][:10]} - {dates[-1][:10]}" if dates else "N/A"],
+            ["Total Books:", str(sum(st.get('total_books') or 0 for st in stats))],
+            ["Total Shelves:", str(sum(st.get('shelf_count') or 0 for st in stats))],
+            ["Average Fill Percentage:", f"{np.mean(fills):.2f}%" if fills else "N/A"],
+            ["Fill Range:", f"{min(fills):.2f}% - {max(fills):.2f}%" if fills else "N/A"],
+            ["Total Processing Time:", f"{sum(a.get('processing_time') or 0 for a in analyses):.2f} sec"]
+        ]
+    
+    def generate_batch_pdf_report(self, sections: list, description: str = None) -> str:
+        """Сводный PDF по нескольким записям.
+        
+        sections - список (record_id, analysis_data, thumbnail_path), где
+        analysis_data уже подготовлен _prepare_analysis_data.
+        """
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f"bookshelf_batch_{timestamp}.pdf"
+            filepath = os.path.join(self.output_dir, filename)
+            
+            doc = SimpleDocTemplate(filepath, pagesize=A4)
+            elements = []
+            
+            elements.append(Paragraph("Library Audit Report", self.styles['CustomTitle']))
+            if description:
+                elements.append(Paragraph(f"Filter: {description}", self.styles['CustomNormal']))
+            elements.append(Spacer(1, 20))
+            
+            # Сводка
+            elements.append(Paragraph("Summary", self.styles['CustomHeading2']))
+            summary_table = Table(self._batch_summary([data for _, data, _ in sections]),
+                                  colWidths=[3*inch, 3*inch])
+            summary_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            elements.append(summary_table)
+            elements.append(Spacer(1, 20))
+            
+            # Перечень записей
+            elements.append(Paragraph("Analyses", self.styles['CustomHeading2']))
+            overview = [["ID", "Date", "File", "Books", "Shelves", "Avg Fill"]]
+            for record_id, data, _ in sections:
+                stats = data.get('statistics', {})
+                overview.append([
+                    str(record_id),
+                    str(data.get('timestamp', ''))[:16].replace('T', ' '),
+                    Paragraph(str(data.get('filename', 'N/A')), self.styles['CustomNormal']),
+                    str(stats.get('total_books', 0)),
+                    str(stats.get('shelf_count', 0)),
+                    f"{stats.get('average_fill') or 0:.2f}%"
+                ])
+            overview_table = Table(overview, repeatRows=1,
+                                   colWidths=[0.6*inch, 1.4*inch, 2.2*inch, 0.8*inch, 0.8*inch, 0.9*inch])
+            overview_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+            ]))
+            elements.append(overview_table)
+            
+            # Разделы по записям
+            for number, (record_id, data, thumbnail_path) in enumerate(sections, 1):
+                elements.append(PageBreak())
+                elements.append(Paragraph(
+                    f"Analysis #{record_id}: {data.get('filename', 'N/A')}", self.styles['Heading1']
+                ))
+                elements.extend(self._pdf_record_elements(
+                    data, thumbnail_path,
+                    figure_caption=f"Figure {number}: Analysis #{record_id} with detected shelves and books"
+                ))
+            
+            elements.append(Spacer(1, 30))
+            footer_text = f"Report generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+            elements.append(Paragraph(footer_text,
+                                    ParagraphStyle(
+                                        name='Footer',
+                                        fontSize=8,
+                                        alignment=2,
+                                        textColor=colors.gray
+                                    )))
+            
+            doc.build(elements)
+            
+            print(f"Batch PDF report created: {filepath}")
+            return filepath
+            
+        except Exception as e:
+            print(f"Error creating batch PDF report: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def generate_batch_excel_report(self, records: list, description: str = None) -> str:
+        """Сводный Excel по нескольким записям: записи, полки и сводка"""
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f"bookshelf_batch_{timestamp}.xlsx"
+            filepath = os.path.join(self.output_dir, filename)
+            
+            analyses = [self._prepare_analysis_data(record) for record in records]
+            
+            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+                pd.DataFrame([{
+                    'ID': record.get('id'),
+                    'Date': data.get('timestamp'),
+                    'File': data.get('filename'),
+                    'Books': data.get('statistics', {}).get('total_books', 0),
+                    'Shelves': data.get('statistics', {}).get('shelf_count', 0),
+                    'Avg Fill': data.get('statistics', {}).get('average_fill', 0),
+                    'Processing Time': data.get('processing_time', 0),
+                    'Image Width': data.get('image_width', 0),
+                    'Image Height': data.get('image_height', 0)
+                } for record, data in zip(records, analyses)]).to_excel(writer, sheet_name='Analyses', index=False)
+                
+                shelf_rows = []
+                for record, data in zip(records, analyses):
+                    distribution = data.get('statistics', {}).get('book_distribution', {})
+                    counts = distribution.get('shelf_counts', [])
+                    for i, fill in enumerate(distribution.get('fill_percentages', [])):
+                        shelf_rows.append({
+                            'Analysis ID': record.get('id'),
+                            'Shelf Number': i + 1,
+                            'Book Count': counts[i] if i < len(counts) else None,
+                            'Fill Percentage': fill,
+                            'Fill Status': 'High' if fill > 80 else 'Medium' if fill > 50 else 'Low'
+                        })
+                pd.DataFrame(shelf_rows, columns=[
+                    'Analysis ID', 'Shelf Number', 'Book Count', 'Fill Percentage', 'Fill Status'
+                ]).to_excel(writer, sheet_name='Shelves', index=False)
+                
+                summary = self._batch_summary(analyses)
+                if description:
+                    summary.insert(0, ["Filter:", description])
+                pd.DataFrame(summary, columns=['Parameter', 'Value'])\
+                    .to_excel(writer, sheet_name='Summary', index=False)
+            
+            print(f"Batch Excel report created: {filepath}")
+            return filepath
+            
+        except Exception as e:
+            print(f"Error creating batch Excel report: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
     def generate_json_report(self, input_data: dict) -> str:
         try:
             # Подготавливаем данные
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Меняется при изменении формата результатов или алгоритмов анализа
+CACHE_VERSION = 3
+
+# Параметры анализатора, не влияющие на результат
+_IGNORED_CONFIG_KEYS = {'processed_folder', 'batch_size', 'render'}
+
+
+def _json_default(value):
+    """Сериализует скаляры numpy"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'Объект типа {type(value).__name__} не сериализуется в JSON')
+
+
+class AnalysisCache:
+    """Кэш результатов анализа: LRU в памяти и постоянный уровень в SQLite"""
+
+    def __init__(self, db_path, memory_items=256, max_items=10000,
+                 max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_digests = {}
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_cache_last_access ON cache_entries (last_access)'
+        )
+        self._conn.commit()
+
+        row = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+        self._disk_items, self._disk_bytes = row
+
+    def model_digest(self, model_path):
+        """Хэш файла модели (пересчитывается только при изменении файла)"""
+        if not model_path or not os.path.exists(model_path):
+            return 'no-model'
+
+        stat = os.stat(model_path)
+        cache_key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime)
+        digest = self._model_digests.get(cache_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(model_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            self._model_digests[cache_key] = digest
+        return digest
+
+    def make_key(self, image_bytes, model_path, analyzer_config):
+        """Ключ кэша: хэш изображения, хэш модели и параметры анализатора"""
+        config = {k: v for k, v in analyzer_config.items() if k not in _IGNORED_CONFIG_KEYS}
+        sha = hashlib.sha256()
+        sha.update(hashlib.sha256(image_bytes).digest())
+        sha.update(self.model_digest(model_path).encode())
+        sha.update(json.dumps(config, sort_keys=True, default=str).encode())
+        sha.update(str(CACHE_VERSION).encode())
+        return sha.hexdigest()
+
+    def get(self, key):
+        """Возвращает сохраненные результаты анализа или None"""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return json.loads(payload)
+
+            row = self._conn.execute(
+                'SELECT value FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                'UPDATE cache_entries SET last_access = ? WHERE key = ?', (time.time(), key)
+            )
+            self._conn.commit()
+            payload = zlib.decompress(row[0])
+            self._remember(key, payload)
+            self.hits_disk += 1
+            return json.loads(payload)
+
+    def put(self, key, results):
+        """Сохраняет результаты анализа в оба уровня кэша"""
+        payload = json.dumps(results, default=_json_default).encode('utf-8')
+        compressed = zlib.compress(payload)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, payload)
+
+            old = self._conn.execute(
+                'SELECT size FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, compressed, len(compressed), now, now)
+            )
+            if old:
+                self._disk_bytes -= old[0]
+            else:
+                self._disk_items += 1
+            self._disk_bytes += len(compressed)
+
+            self._evict_disk()
+            self._conn.commit()
+
+    def invalidate(self, key):
+        """Удаляет запись из кэша"""
+        with self._lock:
+            self._memory.pop(key, None)
+            row = self._conn.execute(
+                'SELECT size FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row:
+                self._conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                self._conn.commit()
+                self._disk_items -= 1
+                self._disk_bytes -= row[0]
+
+    def clear(self):
+        """Полностью очищает кэш"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute('DELETE FROM cache_entries')
+            self._conn.commit()
+            self._disk_items, self._disk_bytes = 0, 0
+
+    def stats(self):
+        """Счетчики попаданий, промахов и вытеснений"""
+        with self._lock:
+            hits = self.hits_memory + self.hits_disk
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'hits_memory': self.hits_memory,
+                'hits_disk': self.hits_disk,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'memory_items': len(self._memory),
+                'memory_max_items': self.memory_items,
+                'disk_items': self._disk_items,
+                'disk_bytes': self._disk_bytes,
+                'disk_max_items': self.max_items,
+                'disk_max_bytes': self.max_bytes
+            }
+
+    def _remember(self, key, payload):
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Вытесняет давно не использованные записи сверх лимитов"""
+        while self._disk_items > self.max_items or self._disk_bytes > self.max_bytes:
+            excess = max(self._disk_items - self.max_items, 1)
+            rows = self._conn.execute(
+                'SELECT key, size FROM cache_entries ORDER BY last_access ASC LIMIT ?',
+                (min(excess, 500),)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany(
+                'DELETE FROM cache_entries WHERE key = ?', [(key,) for key, _ in rows]
+            )
+            for key, size in rows:
+                self._memory.pop(key, None)
+                self._disk_items -= 1
+                self._disk_bytes -= size
+                self.evictions += 1
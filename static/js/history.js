@@ -5,6 +5,16 @@ let totalPages = 1;
 let fillTimeChart = null;
 let distributionChart = null;
 
+// Размеры уменьшенных копий (готовятся сервером сразу после анализа)
+const THUMBNAIL_WIDTH = 160;
+const PREVIEW_WIDTH = 640;
+
+// URL уменьшенной копии снимка или визуализации записи; с версией записи
+// ответ кэшируется браузером надолго (id записей могут переиспользоваться)
+function recordImageUrl(record, kind, width) {
+    return `/api/image/${record.id}?kind=${kind}&w=${width}&v=${record.image_version}`;
+}
+
 // Загрузка истории при ПОЛНОЙ загрузке страницы
 window.addEventListener('load', function() {
     console.log('History page fully loaded');
@@ -131,7 +141,9 @@ function displayHistory(records) {
             <td>${record.id}</td>
             <td>${formatDateTime(record.timestamp)}</td>
             <td>
-                <i class="fas fa-file-image"></i>
+                <img src="${recordImageUrl(record, 'original', THUMBNAIL_WIDTH)}"
+                     loading="lazy" class="rounded me-2" alt=""
+                     style="height: 40px; width: 60px; object-fit: cover;">
                 ${record.filename}
             </td>
             <td>
@@ -472,11 +484,15 @@ function displayRecordDetails(record) {
                     <div class="row">
                         <div class="col-md-6">
                             <h6>Оригинальное изображение:</h6>
-                            <img src="${record.original_image_url}" class="img-fluid rounded" alt="Оригинал">
+                            <a href="${record.original_image_url}" target="_blank">
+                                <img src="${recordImageUrl(record, 'original', PREVIEW_WIDTH)}" class="img-fluid rounded" alt="Оригинал">
+                            </a>
                         </div>
                         <div class="col-md-6">
                             <h6>Результат анализа:</h6>
-                            <img src="${record.processed_image_url}" class="img-fluid rounded" alt="Результат">
+                            <a href="${record.processed_image_url}" target="_blank">
+                                <img src="${recordImageUrl(record, 'processed', PREVIEW_WIDTH)}" class="img-fluid rounded" alt="Результат">
+                            </a>
                         </div>
                     </div>
                     
@@ -564,11 +580,43 @@ function exportRecord(recordId) {
     if (recordId) {
         const type = prompt('Введите тип отчета (pdf, excel, json):', 'pdf');
         if (type && ['pdf', 'excel', 'json'].includes(type.toLowerCase())) {
-            window.open(`/api/generate_report?type=${type}&record_id=${recordId}`, '_blank');
+            downloadReport(type.toLowerCase(), recordId);
         }
     }
 }
 
+// Скачивание отчета; пока он рендерится в фоне, сервер отвечает 202
+async function downloadReport(type, recordId) {
+    try {
+        const url = `/api/generate_report?type=${type}&record_id=${recordId}`;
+        let response = await fetch(url);
+        
+        while (response.status === 202) {
+            const retryAfter = parseInt(response.headers.get('Retry-After') || '2', 10);
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            response = await fetch(url);
+        }
+        
+        const isError = type !== 'json' && (response.headers.get('Content-Type') || '').includes('application/json');
+        if (!response.ok || isError) {
+            const error = await response.json();
+            throw new Error(error.error || 'Ошибка генерации отчета');
+        }
+        
+        const blob = await response.blob();
+        const link = document.createElement('a');
+        link.href = window.URL.createObjectURL(blob);
+        link.download = `bookshelf_report_${recordId}.${type === 'excel' ? 'xlsx' : type}`;
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        window.URL.revokeObjectURL(link.href);
+    } catch (error) {
+        alert('Ошибка: ' + error.message);
+        console.error(error);
+    }
+}
+
 // Удаление записи
 async function deleteRecord(recordId) {
     if (recordId && confirm('Вы уверены, что хотите удалить эту запись?')) {
@@ -1,6 +1,10 @@
 // Глобальные переменные
 let currentRecordId = null;
 let cameraStream = null;
+let liveSession = null;
+
+// Интервал отправки кадров живого анализа, мс
+const LIVE_FRAME_INTERVAL = 200;
 let fillChart = null;
 
 // Загрузка статистики при старте
@@ -99,6 +103,7 @@ async function startCamera() {
         
         document.getElementById('startCameraBtn').style.display = 'none';
         document.getElementById('captureBtn').style.display = 'inline-block';
+        document.getElementById('liveBtn').style.display = 'inline-block';
         document.getElementById('stopCameraBtn').style.display = 'inline-block';
         document.getElementById('analyzeBtn').disabled = false;
         
@@ -129,6 +134,8 @@ function captureImage() {
 
 // Остановка камеры
 function stopCamera() {
+    stopLiveAnalysis();
+    
     if (cameraStream) {
         cameraStream.getTracks().forEach(track => track.stop());
         cameraStream = null;
@@ -137,9 +144,129 @@ function stopCamera() {
     document.getElementById('cameraPreview').style.display = 'none';
     document.getElementById('startCameraBtn').style.display = 'inline-block';
     document.getElementById('captureBtn').style.display = 'none';
+    document.getElementById('liveBtn').style.display = 'none';
     document.getElementById('stopCameraBtn').style.display = 'none';
 }
 
+// Живой анализ: кадры уходят на сервер, результаты приходят через SSE
+async function toggleLiveAnalysis() {
+    if (liveSession) {
+        stopLiveAnalysis();
+        return;
+    }
+    
+    try {
+        const response = await fetch('/api/camera/sessions', { method: 'POST' });
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        
+        liveSession = {
+            id: data.session_id,
+            framesUrl: data.frames_url,
+            events: new EventSource(data.events_url),
+            canvas: document.createElement('canvas'),
+            sending: false,
+            timer: null
+        };
+        liveSession.events.addEventListener('detections', event => {
+            drawLiveDetections(JSON.parse(event.data));
+        });
+        liveSession.events.addEventListener('closed', () => stopLiveAnalysis());
+        liveSession.timer = setInterval(sendLiveFrame, LIVE_FRAME_INTERVAL);
+        
+        document.getElementById('liveBtn').innerHTML = '<i class="fas fa-pause"></i> Остановить анализ';
+        document.getElementById('liveStats').style.display = 'block';
+        
+    } catch (error) {
+        alert('Ошибка запуска живого анализа: ' + error.message);
+    }
+}
+
+// Отправка кадра; следующий уходит только после ответа на предыдущий
+function sendLiveFrame() {
+    const video = document.getElementById('cameraPreview');
+    if (!liveSession || liveSession.sending || !video.videoWidth) {
+        return;
+    }
+    
+    const session = liveSession;
+    session.canvas.width = video.videoWidth;
+    session.canvas.height = video.videoHeight;
+    session.canvas.getContext('2d').drawImage(video, 0, 0);
+    session.sending = true;
+    
+    session.canvas.toBlob(async blob => {
+        try {
+            await fetch(session.framesUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'image/jpeg' },
+                body: blob
+            });
+        } catch (error) {
+            console.error('Ошибка отправки кадра:', error);
+        } finally {
+            session.sending = false;
+        }
+    }, 'image/jpeg', 0.7);
+}
+
+// Рисование результатов поверх видео (object-fit: contain)
+function drawLiveDetections(result) {
+    const video = document.getElementById('cameraPreview');
+    const overlay = document.getElementById('cameraOverlay');
+    overlay.width = video.clientWidth;
+    overlay.height = video.clientHeight;
+    overlay.style.left = video.offsetLeft + 'px';
+    overlay.style.top = video.offsetTop + 'px';
+    
+    const context = overlay.getContext('2d');
+    context.clearRect(0, 0, overlay.width, overlay.height);
+    if (result.error) {
+        document.getElementById('liveStats').textContent = 'Ошибка анализа: ' + result.error;
+        return;
+    }
+    
+    const scale = Math.min(overlay.width / result.width, overlay.height / result.height);
+    const offsetX = (overlay.width - result.width * scale) / 2;
+    const offsetY = (overlay.height - result.height * scale) / 2;
+    
+    context.strokeStyle = '#28a745';
+    context.lineWidth = 2;
+    result.books.forEach(([x1, y1, x2, y2]) => {
+        context.strokeRect(offsetX + x1 * scale, offsetY + y1 * scale, (x2 - x1) * scale, (y2 - y1) * scale);
+    });
+    
+    context.strokeStyle = '#17a2b8';
+    result.shelves.forEach(([y1, y2]) => {
+        context.strokeRect(offsetX, offsetY + y1 * scale, result.width * scale, (y2 - y1) * scale);
+    });
+    
+    // Со сглаживанием цифры не прыгают от кадра к кадру
+    const stats = result.smoothed || result;
+    document.getElementById('liveStats').textContent =
+        `Книг: ${stats.total_books}, полок: ${result.shelf_count}, ` +
+        `заполнение: ${stats.average_fill}%, задержка: ${result.latency_ms} мс, ` +
+        `пропущено кадров: ${result.dropped}`;
+}
+
+function stopLiveAnalysis() {
+    if (!liveSession) {
+        return;
+    }
+    
+    clearInterval(liveSession.timer);
+    liveSession.events.close();
+    fetch(`/api/camera/sessions/${liveSession.id}`, { method: 'DELETE' }).catch(() => {});
+    liveSession = null;
+    
+    const overlay = document.getElementById('cameraOverlay');
+    overlay.getContext('2d').clearRect(0, 0, overlay.width, overlay.height);
+    document.getElementById('liveBtn').innerHTML = '<i class="fas fa-video"></i> Живой анализ';
+    document.getElementById('liveStats').style.display = 'none';
+}
+
 // Анализ изображения
 async function analyzeImage() {
     const fileInput = document.getElementById('imageInput');
@@ -193,9 +320,14 @@ async function analyzeImage() {
         
         console.log('Ответ получен, статус:', response.status);
         
-        const data = await response.json();
+        let data = await response.json();
         console.log('Данные ответа:', data);
         
+        // В режиме очереди сервер возвращает идентификатор задания
+        if (data.success && data.job_id) {
+            data = await waitForJob(data.job_id, controller);
+        }
+        
         if (data.success) {
             currentRecordId = data.record_id;
             displayResults(data);
@@ -220,13 +352,51 @@ async function analyzeImage() {
     }
 }
 
+// Ожидание завершения фонового анализа
+async function waitForJob(jobId, controller) {
+    const timeoutId = setTimeout(() => controller.abort(), 120000);
+    
+    try {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            
+            const response = await fetch(`/api/jobs/${jobId}`, { signal: controller.signal });
+            const data = await response.json();
+            
+            if (!data.success) {
+                return data;
+            }
+            
+            const job = data.job;
+            if (job.status === 'done') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                return { success: false, error: job.error };
+            }
+            
+            if (job.status === 'queued') {
+                console.log(`Задание ${jobId} в очереди, позиция: ${job.queue_position}`);
+            }
+        }
+    } finally {
+        clearTimeout(timeoutId);
+    }
+}
+
 // Отображение результатов
 function displayResults(data) {
     
+    // При render=none сервер не возвращает изображение с разметкой
     const processedImg = document.getElementById('processedImage');
-    processedImg.src = data.processed_image;
-    processedImg.style.display = 'block';
-    document.getElementById('noProcessed').style.display = 'none';
+    if (data.processed_image) {
+        processedImg.src = data.processed_image;
+        processedImg.style.display = 'block';
+        document.getElementById('noProcessed').style.display = 'none';
+    } else {
+        processedImg.style.display = 'none';
+        document.getElementById('noProcessed').style.display = 'block';
+    }
     
     
     const results = data.results;
@@ -425,14 +595,22 @@ async function generateReport(type) {
     }
     
     try {
-        const response = await fetch(`/api/generate_report?type=${type}&record_id=${currentRecordId}`);
+        const url = `/api/generate_report?type=${type}&record_id=${currentRecordId}`;
+        let response = await fetch(url);
+        
+        // 202: отчет еще рендерится в фоне, повторяем запрос
+        while (response.status === 202) {
+            const retryAfter = parseInt(response.headers.get('Retry-After') || '2', 10);
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            response = await fetch(url);
+        }
         
         if (response.ok) {
             const blob = await response.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = `bookshelf_report_${currentRecordId}.${type}`;
+            a.download = `bookshelf_report_${currentRecordId}.${type === 'excel' ? 'xlsx' : type}`;
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);